@@ -1,16 +1,19 @@
 import os
 import sys
+import hmac
+import time
+import hashlib
 import secrets
+from contextlib import nullcontext
 from decimal import Decimal
 from dotenv import load_dotenv
 
 from fastapi import FastAPI, Request, Depends, HTTPException, status, Form
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, Response
 from fastapi.templating import Jinja2Templates
-from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from fastapi.concurrency import run_in_threadpool
 from passlib.context import CryptContext
 from sqlalchemy.orm import joinedload
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy import select, func
 from aiogram import Bot
 from aiogram.client.default import DefaultBotProperties
@@ -19,32 +22,111 @@ from fastapi.staticfiles import StaticFiles
 load_dotenv()
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from db_models import User, Order, FinancialTransaction, ChatMessage, Setting, Category
+from db import engine, async_session
+from db_models import User, Order, ChatMessage, Setting, Category, Broadcast
+from ledger import credit_balance, debit_balance
+from money import Money, DIGITS
+from order_states import transition, COMPLETED, DISPUTE
+from broadcast import create_broadcast, cancel_broadcast, detach_category, RUNNING, PENDING
+import vip  # noqa: F401 — регистрирует хуки счётчиков активных заказов
+from metadata_cache import publish_invalidation, CATEGORIES, SETTINGS
+from metrics import instrument_engine, render_latest, HTTP_LATENCY
+from tracing import setup_tracing, tracer, instrument_engine as instrument_engine_tracing
+from sql_debug import SQL_DEBUG, track_queries, instrument_engine as instrument_engine_sql_debug
 
-DB_URL = f"postgresql+asyncpg://{os.getenv('DB_USER')}:{os.getenv('DB_PASS')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
-engine = create_async_engine(DB_URL)
-async_session = async_sessionmaker(engine, expire_on_commit=False)
 
 app = FastAPI(title="Admin Panel")
 app.mount("/media", StaticFiles(directory="media"), name="media")
 templates = Jinja2Templates(directory="admin_panel/templates")
 bot = Bot(token=os.getenv("BOT_TOKEN"), default=DefaultBotProperties(parse_mode="HTML"))
+instrument_engine(engine)
+if setup_tracing("p2p-admin-panel"):
+    instrument_engine_tracing(engine)
+if SQL_DEBUG:
+    instrument_engine_sql_debug(engine)
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    with tracer.start_as_current_span(f"{request.method} {request.url.path}") as span, \
+            (track_queries(f"{request.method} {request.url.path}") if SQL_DEBUG else nullcontext()):
+        response = await call_next(request)
+        route = request.scope.get("route")
+        route_path = route.path if route else "unmatched"
+        span.set_attribute("http.route", route_path)
+        span.set_attribute("http.status_code", response.status_code)
+    HTTP_LATENCY.labels(request.method, route_path).observe(time.perf_counter() - started)
+    return response
+
+@app.get("/metrics")
+async def metrics():
+    body, content_type = render_latest()
+    return Response(content=body, media_type=content_type)
 
-security = HTTPBasic()
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 ADMIN_USERNAME = os.getenv("ADMIN_USERNAME")
+# Рассылки из панели записываются от имени администратора бота.
+ADMIN_ID = int(os.getenv("ADMIN_ID", "0"))
 ADMIN_PASSWORD_HASH = os.getenv("ADMIN_PASSWORD_HASH")
 
-def verify_credentials(credentials: HTTPBasicCredentials = Depends(security)):
-    correct_username = secrets.compare_digest(credentials.username, ADMIN_USERNAME)
-    correct_password = pwd_context.verify(credentials.password, ADMIN_PASSWORD_HASH)
+SESSION_COOKIE = "admin_session"
+SESSION_TTL = int(os.getenv("ADMIN_SESSION_TTL", "43200"))
+SESSION_COOKIE_SECURE = os.getenv("ADMIN_SESSION_COOKIE_SECURE", "true").lower() == "true"
+# Без заданного секрета сессии живут только до перезапуска панели.
+SESSION_SECRET = (os.getenv("ADMIN_SESSION_SECRET") or secrets.token_hex(32)).encode()
+
+def sign_session(payload: str) -> str:
+    return hmac.new(SESSION_SECRET, payload.encode(), hashlib.sha256).hexdigest()
+
+def issue_session_token(username: str) -> str:
+    payload = f"{username}:{int(time.time()) + SESSION_TTL}"
+    return f"{payload}:{sign_session(payload)}"
+
+def read_session_token(token: str) -> str | None:
+    try:
+        username, expires_at, signature = token.rsplit(":", 2)
+        expires_at = int(expires_at)
+    except ValueError:
+        return None
+    if not hmac.compare_digest(signature, sign_session(f"{username}:{expires_at}")):
+        return None
+    if expires_at < time.time():
+        return None
+    return username
+
+def verify_credentials(request: Request):
+    username = read_session_token(request.cookies.get(SESSION_COOKIE, ""))
+    if not username or not secrets.compare_digest(username, ADMIN_USERNAME):
+        raise HTTPException(status_code=status.HTTP_303_SEE_OTHER, headers={"Location": "/login"})
+    return username
+
+@app.get("/login", response_class=HTMLResponse)
+async def login_page(request: Request):
+    return templates.TemplateResponse("login.html", {"request": request, "error": None})
+
+@app.post("/login", response_class=HTMLResponse)
+async def login(request: Request, username: str = Form(...), password: str = Form(...)):
+    correct_username = secrets.compare_digest(username, ADMIN_USERNAME)
+    # bcrypt намеренно медленный, поэтому проверка уходит в пул потоков и не блокирует event loop.
+    correct_password = await run_in_threadpool(pwd_context.verify, password, ADMIN_PASSWORD_HASH)
     if not (correct_username and correct_password):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            message="Incorrect email or password",
-            headers={"WWW-Authenticate": "Basic"},
+        return templates.TemplateResponse(
+            "login.html",
+            {"request": request, "error": "Неверный логин или пароль"},
+            status_code=status.HTTP_401_UNAUTHORIZED
         )
-    return credentials.username
+    response = RedirectResponse(url="/", status_code=303)
+    response.set_cookie(
+        SESSION_COOKIE, issue_session_token(username),
+        max_age=SESSION_TTL, httponly=True, secure=SESSION_COOKIE_SECURE, samesite="strict"
+    )
+    return response
+
+@app.post("/logout")
+async def logout():
+    response = RedirectResponse(url="/login", status_code=303)
+    response.delete_cookie(SESSION_COOKIE)
+    return response
 
 @app.get("/", response_class=HTMLResponse, dependencies=[Depends(verify_credentials)])
 async def read_root(request: Request):
@@ -63,6 +145,7 @@ async def read_root(request: Request):
         current_commission = commission_setting.value if commission_setting else "0"
         categories_result = await session.execute(select(Category).order_by(Category.name))
         categories = categories_result.scalars().all()
+        broadcasts = (await session.scalars(select(Broadcast).order_by(Broadcast.id.desc()).limit(10))).all()
 
     return templates.TemplateResponse(
         "index.html",
@@ -71,7 +154,8 @@ async def read_root(request: Request):
             "users": users,
             "orders": orders,
             "commission_percent": current_commission,
-            "categories": categories
+            "categories": categories,
+            "broadcasts": broadcasts
         }
     )
 
@@ -82,6 +166,7 @@ async def add_category(category_name: str = Form(...)):
             existing_category = await session.scalar(select(Category).where(func.lower(Category.name) == category_name.lower()))
             if not existing_category:
                 session.add(Category(name=category_name))
+                await publish_invalidation(session, CATEGORIES)
                 await session.commit()
     return RedirectResponse(url="/", status_code=303)
 
@@ -90,7 +175,9 @@ async def delete_category(category_id: int):
     async with async_session() as session:
         category = await session.get(Category, category_id)
         if category:
+            await detach_category(session, category_id)
             await session.delete(category)
+            await publish_invalidation(session, CATEGORIES)
             await session.commit()
     return RedirectResponse(url="/", status_code=303)
 
@@ -106,6 +193,7 @@ async def update_commission(percent: Decimal = Form(...)):
             session.add(commission_setting)
         else:
             commission_setting.value = str(percent)
+        await publish_invalidation(session, SETTINGS)
         await session.commit()
         
     return RedirectResponse(url="/", status_code=303)
@@ -130,31 +218,27 @@ async def get_chat_log(request: Request, order_id: int):
 @app.post("/orders/{order_id}/resolve", dependencies=[Depends(verify_credentials)])
 async def resolve_dispute_from_panel(order_id: int, winner: str = Form(...)):
     async with async_session() as session:
-        order = await session.get(Order, order_id, options=[joinedload(Order.customer), joinedload(Order.executor)])
-        if not order or order.status != "dispute":
+        if winner not in ("customer", "executor"):
+            return RedirectResponse(url="/", status_code=303)
+        order = await transition(session, order_id, COMPLETED, from_statuses=[DISPUTE])
+        if not order:
             return RedirectResponse(url="/", status_code=303)
 
         if winner == "customer":
             if order.price > 0:
-                order.customer.balance += order.price
-                session.add(FinancialTransaction(user_id=order.customer_id, type='dispute_resolution', amount=order.price, order_id=order.id))
-            winner_user, loser_user = order.customer, order.executor
+                await credit_balance(session, order.customer_id, order.price, 'dispute_resolution', order.id)
+            winner_id, loser_id = order.customer_id, order.executor_id
             resolution_text = f"Спор по заказу №{order.id} решен в пользу заказчика. Сумма {order.price:.2f} USDT возвращена на его баланс."
-        elif winner == "executor":
+        else:
             if order.price > 0:
-                order.executor.balance += order.price
-                session.add(FinancialTransaction(user_id=order.executor_id, type='dispute_resolution', amount=order.price, order_id=order.id))
-            winner_user, loser_user = order.executor, order.customer
+                await credit_balance(session, order.executor_id, order.price, 'dispute_resolution', order.id)
+            winner_id, loser_id = order.executor_id, order.customer_id
             resolution_text = f"Спор по заказу №{order.id} решен в пользу исполнителя. Сумма {order.price:.2f} USDT переведена на его баланс."
-        else:
-            return RedirectResponse(url="/", status_code=303)
-
-        order.status = "completed"
         await session.commit()
 
         try:
-            await bot.send_message(winner_user.telegram_id, f"🟢 {resolution_text}")
-            if loser_user: await bot.send_message(loser_user.telegram_id, f"🔴 {resolution_text}")
+            await bot.send_message(winner_id, f"🟢 {resolution_text}")
+            if loser_id: await bot.send_message(loser_id, f"🔴 {resolution_text}")
         except Exception as e:
             print(f"Не удалось отправить уведомления о решении спора по заказу {order.id}: {e}")
 
@@ -188,20 +272,56 @@ async def unblock_user(user_id: int):
 
 @app.post("/users/{user_id}/credit", dependencies=[Depends(verify_credentials)])
 async def credit_user_balance(user_id: int, amount: Decimal = Form(...)):
-    async with async_session() as session:
-        user = await session.scalar(select(User).where(User.telegram_id == user_id))
-        if user and amount > 0:
-            user.balance += amount
-            session.add(FinancialTransaction(user_id=user_id, type='admin_credit', amount=amount))
-            await session.commit()
+    amount = Money.parse(round(amount, DIGITS))
+    if amount > 0:
+        async with async_session() as session:
+            if await credit_balance(session, user_id, amount, 'admin_credit') is not None:
+                await session.commit()
     return RedirectResponse(url="/", status_code=303)
 
 @app.post("/users/{user_id}/debit", dependencies=[Depends(verify_credentials)])
 async def debit_user_balance(user_id: int, amount: Decimal = Form(...)):
+    amount = Money.parse(round(amount, DIGITS))
+    if amount > 0:
+        async with async_session() as session:
+            if await debit_balance(session, user_id, amount, 'admin_debit') is not None:
+                await session.commit()
+    return RedirectResponse(url="/", status_code=303)
+
+@app.post("/broadcasts", dependencies=[Depends(verify_credentials)])
+async def create_broadcast_from_panel(
+    text: str = Form(...),
+    vip_only: bool = Form(False),
+    active_days: str = Form(""),
+    category_id: str = Form(""),
+):
+    if not text.strip():
+        return RedirectResponse(url="/", status_code=303)
     async with async_session() as session:
-        user = await session.scalar(select(User).where(User.telegram_id == user_id))
-        if user and amount > 0 and user.balance >= amount:
-            user.balance -= amount
-            session.add(FinancialTransaction(user_id=user_id, type='admin_debit', amount=-amount))
-            await session.commit()
-    return RedirectResponse(url="/", status_code=303)
\ No newline at end of file
+        # Исполняет рассылку бот: он подхватывает новые записи из таблицы broadcasts раз в минуту.
+        broadcast = await create_broadcast(
+            session, text.strip(), ADMIN_ID,
+            vip_only=vip_only,
+            active_days=int(active_days) if active_days.isdigit() else None,
+            category_id=int(category_id) if category_id.isdigit() else None
+        )
+        await session.commit()
+    return RedirectResponse(url=f"/broadcasts/{broadcast.id}", status_code=303)
+
+@app.get("/broadcasts/{broadcast_id}", response_class=HTMLResponse, dependencies=[Depends(verify_credentials)])
+async def view_broadcast(request: Request, broadcast_id: int):
+    async with async_session() as session:
+        broadcast = await session.get(Broadcast, broadcast_id)
+    if not broadcast:
+        raise HTTPException(status_code=404, detail="Broadcast not found")
+    return templates.TemplateResponse(
+        "broadcast.html",
+        {"request": request, "broadcast": broadcast, "in_progress": broadcast.status in (PENDING, RUNNING)}
+    )
+
+@app.post("/broadcasts/{broadcast_id}/cancel", dependencies=[Depends(verify_credentials)])
+async def cancel_broadcast_from_panel(broadcast_id: int):
+    async with async_session() as session:
+        await cancel_broadcast(session, broadcast_id)
+        await session.commit()
+    return RedirectResponse(url=f"/broadcasts/{broadcast_id}", status_code=303)
@@ -0,0 +1,57 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+
+from benchmarks.harness import run_benchmark, check_thresholds, format_report
+from benchmarks.scenarios import MIXES
+
+DEFAULT_THRESHOLDS = os.path.join(os.path.dirname(__file__), "thresholds.json")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон обработчиков бота без обращения к Telegram.")
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL", "sqlite+aiosqlite:///bench.sqlite3"))
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--offers-per-order", type=int, default=3)
+    parser.add_argument("--messages-per-order", type=int, default=10)
+    parser.add_argument("--sessions", type=int, default=2000, help="количество пользовательских сценариев")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--mix", choices=sorted(MIXES), default="mixed")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="искусственная задержка ответа Bot API, с")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--thresholds", default=DEFAULT_THRESHOLDS)
+    parser.add_argument("--strict-timing", action="store_true",
+                        help="проваливать прогон и по порогам времени (p95/p99, пропускная способность)")
+    parser.add_argument("--json", help="сохранить отчёт в JSON-файл")
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    args = parse_args()
+    report = asyncio.run(run_benchmark(args))
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    with open(args.thresholds, encoding="utf-8") as f:
+        violations, warnings = check_thresholds(report, json.load(f), args.strict_timing)
+    if warnings:
+        print("\nПороги времени превышены (не проваливают прогон без --strict-timing):")
+        for warning in warnings:
+            print(f"  - {warning}")
+    if violations:
+        print("\nПревышены пороги:")
+        for violation in violations:
+            print(f"  - {violation}")
+        sys.exit(1)
+    print("\nВсе пороги соблюдены.")
+
+
+if __name__ == "__main__":
+    main()
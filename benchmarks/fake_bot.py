@@ -0,0 +1,49 @@
+import asyncio
+import itertools
+from collections import Counter
+from datetime import datetime, UTC
+
+from aiogram.client.session.base import BaseSession
+from aiogram.types import Message, User, File
+
+BOT_USER = {"id": 100000001, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+
+class FakeSession(BaseSession):
+    """Сессия Bot API без сети: отвечает правдоподобными объектами и считает вызовы."""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls = Counter()
+        self._message_ids = itertools.count(1)
+
+    async def close(self):
+        pass
+
+    def _message(self, bot, method):
+        return Message.model_validate({
+            "message_id": getattr(method, "message_id", None) or next(self._message_ids),
+            "date": datetime.now(UTC),
+            "chat": {"id": getattr(method, "chat_id", 0) or 0, "type": "private"},
+            "from": BOT_USER,
+            "text": getattr(method, "text", None),
+        }, context={"bot": bot})
+
+    async def make_request(self, bot, method, timeout=None):
+        method_name = type(method).__name__
+        self.calls[method_name] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method_name == "GetMe":
+            return User.model_validate(BOT_USER, context={"bot": bot})
+        if method_name == "GetFile":
+            return File.model_validate({
+                "file_id": method.file_id, "file_unique_id": f"u{method.file_id}", "file_path": f"photos/{method.file_id}.jpg"
+            }, context={"bot": bot})
+        if method_name.startswith("Send") or method_name in ("EditMessageText", "EditMessageCaption"):
+            return self._message(bot, method)
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b"benchmark"
@@ -0,0 +1,188 @@
+import asyncio
+import math
+import os
+import random
+import time
+from collections import defaultdict
+
+from aiogram import BaseMiddleware
+from sqlalchemy.engine import make_url
+
+from benchmarks.fake_bot import FakeSession
+from benchmarks.scenarios import SCENARIOS, MIXES
+from benchmarks.seed import seed
+from sql_debug import instrument_engine, track_queries
+
+# main.py читает конфигурацию из окружения при импорте, поэтому значения задаются заранее.
+BENCH_ENV = {
+    "BOT_TOKEN": "100000001:AAbenchmarkbenchmarkbenchmarkbenchma",
+    "ADMIN_ID": "1",
+    "LOG_CHANNEL_ID": "-1001",
+    "ORDER_CHANNEL_ID": "-1002",
+}
+
+
+def load_bot(database_url: str):
+    url = make_url(database_url)
+    if not url.drivername.startswith("sqlite") and "bench" not in (url.database or ""):
+        raise SystemExit("Бенчмарк пересоздаёт схему: имя базы должно содержать 'bench'.")
+    os.environ["DATABASE_URL"] = database_url
+    for key, value in BENCH_ENV.items():
+        os.environ.setdefault(key, value)
+    import main
+    return main
+
+
+class HandlerTimings(BaseMiddleware):
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.repeated_shapes = defaultdict(int)
+        self.errors = defaultdict(int)
+
+    async def __call__(self, handler, event, data):
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object else "unknown"
+        started = time.perf_counter()
+        with track_queries(name, report=False) as query_log:
+            try:
+                return await handler(event, data)
+            except Exception:
+                self.errors[name] += 1
+                raise
+            finally:
+                self.latencies[name].append(time.perf_counter() - started)
+                self.queries[name].append(query_log.count)
+                self.repeated_shapes[name] = max(self.repeated_shapes[name], len(query_log.repeated_shapes()))
+
+
+def percentile(sorted_values: list, percent: float) -> float:
+    index = max(0, math.ceil(percent / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+async def replay(bot_module, seed_data, mix: dict, sessions: int, concurrency: int, rng: random.Random):
+    names, weights = list(mix), list(mix.values())
+    chat_users = [user for _, customer, executor in seed_data.active_pairs for user in (customer, executor)]
+    regular_users = sorted(set(seed_data.user_ids) - set(chat_users))
+    busy = set()
+    remaining = iter(range(sessions))
+    counters = {"updates": 0, "failed_updates": 0}
+
+    def pick_user(scenario: str):
+        pool = chat_users if scenario == "chat" else regular_users
+        for _ in range(20):
+            user_id = rng.choice(pool)
+            if user_id not in busy:
+                return user_id
+        return None
+
+    async def worker():
+        for _ in remaining:
+            scenario = rng.choices(names, weights)[0]
+            user_id = pick_user(scenario)
+            if user_id is None:
+                continue
+            busy.add(user_id)
+            try:
+                for update in SCENARIOS[scenario](bot_module.bot, seed_data, rng, user_id):
+                    counters["updates"] += 1
+                    try:
+                        await bot_module.dp.feed_update(bot_module.bot, update)
+                    except Exception:
+                        counters["failed_updates"] += 1
+            finally:
+                busy.discard(user_id)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return counters, time.perf_counter() - started
+
+
+async def run_benchmark(args) -> dict:
+    bot_module = load_bot(args.database_url)
+    rng = random.Random(args.seed)
+    seed_data = await seed(
+        bot_module.engine, bot_module.async_session,
+        users=args.users, orders=args.orders,
+        offers_per_order=args.offers_per_order, messages_per_order=args.messages_per_order, rng=rng
+    )
+
+    session = FakeSession(latency=args.api_latency)
+    bot_module.bot.session = session
+    instrument_engine(bot_module.engine)
+    timings = HandlerTimings()
+    bot_module.dp.message.middleware(timings)
+    bot_module.dp.callback_query.middleware(timings)
+    await bot_module.metadata.warm(bot_module.bot)
+
+    counters, elapsed = await replay(bot_module, seed_data, MIXES[args.mix], args.sessions, args.concurrency, rng)
+    await bot_module.dispose_engines()
+
+    handlers = {}
+    for name, values in sorted(timings.latencies.items()):
+        values.sort()
+        handlers[name] = {
+            "count": len(values),
+            "errors": timings.errors.get(name, 0),
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "max_ms": values[-1] * 1000,
+            "avg_queries": sum(timings.queries[name]) / len(timings.queries[name]),
+            "max_queries": max(timings.queries[name]),
+            "n_plus_one_shapes": timings.repeated_shapes[name],
+        }
+    return {
+        "mix": args.mix,
+        "elapsed_s": elapsed,
+        "updates": counters["updates"],
+        "failed_updates": counters["failed_updates"],
+        "throughput_ups": counters["updates"] / elapsed if elapsed else 0.0,
+        "bot_api_calls": dict(session.calls),
+        "handlers": handlers,
+    }
+
+
+# Время зависит от машины и SQLite и на одной и той же сборке гуляет в разы, поэтому по умолчанию
+# такие пороги только печатаются; прогон проваливают ошибки, число запросов и N+1.
+TIMING_KEYS = {"p50_ms", "p95_ms", "p99_ms", "max_ms"}
+
+
+def check_thresholds(report: dict, thresholds: dict, strict_timing: bool = False) -> tuple[list[str], list[str]]:
+    """Возвращает (нарушения, предупреждения): превышения по времени — предупреждения, если не strict_timing."""
+    violations, warnings = [], []
+    timing = violations if strict_timing else warnings
+    min_throughput = thresholds.get("min_throughput_ups")
+    if min_throughput and report["throughput_ups"] < min_throughput:
+        timing.append(f"пропускная способность {report['throughput_ups']:.1f} < {min_throughput} upd/s")
+    max_failed = thresholds.get("max_failed_updates", 0)
+    if report["failed_updates"] > max_failed:
+        violations.append(f"ошибок при обработке: {report['failed_updates']} > {max_failed}")
+    for name, limits in thresholds.get("handlers", {}).items():
+        stats = report["handlers"].get(name)
+        if not stats:
+            continue
+        for key, limit in limits.items():
+            if key in stats and stats[key] > limit:
+                (timing if key in TIMING_KEYS else violations).append(f"{name}: {key} = {stats[key]:.1f} > {limit}")
+    return violations, warnings
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f"Смесь: {report['mix']}, обновлений: {report['updates']} (ошибок: {report['failed_updates']}), "
+        f"время: {report['elapsed_s']:.2f} с, пропускная способность: {report['throughput_ups']:.1f} upd/s",
+        "",
+        f"{'обработчик':<32}{'кол-во':>8}{'ошибки':>8}{'p50 мс':>10}{'p95 мс':>10}{'p99 мс':>10}{'max мс':>10}"
+        f"{'SQL ср.':>9}{'SQL max':>9}{'N+1':>5}",
+    ]
+    for name, stats in report["handlers"].items():
+        lines.append(
+            f"{name:<32}{stats['count']:>8}{stats['errors']:>8}{stats['p50_ms']:>10.2f}"
+            f"{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}{stats['max_ms']:>10.2f}"
+            f"{stats['avg_queries']:>9.1f}{stats['max_queries']:>9}{stats['n_plus_one_shapes']:>5}"
+        )
+    lines.append("")
+    lines.append("Вызовы Bot API: " + ", ".join(f"{method}={count}" for method, count in sorted(report["bot_api_calls"].items())))
+    return "\n".join(lines)
@@ -0,0 +1,88 @@
+"""
+Микро-бенчмарк денежной арифметики: Decimal против Money на путях зачисления депозита и проводок.
+
+    python -m benchmarks.money --operations 200000
+"""
+import argparse
+import random
+import timeit
+from decimal import Decimal, ROUND_HALF_UP
+
+from money import Money
+
+MICRO = Decimal("1000000")
+
+
+def deposit_decimal(values):
+    # Прежний путь: value TRC-20 делится на 10^6, затем сумма округляется до центов при записи в NUMERIC(10, 2).
+    balance = Decimal("0.00")
+    for value in values:
+        balance += (Decimal(value) / MICRO).quantize(Decimal("0.01"))
+    return balance
+
+
+def deposit_money(values):
+    balance = Money(0)
+    for value in values:
+        balance += Money(int(value))
+    return balance
+
+
+def ledger_decimal(amounts, commission_percent):
+    # Списание с заказчика, выплата исполнителю за вычетом комиссии, две проводки.
+    customer, executor, ledger = Decimal("1000.00"), Decimal("0.00"), []
+    for amount in amounts:
+        if customer >= amount:
+            customer -= amount
+            commission = (amount * commission_percent / 100).quantize(Decimal("0.01"), ROUND_HALF_UP)
+            payout = amount - commission
+            executor += payout
+            ledger.append(-amount)
+            ledger.append(payout)
+        customer += amount
+    return customer, executor, ledger
+
+
+def ledger_money(amounts, commission_percent):
+    customer, executor, ledger = Money.parse("1000.00"), Money(0), []
+    for amount in amounts:
+        if customer >= amount:
+            customer -= amount
+            commission = amount.percent(commission_percent)
+            payout = amount - commission
+            executor += payout
+            ledger.append(-amount)
+            ledger.append(payout)
+        customer += amount
+    return customer, executor, ledger
+
+
+def measure(func, *args, repeat: int = 5) -> float:
+    return min(timeit.repeat(lambda: func(*args), number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение Decimal и Money на денежных операциях бота.")
+    parser.add_argument("--operations", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    values = [str(rng.randint(1, 10_000_000_000)) for _ in range(args.operations)]
+    cents = [rng.randint(100, 50_000) for _ in range(args.operations)]
+    decimal_amounts = [Decimal(cent).scaleb(-2) for cent in cents]
+    money_amounts = [Money(cent * 10_000) for cent in cents]
+    commission_percent = Decimal("7.5")
+
+    rows = [
+        ("депозиты", measure(deposit_decimal, values), measure(deposit_money, values)),
+        ("проводки", measure(ledger_decimal, decimal_amounts, commission_percent),
+         measure(ledger_money, money_amounts, commission_percent)),
+    ]
+    print(f"{'путь':<12}{'Decimal, мс':>14}{'Money, мс':>12}{'ускорение':>12}")
+    for name, decimal_time, money_time in rows:
+        print(f"{name:<12}{decimal_time * 1000:>14.1f}{money_time * 1000:>12.1f}{decimal_time / money_time:>11.1f}x")
+
+
+if __name__ == "__main__":
+    main()
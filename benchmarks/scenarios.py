@@ -0,0 +1,90 @@
+import itertools
+from datetime import datetime, UTC
+
+from aiogram.types import Update
+
+_update_ids = itertools.count(1)
+_message_ids = itertools.count(1)
+
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+
+def message_update(bot, user_id: int, text: str, entities: list | None = None) -> Update:
+    message = {
+        "message_id": next(_message_ids),
+        "date": datetime.now(UTC),
+        "chat": {"id": user_id, "type": "private"},
+        "from": _user(user_id),
+        "text": text,
+    }
+    if entities:
+        message["entities"] = entities
+    return Update.model_validate({"update_id": next(_update_ids), "message": message}, context={"bot": bot})
+
+
+def command_update(bot, user_id: int, text: str) -> Update:
+    command_length = len(text.split(" ", 1)[0])
+    return message_update(bot, user_id, text, [{"type": "bot_command", "offset": 0, "length": command_length}])
+
+
+def callback_update(bot, user_id: int, data: str) -> Update:
+    return Update.model_validate({
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_update_ids)),
+            "from": _user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": next(_message_ids),
+                "date": datetime.now(UTC),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": 100000001, "is_bot": True, "first_name": "Bench"},
+                "text": "...",
+            },
+        },
+    }, context={"bot": bot})
+
+
+# Каждый сценарий — последовательность обновлений одного пользователя (важно для FSM).
+def feed_paging(bot, seed, rng, user_id):
+    yield message_update(bot, user_id, "🔥 Лента заказов")
+    for page in range(1, rng.randint(2, 4)):
+        yield callback_update(bot, user_id, f"pag:next:{page}")
+
+
+def order_creation(bot, seed, rng, user_id):
+    yield message_update(bot, user_id, "📝 Создать заказ")
+    yield callback_update(bot, user_id, f"category:select:{rng.choice(seed.category_ids)}")
+    yield message_update(bot, user_id, "Логотип для кофейни")
+    yield message_update(bot, user_id, "Нужен логотип в трёх вариантах, исходники в SVG.")
+    yield message_update(bot, user_id, str(rng.randint(1, 20)))
+    yield callback_update(bot, user_id, "order_confirm")
+
+
+def chat_relay(bot, seed, rng, user_id):
+    for _ in range(rng.randint(1, 5)):
+        yield message_update(bot, user_id, "Добрый день! Как продвигается работа?")
+
+
+def profile_views(bot, seed, rng, user_id):
+    yield message_update(bot, user_id, "👤 Мой профиль")
+    yield command_update(bot, user_id, f"/profile {rng.choice(seed.user_ids)}")
+
+
+SCENARIOS = {
+    "feed": feed_paging,
+    "order_creation": order_creation,
+    "chat": chat_relay,
+    "profile": profile_views,
+}
+
+MIXES = {
+    "mixed": {"feed": 40, "profile": 25, "chat": 25, "order_creation": 10},
+    "feed": {"feed": 1},
+    "order_creation": {"order_creation": 1},
+    "chat": {"chat": 1},
+    "profile": {"profile": 1},
+}
@@ -0,0 +1,93 @@
+import random
+from datetime import datetime, timedelta, UTC
+from decimal import Decimal
+
+from sqlalchemy import insert, select
+
+from db_models import Base, User, Category, Order, Offer, ChatMessage, FinancialTransaction
+from money import Money
+
+FIRST_USER_ID = 10_000
+CATEGORY_NAMES = ["Дизайн", "Разработка", "Тексты", "Переводы", "Маркетинг", "Видео"]
+
+
+class SeedData:
+    """Идентификаторы засеянных сущностей, из которых сценарии собирают обновления."""
+
+    def __init__(self, user_ids, category_ids, active_pairs):
+        self.user_ids = user_ids
+        self.category_ids = category_ids
+        self.active_pairs = active_pairs
+
+
+async def seed(engine, session_factory, users: int, orders: int, offers_per_order: int, messages_per_order: int, rng: random.Random):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    now = datetime.now(UTC)
+    user_ids = list(range(FIRST_USER_ID, FIRST_USER_ID + users))
+    async with session_factory() as session:
+        await session.execute(insert(Category), [{"name": name} for name in CATEGORY_NAMES])
+        category_ids = (await session.scalars(select(Category.id))).all()
+
+        await session.execute(insert(User), [{
+            "telegram_id": user_id,
+            "username": f"user{user_id}",
+            "balance": Money.parse("1000.00"),
+            "rating": Decimal(rng.randint(300, 500)) / 100,
+            "reviews_count": rng.randint(0, 50),
+            "registration_date": now - timedelta(days=rng.randint(0, 365)),
+            "is_blocked": False,
+        } for user_id in user_ids])
+
+        order_rows = []
+        for number in range(orders):
+            customer_id = rng.choice(user_ids)
+            status = rng.choices(["open", "in_progress", "completed"], weights=[70, 10, 20])[0]
+            executor_id = rng.choice(user_ids)
+            if executor_id == customer_id:
+                executor_id = user_ids[(user_ids.index(customer_id) + 1) % len(user_ids)]
+            order_rows.append({
+                "title": f"Заказ {number}",
+                "description": "Описание задачи для нагрузочного теста. " * 5,
+                "price": Money.parse(rng.randint(5, 500)),
+                "status": status,
+                "customer_id": customer_id,
+                "executor_id": executor_id if status != "open" else None,
+                "creation_date": now - timedelta(minutes=rng.randint(0, 60 * 24 * 90)),
+                "category_id": rng.choice(category_ids),
+            })
+        await session.execute(insert(Order), order_rows)
+        order_list = (await session.execute(select(Order.id, Order.status, Order.customer_id, Order.executor_id))).all()
+
+        offer_rows, message_rows, ledger_rows = [], [], []
+        for order_id, status, customer_id, executor_id in order_list:
+            for executor in rng.sample(user_ids, min(offers_per_order, len(user_ids))):
+                if executor != customer_id:
+                    offer_rows.append({"order_id": order_id, "executor_id": executor, "message": "Готов выполнить"})
+            if executor_id:
+                for index in range(messages_per_order):
+                    message_rows.append({
+                        "order_id": order_id,
+                        "sender_id": customer_id if index % 2 else executor_id,
+                        "timestamp": now - timedelta(minutes=messages_per_order - index),
+                        "content_type": "text",
+                        "text_content": "Сообщение в чате сделки",
+                    })
+            ledger_rows.append({"user_id": customer_id, "type": "order_payment", "amount": Money.parse("-10.00"), "order_id": order_id, "timestamp": now})
+        if offer_rows:
+            await session.execute(insert(Offer), offer_rows)
+        if message_rows:
+            await session.execute(insert(ChatMessage), message_rows)
+        if ledger_rows:
+            await session.execute(insert(FinancialTransaction), ledger_rows)
+        await session.commit()
+
+    # Для ретрансляции чата нужен участник, у которого ровно одна активная сделка.
+    active_pairs, busy = [], set()
+    for order_id, status, customer_id, executor_id in order_list:
+        if status == "in_progress" and executor_id and customer_id not in busy and executor_id not in busy:
+            active_pairs.append((order_id, customer_id, executor_id))
+            busy.update((customer_id, executor_id))
+    return SeedData(user_ids, list(category_ids), active_pairs)
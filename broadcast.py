@@ -0,0 +1,226 @@
+import os
+import asyncio
+import logging
+from datetime import datetime, timedelta, UTC
+
+from aiogram import BaseMiddleware
+from sqlalchemy import select, update, func, exists, or_, text
+
+from db_models import User, Order, Offer, Broadcast
+from delivery import deliver, SENT, FAILED, BLOCKED
+from idempotency import ExpiringMap
+
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "10"))
+# Размер пачки получателей между контрольными точками: при падении повторно уйдёт не больше одной пачки.
+BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", "200"))
+ACTIVITY_TOUCH_INTERVAL = 60 * 60
+# Пространство advisory-блокировок рассылок: вторая половина ключа — id рассылки.
+BROADCASTS_LOCK_KEY = 72_430_004
+
+PENDING = "pending"
+RUNNING = "running"
+COMPLETED = "completed"
+CANCELLED = "cancelled"
+
+
+def parse_segment(tokens: list[str]) -> dict:
+    """Фильтры из команды: vip, active=<дней>, category=<id>. Неизвестный токен — ValueError."""
+    segment = {"vip_only": False, "active_days": None, "category_id": None}
+    for token in tokens:
+        key, _, value = token.partition("=")
+        if key == "vip" and not value:
+            segment["vip_only"] = True
+        elif key == "active" and value.isdigit():
+            segment["active_days"] = int(value)
+        elif key == "category" and value.isdigit():
+            segment["category_id"] = int(value)
+        else:
+            raise ValueError(token)
+    return segment
+
+
+def recipient_filters(broadcast: Broadcast) -> list:
+    filters = [User.is_active.is_(True), User.is_blocked.is_(False)]
+    now = datetime.now(UTC)
+    if broadcast.vip_only:
+        filters.append(User.vip_expires_at > now)
+    if broadcast.active_days:
+        filters.append(User.last_seen_at >= now - timedelta(days=broadcast.active_days))
+    if broadcast.category_id:
+        # Интерес к категории — заказы в ней или отклики на такие заказы.
+        filters.append(or_(
+            exists().where(Order.customer_id == User.telegram_id, Order.category_id == broadcast.category_id),
+            exists().where(
+                Offer.executor_id == User.telegram_id, Offer.order_id == Order.id,
+                Order.category_id == broadcast.category_id
+            ),
+        ))
+    return filters
+
+
+async def create_broadcast(session, text: str, created_by: int, **segment) -> Broadcast:
+    broadcast = Broadcast(text=text, created_by=created_by, status=PENDING, **segment)
+    broadcast.total = await session.scalar(select(func.count(User.id)).where(*recipient_filters(broadcast)))
+    session.add(broadcast)
+    await session.flush([broadcast])
+    return broadcast
+
+
+async def cancel_broadcast(session, broadcast_id: int) -> Broadcast | None:
+    # Исполнитель увидит новый статус перед следующей пачкой и остановится.
+    return await session.scalar(
+        update(Broadcast)
+        .where(Broadcast.id == broadcast_id, Broadcast.status.in_([PENDING, RUNNING]))
+        .values(status=CANCELLED, finished_at=func.now())
+        .returning(Broadcast)
+    )
+
+
+async def detach_category(session, category_id: int) -> int:
+    """
+    Готовит удаление категории: незавершённые рассылки по ней отменяются, у остальных
+    категория снимается. Без этого сегмент пропал бы и рассылка ушла бы всем пользователям.
+    """
+    cancelled = await session.scalars(
+        update(Broadcast)
+        .where(Broadcast.category_id == category_id, Broadcast.status.in_([PENDING, RUNNING]))
+        .values(status=CANCELLED, finished_at=func.now())
+        .returning(Broadcast.id)
+    )
+    count = len(cancelled.all())
+    await session.execute(update(Broadcast).where(Broadcast.category_id == category_id).values(category_id=None))
+    return count
+
+
+def format_progress(broadcast: Broadcast) -> str:
+    statuses = {PENDING: "⏳ в очереди", RUNNING: "📤 идёт", COMPLETED: "✅ завершена", CANCELLED: "⛔️ отменена"}
+    processed = broadcast.sent + broadcast.failed + broadcast.blocked
+    return (
+        f"<b>📣 Рассылка #{broadcast.id}</b> — {statuses.get(broadcast.status, broadcast.status)}\n"
+        f"Обработано: {processed} из ~{broadcast.total}\n"
+        f"Доставлено: {broadcast.sent}\n"
+        f"Бот заблокирован: {broadcast.blocked}\n"
+        f"Ошибки: {broadcast.failed}"
+    )
+
+
+class BroadcastRunner:
+    """
+    Отправляет рассылки из таблицы broadcasts. Получатели читаются пачками по users.id
+    (keyset), после каждой пачки в БД сохраняются счётчики и контрольная точка, так что
+    в памяти одновременно не больше одной пачки, а прерванная рассылка продолжается с места остановки.
+    """
+
+    def __init__(self, bot, engine, session_factory, on_progress=None):
+        self.bot = bot
+        self.engine = engine
+        self.session_factory = session_factory
+        self.on_progress = on_progress
+        self.active: dict[int, asyncio.Task] = {}
+        self._semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+
+    async def resume_pending(self):
+        """Запускает рассылки в очереди и те, что были прерваны перезапуском бота."""
+        async with self.session_factory() as session:
+            broadcast_ids = await session.scalars(
+                select(Broadcast.id).where(Broadcast.status.in_([PENDING, RUNNING])).order_by(Broadcast.id)
+            )
+            for broadcast_id in broadcast_ids:
+                self.start(broadcast_id)
+
+    def start(self, broadcast_id: int):
+        if broadcast_id not in self.active:
+            task = asyncio.create_task(self._run(broadcast_id))
+            self.active[broadcast_id] = task
+            task.add_done_callback(lambda _: self.active.pop(broadcast_id, None))
+
+    async def _run(self, broadcast_id: int):
+        try:
+            # resume_pending работает в каждом процессе; рассылку ведёт тот, кто взял блокировку.
+            async with self.engine.connect() as lock_conn:
+                lock_conn = await lock_conn.execution_options(isolation_level="AUTOCOMMIT")
+                lock = {"key": BROADCASTS_LOCK_KEY, "broadcast_id": broadcast_id}
+                if not await lock_conn.scalar(text("SELECT pg_try_advisory_lock(:key, :broadcast_id)"), lock):
+                    return
+                try:
+                    async with self.session_factory() as session:
+                        await session.execute(
+                            update(Broadcast).where(Broadcast.id == broadcast_id, Broadcast.status == PENDING).values(status=RUNNING)
+                        )
+                        await session.commit()
+                    while await self._run_batch(broadcast_id):
+                        pass
+                finally:
+                    await lock_conn.execute(text("SELECT pg_advisory_unlock(:key, :broadcast_id)"), lock)
+        except Exception as e:
+            # Статус остаётся running: рассылка продолжится с контрольной точки при следующем запуске.
+            logging.error(f"Рассылка {broadcast_id} прервана: {e}")
+
+    async def _run_batch(self, broadcast_id: int) -> bool:
+        async with self.session_factory() as session:
+            broadcast = await session.get(Broadcast, broadcast_id)
+            if broadcast is None or broadcast.status != RUNNING:
+                return False
+            recipients = (await session.execute(
+                select(User.id, User.telegram_id)
+                .where(User.id > broadcast.last_user_id, *recipient_filters(broadcast))
+                .order_by(User.id)
+                .limit(BROADCAST_BATCH_SIZE)
+            )).all()
+
+        results = await asyncio.gather(*(self._deliver(broadcast.text, chat_id) for _, chat_id in recipients))
+        blocked_ids = [chat_id for (_, chat_id), result in zip(recipients, results) if result == BLOCKED]
+        values = {
+            "sent": Broadcast.sent + results.count(SENT),
+            "failed": Broadcast.failed + results.count(FAILED),
+            "blocked": Broadcast.blocked + len(blocked_ids),
+        }
+        if recipients:
+            values["last_user_id"] = recipients[-1].id
+        if len(recipients) < BROADCAST_BATCH_SIZE:
+            values.update(status=COMPLETED, finished_at=func.now())
+
+        async with self.session_factory() as session:
+            if blocked_ids:
+                await session.execute(update(User).where(User.telegram_id.in_(blocked_ids)).values(is_active=False))
+            # Отменённая во время пачки рассылка остаётся отменённой.
+            broadcast = await session.scalar(
+                update(Broadcast).where(Broadcast.id == broadcast_id, Broadcast.status == RUNNING)
+                .values(**values).returning(Broadcast)
+            )
+            await session.commit()
+        if broadcast is None:
+            return False
+        if self.on_progress:
+            await self.on_progress(broadcast)
+        return broadcast.status == RUNNING
+
+    async def _deliver(self, text: str, chat_id: int) -> str:
+        async with self._semaphore:
+            return await deliver(self.bot, chat_id, text)
+
+
+class ActivityMiddleware(BaseMiddleware):
+    """
+    Внешний middleware на dp.update: обновляет users.last_seen_at (для сегмента «активные за N дней»)
+    не чаще раза в ACTIVITY_TOUCH_INTERVAL на пользователя и снимает отметку о блокировке бота.
+    """
+
+    def __init__(self, session_factory, interval: float = ACTIVITY_TOUCH_INTERVAL):
+        self.session_factory = session_factory
+        self.recent = ExpiringMap(interval)
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if user is not None and not self.recent.get(user.id):
+            self.recent.set(user.id, True)
+            async with self.session_factory() as session:
+                await session.execute(
+                    update(User).where(User.telegram_id == user.id).values(last_seen_at=func.now(), is_active=True)
+                )
+                await session.commit()
+        return await handler(event, data)
+
+
+def setup_activity_tracking(dp, session_factory):
+    dp.update.outer_middleware(ActivityMiddleware(session_factory))
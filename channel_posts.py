@@ -0,0 +1,204 @@
+import os
+import asyncio
+import logging
+from collections import OrderedDict, deque
+
+from aiogram.exceptions import TelegramRetryAfter, TelegramBadRequest
+from sqlalchemy import select, update
+
+from db_models import Order, Category
+from order_states import OPEN, EXPIRED
+
+# В канал можно писать около 20 сообщений в минуту, правки считаются вместе с публикациями.
+CHANNEL_EDIT_INTERVAL = float(os.getenv("CHANNEL_EDIT_INTERVAL", "3"))
+CLOSED_ORDERS_CACHE_SIZE = int(os.getenv("CLOSED_ORDERS_CACHE_SIZE", "100000"))
+# Попытки публикации подряд; после них заказ ждёт следующего resume_pending, а заказчик получает уведомление.
+CHANNEL_PUBLISH_ATTEMPTS = int(os.getenv("CHANNEL_PUBLISH_ATTEMPTS", "3"))
+# Ответы на правку, после которых повторять её бессмысленно.
+IGNORED_EDIT_ERRORS = ("message is not modified", "message to edit not found")
+
+
+def format_channel_post(order_id: int, title: str, category_name: str, price, description: str | None, status: str = OPEN) -> str:
+    if status == OPEN:
+        header = f"🟢 Новый заказ №{order_id}"
+    elif status == EXPIRED:
+        header = f"⚫️ Заказ №{order_id} закрыт"
+    else:
+        header = f"🔴 Заказ №{order_id} — исполнитель выбран"
+    return (
+        f"<b>{header}</b>\n\n"
+        f"<b>Название:</b> {title}\n"
+        f"<b>Категория:</b> {category_name}\n"
+        f"<b>Цена:</b> {price:.2f} USDT\n\n"
+        f"<i>{description or ''}</i>"
+    )
+
+
+class ChannelPosts:
+    """
+    Публикации заказов в канале. Новые посты и правки уходят одной фоновой задачей в допустимом
+    для канала темпе, новые посты — в первую очередь. Очередь публикаций в памяти лишь ускоряет дело:
+    открытый заказ с пустым channel_message_id и есть неопубликованный пост, его подбирает resume_pending
+    после перезапуска или неудачных попыток. Закрытые заказы копятся в очереди правок: сколько бы
+    раз заказ ни менялся до очередной правки, его пост правится один раз по актуальному статусу из БД.
+    Номера закрытых заказов держатся в памяти, чтобы отсекать старые ссылки offer_ без запроса к БД.
+    """
+
+    def __init__(self, bot, chat_id, session_factory, offer_keyboard, on_failed=None,
+                 interval: float = CHANNEL_EDIT_INTERVAL, cache_size: int = CLOSED_ORDERS_CACHE_SIZE):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.session_factory = session_factory
+        self.offer_keyboard = offer_keyboard
+        self.on_failed = on_failed
+        self.interval = interval
+        self.cache_size = cache_size
+        self._closed: OrderedDict[int, None] = OrderedDict()
+        self._posts: deque[int] = deque()
+        self._attempts: dict[int, int] = {}
+        self._notified: set[int] = set()
+        self._dirty: set[int] = set()
+        self._wake = asyncio.Event()
+        self._task = None
+
+    def depth(self) -> int:
+        return len(self._posts)
+
+    def edits_depth(self) -> int:
+        return len(self._dirty)
+
+    def is_closed(self, order_id: int) -> bool:
+        return order_id in self._closed
+
+    async def warm(self, session):
+        order_ids = await session.scalars(
+            select(Order.id)
+            .where(Order.status != OPEN, Order.channel_message_id.is_not(None))
+            .order_by(Order.id.desc())
+            .limit(self.cache_size)
+        )
+        self._remember(reversed(order_ids.all()))
+
+    def publish(self, order_id: int):
+        self._posts.append(order_id)
+        self._wake.set()
+
+    async def resume_pending(self):
+        """Ставит в очередь открытые заказы без поста: прерванные перезапуском и не опубликованные из-за ошибок."""
+        async with self.session_factory() as session:
+            order_ids = await session.scalars(
+                select(Order.id).where(Order.status == OPEN, Order.channel_message_id.is_(None)).order_by(Order.id)
+            )
+            queued = set(self._posts)
+            self._posts.extend(order_id for order_id in order_ids if order_id not in queued)
+        if self._posts:
+            self._wake.set()
+
+    def mark_closed(self, order_ids: list[int]):
+        """Вызывается после коммита смены статуса: заказ больше не принимает отклики."""
+        self._remember(order_ids)
+        self._dirty.update(order_ids)
+        self._wake.set()
+
+    def _remember(self, order_ids):
+        for order_id in order_ids:
+            self._closed[order_id] = None
+        while len(self._closed) > self.cache_size:
+            self._closed.popitem(last=False)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            while self._posts or self._dirty:
+                try:
+                    if self._posts:
+                        await self._publish(self._posts.popleft())
+                    else:
+                        order_ids, self._dirty = self._dirty, set()
+                        await self._edit_batch(order_ids)
+                except Exception as e:
+                    logging.error(f"Не удалось обновить посты заказов в канале: {e}")
+
+    async def _publish(self, order_id: int):
+        async with self.session_factory() as session:
+            # Строка заказа заблокирована до записи номера поста: другой процесс пропустит заказ,
+            # а не опубликует его второй раз, и выбор исполнителя дождётся публикации.
+            row = (await session.execute(
+                select(
+                    Order.id, Order.customer_id, Order.title, Order.price, Order.description,
+                    Category.name.label("category_name")
+                )
+                .outerjoin(Category, Category.id == Order.category_id)
+                .where(Order.id == order_id, Order.status == OPEN, Order.channel_message_id.is_(None))
+                .with_for_update(of=Order, key_share=True, skip_locked=True)
+            )).first()
+            if row is None:
+                return
+            text = format_channel_post(row.id, row.title, row.category_name or "Без категории", row.price, row.description)
+            try:
+                post = await self.bot.send_message(self.chat_id, text, reply_markup=self.offer_keyboard(row.id))
+            except TelegramRetryAfter as e:
+                await session.rollback()
+                self._posts.appendleft(order_id)
+                await asyncio.sleep(e.retry_after)
+                return
+            except Exception as e:
+                await session.rollback()
+                await self._publish_failed(row, e)
+                return
+            await session.execute(update(Order).where(Order.id == order_id).values(channel_message_id=post.message_id))
+            await session.commit()
+        self._attempts.pop(order_id, None)
+        self._notified.discard(order_id)
+        await asyncio.sleep(self.interval)
+
+    async def _publish_failed(self, row, error: Exception):
+        attempts = self._attempts.get(row.id, 0) + 1
+        if attempts < CHANNEL_PUBLISH_ATTEMPTS:
+            logging.warning(f"Заказ {row.id} не опубликован в канале (попытка {attempts}): {error}")
+            self._attempts[row.id] = attempts
+            self._posts.append(row.id)
+            await asyncio.sleep(self.interval)
+            return
+        self._attempts.pop(row.id, None)
+        logging.error(f"Не удалось отправить заказ {row.id} в канал: {error}")
+        # channel_message_id остаётся пустым, публикацию повторит следующий resume_pending; заказчику пишем один раз.
+        if self.on_failed and row.id not in self._notified:
+            self._notified.add(row.id)
+            await self.on_failed(row.customer_id, row.id)
+
+    async def _edit_batch(self, order_ids: set[int]):
+        async with self.session_factory() as session:
+            rows = (await session.execute(
+                select(
+                    Order.id, Order.channel_message_id, Order.status, Order.title,
+                    Order.price, Order.description, Category.name.label("category_name")
+                )
+                .outerjoin(Category, Category.id == Order.category_id)
+                .where(Order.id.in_(order_ids), Order.channel_message_id > 0)
+                .order_by(Order.id)
+            )).all()
+        for position, row in enumerate(rows):
+            text = format_channel_post(
+                row.id, row.title, row.category_name or "Без категории", row.price, row.description, row.status
+            )
+            try:
+                await self.bot.edit_message_text(text, chat_id=self.chat_id, message_id=row.channel_message_id, reply_markup=None)
+            except TelegramRetryAfter as e:
+                # Недоправленные посты вернутся в очередь и сольются с новыми изменениями.
+                self._dirty.update(pending.id for pending in rows[position:])
+                await asyncio.sleep(e.retry_after)
+                return
+            except TelegramBadRequest as e:
+                if not any(error in e.message.lower() for error in IGNORED_EDIT_ERRORS):
+                    logging.warning(f"Пост заказа {row.id} в канале не обновлён: {e.message}")
+            await asyncio.sleep(self.interval)
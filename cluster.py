@@ -0,0 +1,117 @@
+import os
+import socket
+import asyncio
+import hashlib
+import logging
+from datetime import timedelta
+
+from sqlalchemy import select, delete, func, text
+from sqlalchemy.dialects.postgresql import insert
+
+from db_models import WorkerLease
+
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+HEARTBEAT_SECONDS = int(os.getenv("WORKER_HEARTBEAT_SECONDS", "30"))
+# Процесс, не продлевавший аренду дольше этого срока, считается выбывшим, и его кошельки расходятся по остальным.
+LEASE_TTL = timedelta(seconds=int(os.getenv("WORKER_LEASE_TTL", "90")))
+# BOT_POLLING=0 — процесс только выполняет фоновые задачи и никогда не получает обновления Telegram.
+BOT_POLLING = os.getenv("BOT_POLLING", "1") != "0"
+POLLING_LOCK_KEY = 72_430_006
+
+
+def _weight(member: str, key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(f"{member}:{key}".encode(), digest_size=8).digest(), "big")
+
+
+def owner(key: str, members: list[str]) -> str:
+    """
+    Rendezvous-хеширование: ключ достаётся участнику с наибольшим весом. При уходе участника
+    переезжают только его ключи, при добавлении — примерно 1/N ключей остальных.
+    """
+    return max(members, key=lambda member: _weight(member, key))
+
+
+class Membership:
+    """Состав живых процессов бота по арендам в worker_leases."""
+
+    def __init__(self, session_factory, worker_id: str = WORKER_ID, ttl: timedelta = LEASE_TTL):
+        self.session_factory = session_factory
+        self.worker_id = worker_id
+        self.ttl = ttl
+        self.members = [worker_id]
+
+    async def heartbeat(self):
+        async with self.session_factory() as session:
+            await session.execute(
+                insert(WorkerLease)
+                .values(worker_id=self.worker_id, heartbeat_at=func.now())
+                .on_conflict_do_update(index_elements=[WorkerLease.worker_id], set_={"heartbeat_at": func.now()})
+            )
+            await session.execute(delete(WorkerLease).where(WorkerLease.heartbeat_at < func.now() - self.ttl))
+            members = list(await session.scalars(select(WorkerLease.worker_id).order_by(WorkerLease.worker_id)))
+            await session.commit()
+        self.members = members or [self.worker_id]
+
+    async def leave(self):
+        async with self.session_factory() as session:
+            await session.execute(delete(WorkerLease).where(WorkerLease.worker_id == self.worker_id))
+            await session.commit()
+
+    def owns(self, key: str) -> bool:
+        return owner(key, self.members) == self.worker_id
+
+
+class PollingLeader:
+    """
+    Telegram отдаёт getUpdates только одному клиенту, второй получает TelegramConflictError.
+    Обновления получает процесс, удерживающий advisory-блокировку POLLING_LOCK_KEY; остальные
+    с BOT_POLLING=1 работают как фоновые и раз в retry_seconds пробуют её взять. Блокировка
+    живёт вместе с соединением, поэтому после падения ведущего её сразу подхватывает следующий.
+    """
+
+    def __init__(self, engine, retry_seconds: float = HEARTBEAT_SECONDS):
+        self.engine = engine
+        self.retry_seconds = retry_seconds
+        self._conn = None
+        self._watch = None
+
+    async def acquire(self) -> bool:
+        """Ждёт блокировку; возвращает False, если пришлось ждать (процесс сменил ведущего)."""
+        first_attempt = True
+        while True:
+            conn = await self.engine.connect()
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            if await conn.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": POLLING_LOCK_KEY}):
+                self._conn = conn
+                return first_attempt
+            await conn.close()
+            if first_attempt:
+                logging.info("Обновления Telegram получает другой процесс, этот работает как фоновый")
+            first_attempt = False
+            await asyncio.sleep(self.retry_seconds)
+
+    def watch(self, on_lost):
+        """Проверяет соединение с блокировкой; при его потере вызывает on_lost, чтобы не опрашивать Telegram вдвоём."""
+        self._watch = asyncio.create_task(self._check(on_lost))
+
+    async def _check(self, on_lost):
+        while True:
+            await asyncio.sleep(self.retry_seconds)
+            try:
+                await self._conn.execute(text("SELECT 1"))
+            except Exception as e:
+                logging.error(f"Потеряно соединение с блокировкой опроса Telegram: {e}")
+                await on_lost()
+                return
+
+    async def release(self):
+        if self._watch:
+            self._watch.cancel()
+        if self._conn is not None:
+            try:
+                await self._conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": POLLING_LOCK_KEY})
+            except Exception as e:
+                # Соединение уже разорвано, а с ним снята и блокировка.
+                logging.warning(f"Блокировка опроса Telegram не снята явно: {e}")
+            await self._conn.close()
+            self._conn = None
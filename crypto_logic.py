@@ -1,9 +1,18 @@
 import os
 import httpx
-from decimal import Decimal
+from contextlib import contextmanager
+
+from metrics import observe_external
+from money import Money
+from tracing import child_span
 
 USDT_CONTRACT_ADDRESS = "TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t"
 
+@contextmanager
+def external_call(service: str, operation: str, url: str):
+    with child_span(f"{service} {operation}", **{"http.url": url, "peer.service": service}), observe_external(service, operation):
+        yield
+
 async def generate_new_wallet():
     API_KEY = os.getenv("NOW_PAYMENTS_API_KEY") 
     API_URL = "https://api.nowpayments.io/v1/payment"
@@ -19,11 +28,12 @@ async def generate_new_wallet():
         "ipn_callback_url": "https://nowpayments.io"
     }
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(API_URL, headers=headers, json=payload)
-            response.raise_for_status()
-            data = response.json()
-            return data.get('pay_address')
+        with external_call("nowpayments", "create_payment", API_URL):
+            async with httpx.AsyncClient() as client:
+                response = await client.post(API_URL, headers=headers, json=payload)
+                response.raise_for_status()
+        data = response.json()
+        return data.get('pay_address')
     except httpx.HTTPStatusError as e:
         print(f"Ошибка API при генерации кошелька: {e.response.status_code} - {e.response.text}")
         return None
@@ -41,26 +51,28 @@ async def check_new_transactions(wallet_address: str):
     }
     new_transactions = []
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(api_url, params=params)
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("success") and data.get("data"):
-                    for tx in data["data"]:
-                        amount = Decimal(tx.get("value", "0")) / Decimal("1000000")
-                        tx_info = {
-                            "txid": tx.get("transaction_id"),
-                            "amount": amount,
-                            "from": tx.get("from"),
-                        }
-                        new_transactions.append(tx_info)
+        with external_call("trongrid", "trc20_transactions", api_url):
+            async with httpx.AsyncClient() as client:
+                response = await client.get(api_url, params=params)
+                response.raise_for_status()
+        data = response.json()
+        if data.get("success") and data.get("data"):
+            for tx in data["data"]:
+                # value — целое число минимальных единиц USDT (10^-6), оно же микро-USDT.
+                amount = Money(int(tx.get("value", "0")))
+                tx_info = {
+                    "txid": tx.get("transaction_id"),
+                    "amount": amount,
+                    "from": tx.get("from"),
+                }
+                new_transactions.append(tx_info)
     except Exception as e:
         print(f"Ошибка при проверке транзакций для {wallet_address}: {e}")
     
     return new_transactions
 
 
-async def create_payout(address: str, amount: Decimal):
+async def create_payout(address: str, amount: Money):
     """Создает выплату на указанный адрес через API NowPayments."""
     PAYOUT_API_URL = "https://api.nowpayments.io/v1/payout"
     API_KEY = os.getenv("NOW_PAYMENTS_API_KEY")
@@ -76,20 +88,21 @@ async def create_payout(address: str, amount: Decimal):
             {
                 "address": address,
                 "currency": "USDTTRC20",
-                "amount": str(amount)
+                "amount": str(amount.to_decimal())
             }
         ]
     }
 
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(PAYOUT_API_URL, headers=headers, json=payload)
-            response.raise_for_status()
-            data = response.json()
-            if data.get("payouts") and data["payouts"][0].get("batch_id"):
-                return True, data["payouts"][0]["batch_id"]
-            else:
-                return False, data.get("message", "Неизвестная ошибка API")
+        with external_call("nowpayments", "payout", PAYOUT_API_URL):
+            async with httpx.AsyncClient() as client:
+                response = await client.post(PAYOUT_API_URL, headers=headers, json=payload)
+                response.raise_for_status()
+        data = response.json()
+        if data.get("payouts") and data["payouts"][0].get("batch_id"):
+            return True, data["payouts"][0]["batch_id"]
+        else:
+            return False, data.get("message", "Неизвестная ошибка API")
     except httpx.HTTPStatusError as e:
         error_message = e.response.json().get("message", f"HTTP {e.response.status_code}")
         print(f"Ошибка API при создании выплаты: {error_message}")
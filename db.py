@@ -0,0 +1,92 @@
+import os
+import time
+import threading
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+def _build_url(host: str | None = None, port: str | None = None) -> str:
+    return (
+        f"postgresql+asyncpg://{os.getenv('DB_USER')}:{os.getenv('DB_PASS')}"
+        f"@{host or os.getenv('DB_HOST')}:{port or os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
+    )
+
+
+# DATABASE_URL целиком заменяет DB_* (например, для бенчмарков на отдельной базе).
+DB_URL = os.getenv("DATABASE_URL") or _build_url()
+DB_REPLICA_URL = _build_url(os.getenv("DB_REPLICA_HOST"), os.getenv("DB_REPLICA_PORT")) if os.getenv("DB_REPLICA_HOST") else None
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500"))
+
+
+class PoolWaitStats:
+    """Накопительная статистика ожидания свободного соединения в пуле."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.timeouts = 0
+
+    def observe(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.count += 1
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+
+pool_wait_stats = PoolWaitStats()
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            pool_wait_stats.observe(time.perf_counter() - started, timed_out=True)
+            raise
+        pool_wait_stats.observe(time.perf_counter() - started)
+        return connection
+
+
+def make_engine(url: str):
+    url = make_url(url)
+    connect_args = {}
+    if url.drivername == "postgresql+asyncpg":
+        # Кэш подготовленных выражений: на стороне диалекта SQLAlchemy (параметр URL) и на стороне asyncpg.
+        url = url.update_query_dict({"prepared_statement_cache_size": str(DB_STATEMENT_CACHE_SIZE)})
+        connect_args["statement_cache_size"] = DB_STATEMENT_CACHE_SIZE
+    return create_async_engine(
+        url,
+        poolclass=TimedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+        connect_args=connect_args,
+    )
+
+
+engine = make_engine(DB_URL)
+async_session = async_sessionmaker(engine, expire_on_commit=False)
+
+# Сессии только для чтения (лента, профили) уходят на реплику, если она настроена.
+replica_engine = make_engine(DB_REPLICA_URL) if DB_REPLICA_URL else engine
+read_session = async_sessionmaker(replica_engine, expire_on_commit=False)
+
+
+async def dispose_engines():
+    await engine.dispose()
+    if replica_engine is not engine:
+        await replica_engine.dispose()
@@ -1,11 +1,13 @@
 import datetime
 from sqlalchemy import (
     Column, Integer, String, DateTime, Numeric,
-    BigInteger, ForeignKey, Text, Boolean
+    BigInteger, ForeignKey, Text, Boolean, Index, UniqueConstraint
 )
 from sqlalchemy.orm import declarative_base, relationship
 from datetime import UTC
 
+from money import MoneyType
+
 Base = declarative_base()
 
 class Category(Base):
@@ -19,14 +21,20 @@ class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True)
     telegram_id = Column(BigInteger, unique=True, nullable=False, index=True)
-    username = Column(String(32), nullable=True)
-    balance = Column(Numeric(10, 2), default=0.00)
+    username = Column(String(32), nullable=True, index=True)
+    balance = Column(MoneyType, default=0)
     wallet_address = Column(String(64), nullable=True, unique=True)
     rating = Column(Numeric(3, 2), default=5.00)
     reviews_count = Column(Integer, default=0)
     registration_date = Column(DateTime(timezone=True), default=lambda: datetime.datetime.now(UTC))
     is_blocked = Column(Boolean, default=False, nullable=False)
     vip_expires_at = Column(DateTime(timezone=True), nullable=True)
+    vip_reminded_for = Column(DateTime(timezone=True), nullable=True)
+    active_orders_count = Column(Integer, default=0, nullable=False)
+    active_offers_count = Column(Integer, default=0, nullable=False)
+    # False, если пользователь заблокировал бота; снова True при любом его сообщении.
+    is_active = Column(Boolean, default=True, nullable=False)
+    last_seen_at = Column(DateTime(timezone=True), nullable=True)
     created_orders = relationship("Order", foreign_keys="Order.customer_id", back_populates="customer")
     executed_orders = relationship("Order", foreign_keys="Order.executor_id", back_populates="executor")
     offers = relationship("Offer", back_populates="executor")
@@ -34,18 +42,28 @@ class User(Base):
     reviews_received = relationship("Review", foreign_keys="Review.reviewee_id", back_populates="reviewee")
     financial_transactions = relationship("FinancialTransaction", back_populates="user")
 
+    __table_args__ = (
+        Index("ix_users_vip_expires_at", "vip_expires_at", postgresql_where=vip_expires_at.isnot(None)),
+    )
+
 
 class Order(Base):
     __tablename__ = "orders"
     id = Column(Integer, primary_key=True)
     title = Column(String(100), nullable=False)
     description = Column(String(1000), nullable=True)
-    price = Column(Numeric(10, 2), nullable=False)
+    price = Column(MoneyType, nullable=False)
     status = Column(String(20), default="open", nullable=False)
-    customer_id = Column(BigInteger, ForeignKey("users.telegram_id"), nullable=False)
-    executor_id = Column(BigInteger, ForeignKey("users.telegram_id"), nullable=True)
+    customer_id = Column(BigInteger, ForeignKey("users.telegram_id"), nullable=False, index=True)
+    executor_id = Column(BigInteger, ForeignKey("users.telegram_id"), nullable=True, index=True)
     creation_date = Column(DateTime(timezone=True), default=lambda: datetime.datetime.now(UTC))
+    status_changed_at = Column(DateTime(timezone=True), default=lambda: datetime.datetime.now(UTC))
     category_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
+    # Пост заказа в ORDER_CHANNEL_ID, правится при закрытии заказа. NULL — пост ещё не опубликован,
+    # 0 — опубликован до появления столбца, номер неизвестен.
+    channel_message_id = Column(BigInteger, nullable=True)
+    # Медиа заказов, побывавших в споре, не удаляются по сроку хранения (media_store.py).
+    was_disputed = Column(Boolean, default=False, nullable=False)
     category = relationship("Category", back_populates="orders")
     customer = relationship("User", foreign_keys=[customer_id], back_populates="created_orders")
     executor = relationship("User", foreign_keys=[executor_id], back_populates="executed_orders")
@@ -53,6 +71,13 @@ class Order(Base):
     chat_messages = relationship("ChatMessage", back_populates="order", cascade="all, delete-orphan")
     reviews = relationship("Review", back_populates="order", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("ix_orders_status_creation_date", "status", "creation_date"),
+        Index("ix_orders_status_status_changed_at", "status", "status_changed_at"),
+        Index("ix_orders_customer_id_id", "customer_id", "id"),
+        Index("ix_orders_executor_id_id", "executor_id", "id"),
+    )
+
 
 class Offer(Base):
     __tablename__ = "offers"
@@ -63,25 +88,36 @@ class Offer(Base):
     order = relationship("Order", back_populates="offers")
     executor = relationship("User", back_populates="offers")
 
+    __table_args__ = (
+        Index("ix_offers_order_id_executor_id", "order_id", "executor_id"),
+        Index("ix_offers_order_id_id", "order_id", "id"),
+    )
+
 
 class ChatMessage(Base):
+    # В Postgres таблица секционирована по месяцам timestamp, и PK там (id, timestamp) — см. миграцию v0016.
     __tablename__ = "chat_messages"
     id = Column(Integer, primary_key=True)
     order_id = Column(Integer, ForeignKey("orders.id"), nullable=False)
     sender_id = Column(BigInteger, nullable=False)
-    timestamp = Column(DateTime(timezone=True), default=lambda: datetime.datetime.now(UTC))
+    timestamp = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.datetime.now(UTC))
     content_type = Column(String(20), nullable=False)
     text_content = Column(Text, nullable=True)
     file_path = Column(String(255), nullable=True)
     order = relationship("Order", back_populates="chat_messages")
 
+    __table_args__ = (
+        Index("ix_chat_messages_order_id_timestamp", "order_id", "timestamp"),
+        Index("ix_chat_messages_file_path", "file_path", postgresql_where=file_path.isnot(None)),
+    )
+
 
 class Review(Base):
     __tablename__ = "reviews"
     id = Column(Integer, primary_key=True)
     order_id = Column(Integer, ForeignKey("orders.id"), nullable=False)
     reviewer_id = Column(BigInteger, ForeignKey("users.telegram_id"), nullable=False)
-    reviewee_id = Column(BigInteger, ForeignKey("users.telegram_id"), nullable=False)
+    reviewee_id = Column(BigInteger, ForeignKey("users.telegram_id"), nullable=False, index=True)
     rating = Column(Integer, nullable=False)
     text = Column(Text, nullable=True)
     order = relationship("Order", back_populates="reviews")
@@ -102,11 +138,133 @@ class Setting(Base):
 
 
 class FinancialTransaction(Base):
+    # Секционирована по месяцам timestamp, как и chat_messages.
     __tablename__ = "financial_transactions"
     id = Column(Integer, primary_key=True)
     user_id = Column(BigInteger, ForeignKey("users.telegram_id"), nullable=False)
     type = Column(String(50), nullable=False)
-    amount = Column(Numeric(10, 2), nullable=False)
+    amount = Column(MoneyType, nullable=False)
     order_id = Column(Integer, nullable=True)
-    timestamp = Column(DateTime(timezone=True), default=lambda: datetime.datetime.now(UTC))
-    user = relationship("User", back_populates="financial_transactions")
\ No newline at end of file
+    timestamp = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.datetime.now(UTC))
+    user = relationship("User", back_populates="financial_transactions")
+
+    __table_args__ = (
+        Index("ix_financial_transactions_user_id_timestamp", "user_id", "timestamp"),
+    )
+
+
+class SupportTicket(Base):
+    __tablename__ = "support_tickets"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(BigInteger, ForeignKey("users.telegram_id"), nullable=False)
+    agent_id = Column(BigInteger, nullable=False)
+    status = Column(String(20), default="open", nullable=False)
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.datetime.now(UTC))
+    closed_at = Column(DateTime(timezone=True), nullable=True)
+    messages = relationship("SupportMessage", back_populates="ticket", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        Index("ix_support_tickets_user_id_status", "user_id", "status"),
+        Index("ix_support_tickets_agent_id_status", "agent_id", "status"),
+    )
+
+
+class SupportMessage(Base):
+    __tablename__ = "support_messages"
+    id = Column(Integer, primary_key=True)
+    ticket_id = Column(Integer, ForeignKey("support_tickets.id"), nullable=False)
+    sender_id = Column(BigInteger, nullable=False)
+    text = Column(Text, nullable=False)
+    # False, пока сообщение пользователя не доставлено агенту (агент офлайн или отправка не удалась).
+    delivered = Column(Boolean, default=False, nullable=False)
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.datetime.now(UTC))
+    ticket = relationship("SupportTicket", back_populates="messages")
+
+    __table_args__ = (
+        Index("ix_support_messages_ticket_id_undelivered", "ticket_id", postgresql_where=delivered.is_(False)),
+    )
+
+
+class SupportMessageLink(Base):
+    """Сообщение бота в чате агента -> тикет, чтобы ответ агента reply'ем попадал нужному пользователю."""
+    __tablename__ = "support_message_links"
+    chat_id = Column(BigInteger, primary_key=True)
+    message_id = Column(BigInteger, primary_key=True)
+    ticket_id = Column(Integer, ForeignKey("support_tickets.id"), nullable=False)
+
+
+class SupportAgent(Base):
+    __tablename__ = "support_agents"
+    telegram_id = Column(BigInteger, primary_key=True)
+    is_online = Column(Boolean, default=True, nullable=False)
+
+
+class Broadcast(Base):
+    __tablename__ = "broadcasts"
+    id = Column(Integer, primary_key=True)
+    text = Column(Text, nullable=False)
+    vip_only = Column(Boolean, default=False, nullable=False)
+    active_days = Column(Integer, nullable=True)
+    # RESTRICT: категорию сначала отвязывает detach_category, иначе сегмент молча расширился бы до всех.
+    category_id = Column(Integer, ForeignKey("categories.id", ondelete="RESTRICT"), nullable=True)
+    status = Column(String(20), default="pending", nullable=False)
+    created_by = Column(BigInteger, nullable=False)
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.datetime.now(UTC))
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    # Контрольная точка: users.id последнего обработанного получателя.
+    last_user_id = Column(Integer, default=0, nullable=False)
+    total = Column(Integer, default=0, nullable=False)
+    sent = Column(Integer, default=0, nullable=False)
+    failed = Column(Integer, default=0, nullable=False)
+    blocked = Column(Integer, default=0, nullable=False)
+    progress_chat_id = Column(BigInteger, nullable=True)
+    progress_message_id = Column(BigInteger, nullable=True)
+
+
+class CategorySubscription(Base):
+    __tablename__ = "category_subscriptions"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(BigInteger, ForeignKey("users.telegram_id"), nullable=False)
+    category_id = Column(Integer, ForeignKey("categories.id", ondelete="CASCADE"), nullable=False)
+    # NULL — граница диапазона не задана.
+    min_price = Column(MoneyType, nullable=True)
+    max_price = Column(MoneyType, nullable=True)
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.datetime.now(UTC))
+    category = relationship("Category")
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "category_id", name="uq_category_subscriptions_user_id_category_id"),
+    )
+
+
+class DepositAddress(Base):
+    __tablename__ = "deposit_addresses"
+    id = Column(Integer, primary_key=True)
+    address = Column(String(64), nullable=False, unique=True)
+    # NULL — адрес свободен и лежит в пуле.
+    user_id = Column(BigInteger, ForeignKey("users.telegram_id"), nullable=True)
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.datetime.now(UTC))
+    assigned_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_deposit_addresses_free", "id", postgresql_where=user_id.is_(None)),
+    )
+
+
+class WorkerLease(Base):
+    __tablename__ = "worker_leases"
+    worker_id = Column(String(128), primary_key=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class UnlinkedMedia(Base):
+    # Файлы, отвязанные от сообщений по сроку хранения: сборка мусора удаляет только их.
+    __tablename__ = "unlinked_media"
+    path = Column(String(255), primary_key=True)
+    unlinked_at = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.datetime.now(UTC))
+
+
+class ArchivedMedia(Base):
+    # Файлы сообщений из выгруженных секций chat_messages: на них ссылается архив, удалять их нельзя.
+    __tablename__ = "archived_media"
+    path = Column(String(255), primary_key=True)
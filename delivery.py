@@ -0,0 +1,106 @@
+import os
+import asyncio
+import logging
+
+from aiogram.exceptions import (
+    TelegramForbiddenError, TelegramRetryAfter, TelegramBadRequest, TelegramNetworkError, TelegramServerError
+)
+
+# Telegram допускает ~30 сообщений в секунду на бота; оставляем запас для ответов на обычные запросы.
+MASS_SEND_RATE = float(os.getenv("MASS_SEND_RATE", os.getenv("BROADCAST_RATE", "25")))
+MAX_ATTEMPTS = 3
+
+SENT = "sent"
+FAILED = "failed"
+BLOCKED = "blocked"
+# Ошибки BadRequest, после которых писать пользователю бессмысленно.
+UNREACHABLE_ERRORS = ("chat not found", "user is deactivated", "peer_id_invalid")
+
+
+class SendPacer:
+    """Общий темп массовых отправок (рассылки, уведомления подписчиков): каждый вызов занимает следующий слот."""
+
+    def __init__(self, rate: float = MASS_SEND_RATE):
+        self._interval = 1 / rate
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+
+    async def wait(self):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        slot = max(now, self._next_slot, self._paused_until)
+        self._next_slot = slot + self._interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def pause(self, seconds: float):
+        self._paused_until = asyncio.get_running_loop().time() + seconds
+
+
+pacer = SendPacer()
+
+
+async def deliver(bot, chat_id: int, text: str, **kwargs) -> str:
+    """Отправляет сообщение в общем темпе с повторами; возвращает SENT, BLOCKED или FAILED."""
+    for attempt in range(MAX_ATTEMPTS):
+        await pacer.wait()
+        try:
+            await bot.send_message(chat_id, text, **kwargs)
+            return SENT
+        except TelegramRetryAfter as e:
+            # Флуд-контроль касается всего бота, поэтому приостанавливаются все массовые отправки.
+            pacer.pause(e.retry_after)
+        except TelegramForbiddenError:
+            return BLOCKED
+        except TelegramBadRequest as e:
+            if any(error in e.message.lower() for error in UNREACHABLE_ERRORS):
+                return BLOCKED
+            logging.warning(f"Сообщение пользователю {chat_id} отклонено: {e.message}")
+            return FAILED
+        except (TelegramNetworkError, TelegramServerError):
+            await asyncio.sleep(2 ** attempt)
+    return FAILED
+
+
+class DeliveryQueue:
+    """
+    Очередь уведомлений с фиксированным числом воркеров. put() не ждёт отправки, поэтому
+    обработчик, породивший тысячи уведомлений, отвечает пользователю сразу.
+    """
+
+    def __init__(self, bot, workers: int = 5, maxsize: int = 100_000, on_blocked=None):
+        self.bot = bot
+        self.workers = workers
+        self.on_blocked = on_blocked
+        self._queue = asyncio.Queue(maxsize)
+        self._tasks = []
+
+    def put(self, chat_id: int, text: str, **kwargs) -> bool:
+        try:
+            self._queue.put_nowait((chat_id, text, kwargs))
+            return True
+        except asyncio.QueueFull:
+            logging.warning(f"Очередь уведомлений переполнена, сообщение для {chat_id} отброшено")
+            return False
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _worker(self):
+        while True:
+            chat_id, text, kwargs = await self._queue.get()
+            try:
+                if await deliver(self.bot, chat_id, text, **kwargs) == BLOCKED and self.on_blocked:
+                    await self.on_blocked(chat_id)
+            except Exception as e:
+                logging.error(f"Ошибка доставки уведомления пользователю {chat_id}: {e}")
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,125 @@
+import os
+import time
+import asyncio
+import logging
+
+from sqlalchemy import select, update, func, text
+from sqlalchemy.dialects.postgresql import insert
+
+from db_models import User, DepositAddress
+from crypto_logic import generate_new_wallet
+
+# Пополнение идёт, пока свободных адресов меньше нижней границы, и останавливается на верхней.
+DEPOSIT_POOL_LOW = int(os.getenv("DEPOSIT_POOL_LOW", "20"))
+DEPOSIT_POOL_HIGH = int(os.getenv("DEPOSIT_POOL_HIGH", "100"))
+DEPOSIT_POOL_BATCH_SIZE = int(os.getenv("DEPOSIT_POOL_BATCH_SIZE", "10"))
+REFILL_BACKOFF_BASE = 30
+REFILL_BACKOFF_MAX = 30 * 60
+DEPOSIT_POOL_LOCK_KEY = 72_430_005
+
+# Свободный адрес забирается и записывается пользователю одним запросом; SKIP LOCKED не даёт
+# параллельным пополнениям ждать друг друга на одной строке пула. Строка пользователя блокируется
+# до захвата адреса: второй запрос того же пользователя дождётся первого, увидит выданный адрес
+# и не заберёт из пула строку, которая осталась бы ничьей.
+_ASSIGN_ADDRESS = text("""
+    WITH owner AS (
+        SELECT telegram_id FROM users WHERE telegram_id = :user_id AND wallet_address IS NULL
+        FOR UPDATE
+    ), claimed AS (
+        UPDATE deposit_addresses SET user_id = :user_id, assigned_at = now()
+        WHERE id = (
+            SELECT id FROM deposit_addresses WHERE user_id IS NULL
+            ORDER BY id LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        AND EXISTS (SELECT 1 FROM owner)
+        RETURNING address
+    )
+    UPDATE users SET wallet_address = claimed.address
+    FROM claimed
+    WHERE users.telegram_id = :user_id AND users.wallet_address IS NULL
+    RETURNING users.wallet_address
+""")
+
+
+async def assign_address(session, user_id: int) -> str | None:
+    """Выдаёт пользователю адрес из пула; None — пул пуст."""
+    address = await session.scalar(_ASSIGN_ADDRESS, {"user_id": user_id})
+    if address is None:
+        # Адрес мог выдать параллельный запрос того же пользователя.
+        address = await session.scalar(select(User.wallet_address).where(User.telegram_id == user_id))
+    return address
+
+
+async def assign_generated_address(session, user_id: int) -> str | None:
+    """Запасной путь на случай пустого пула: адрес создаётся прямо в запросе пользователя."""
+    # Как и в _ASSIGN_ADDRESS, параллельный запрос того же пользователя ждёт здесь и не создаёт второй адрес.
+    address = await session.scalar(select(User.wallet_address).where(User.telegram_id == user_id).with_for_update())
+    if address:
+        return address
+    address = await generate_new_wallet()
+    if not address:
+        return None
+    await session.execute(
+        insert(DepositAddress).values(address=address, user_id=user_id, assigned_at=func.now()).on_conflict_do_nothing()
+    )
+    await session.execute(
+        update(User).where(User.telegram_id == user_id, User.wallet_address.is_(None)).values(wallet_address=address)
+    )
+    return await session.scalar(select(User.wallet_address).where(User.telegram_id == user_id))
+
+
+class DepositPoolRefiller:
+    """
+    Фоновое пополнение пула адресов пачками по DEPOSIT_POOL_BATCH_SIZE параллельных запросов к NowPayments.
+    После неудачной пачки следующая попытка откладывается с экспоненциально растущей паузой.
+    Пополняет один процесс за раз: остальные пропускают запуск, пока держится advisory-блокировка.
+    """
+
+    def __init__(self, engine, session_factory, low: int = DEPOSIT_POOL_LOW, high: int = DEPOSIT_POOL_HIGH,
+                 batch_size: int = DEPOSIT_POOL_BATCH_SIZE):
+        self.engine = engine
+        self.session_factory = session_factory
+        self.low = low
+        self.high = high
+        self.batch_size = batch_size
+        self._failures = 0
+        self._retry_at = 0.0
+
+    async def refill(self):
+        if time.monotonic() < self._retry_at:
+            return
+        async with self.engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            if not await conn.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": DEPOSIT_POOL_LOCK_KEY}):
+                return
+            try:
+                await self._refill()
+            finally:
+                await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": DEPOSIT_POOL_LOCK_KEY})
+
+    async def _refill(self):
+        async with self.session_factory() as session:
+            free = await session.scalar(select(func.count(DepositAddress.id)).where(DepositAddress.user_id.is_(None)))
+        if free >= self.low:
+            return
+        while free < self.high:
+            requested = min(self.batch_size, self.high - free)
+            addresses = [address for address in await asyncio.gather(*(generate_new_wallet() for _ in range(requested))) if address]
+            if addresses:
+                async with self.session_factory() as session:
+                    await session.execute(
+                        insert(DepositAddress).values([{"address": address} for address in addresses]).on_conflict_do_nothing()
+                    )
+                    await session.commit()
+                free += len(addresses)
+            if len(addresses) < requested:
+                self._back_off()
+                return
+        self._failures = 0
+
+    def _back_off(self):
+        delay = min(REFILL_BACKOFF_BASE * 2 ** self._failures, REFILL_BACKOFF_MAX)
+        self._failures += 1
+        self._retry_at = time.monotonic() + delay
+        logging.warning(f"Пул адресов пополнен не полностью, следующая попытка через {delay} с")
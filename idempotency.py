@@ -0,0 +1,107 @@
+import os
+import time
+from collections import OrderedDict
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "60"))
+
+IN_PROGRESS = "⏳ Запрос уже обрабатывается."
+DONE = "✅ Этот запрос уже выполнен."
+
+
+class ExpiringMap:
+    """Словарь с одинаковым TTL для всех ключей: порядок вставки совпадает с порядком истечения."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._items: OrderedDict = OrderedDict()
+
+    def _purge(self, now: float):
+        while self._items:
+            key, (expires_at, _) = next(iter(self._items.items()))
+            if expires_at > now:
+                break
+            del self._items[key]
+
+    def get(self, key):
+        now = time.monotonic()
+        self._purge(now)
+        item = self._items.get(key)
+        return item[1] if item else None
+
+    def set(self, key, value):
+        self._items.pop(key, None)
+        self._items[key] = (time.monotonic() + self.ttl, value)
+
+    def discard(self, key):
+        self._items.pop(key, None)
+
+
+class UpdateDeduplicationMiddleware(BaseMiddleware):
+    """Внешний middleware на dp.update: повторно доставленный update_id не обрабатывается."""
+
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL):
+        self.seen = ExpiringMap(ttl)
+
+    async def __call__(self, handler, event, data):
+        if self.seen.get(event.update_id):
+            return None
+        self.seen.set(event.update_id, True)
+        return await handler(event, data)
+
+
+class IdempotentCall:
+    """
+    Передаётся обработчику с флагом idempotent как параметр idempotency. Обработчик вызывает done(),
+    когда операция действительно выполнена; ранний выход (нехватка средств, отказ платёжного API)
+    не отмечается, и повторное нажатие снова дойдёт до обработчика.
+    """
+
+    __slots__ = ("succeeded",)
+
+    def __init__(self):
+        self.succeeded = False
+
+    def done(self):
+        self.succeeded = True
+
+
+class CallbackIdempotencyMiddleware(BaseMiddleware):
+    """
+    Для обработчиков с флагом idempotent повторное нажатие той же кнопки тем же
+    пользователем отвечается сразу, без обращения к БД и платёжным API.
+    """
+
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL):
+        self.results = ExpiringMap(ttl)
+
+    async def __call__(self, handler, event, data):
+        if not get_flag(data, "idempotent"):
+            return await handler(event, data)
+
+        message_id = event.message.message_id if event.message else None
+        key = (event.from_user.id, message_id, event.data)
+        state = self.results.get(key)
+        if state is not None:
+            return await event.answer(state)
+
+        self.results.set(key, IN_PROGRESS)
+        call = data["idempotency"] = IdempotentCall()
+        try:
+            result = await handler(event, data)
+        except Exception:
+            # Упавший запрос можно повторить.
+            self.results.discard(key)
+            raise
+        if call.succeeded:
+            self.results.set(key, DONE)
+        else:
+            self.results.discard(key)
+        return result
+
+
+def setup_idempotency(dp):
+    dp.update.outer_middleware(UpdateDeduplicationMiddleware())
+    dp.callback_query.middleware(CallbackIdempotencyMiddleware())
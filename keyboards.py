@@ -20,12 +20,14 @@ withdraw_btn = InlineKeyboardButton(text="➖ Вывести", callback_data="wi
 deals_history_btn = InlineKeyboardButton(text="📜 История сделок", callback_data="deals_history")
 finance_history_btn = InlineKeyboardButton(text="💸 История баланса", callback_data="finance_history")
 buy_vip_btn = InlineKeyboardButton(text="👑 Купить VIP", callback_data="buy_vip")
+subscriptions_btn = InlineKeyboardButton(text="🔔 Подписки на заказы", callback_data="subscriptions")
 
 
 profile_keyboard = InlineKeyboardMarkup(
     inline_keyboard=[
         [top_up_btn, withdraw_btn],
         [deals_history_btn, finance_history_btn],
+        [subscriptions_btn],
         [buy_vip_btn]
     ]
 )
\ No newline at end of file
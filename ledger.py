@@ -0,0 +1,47 @@
+from sqlalchemy import update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db_models import User, FinancialTransaction, Transaction
+from money import Money
+
+
+async def credit_balance(session: AsyncSession, user_id: int, amount: Money, tx_type: str, order_id: int | None = None):
+    """Атомарно начисляет сумму на баланс и записывает операцию. Возвращает новый баланс или None."""
+    new_balance = await session.scalar(
+        update(User)
+        .where(User.telegram_id == user_id)
+        .values(balance=User.balance + amount)
+        .returning(User.balance)
+    )
+    if new_balance is None:
+        return None
+    session.add(FinancialTransaction(user_id=user_id, type=tx_type, amount=amount, order_id=order_id))
+    return new_balance
+
+
+async def debit_balance(session: AsyncSession, user_id: int, amount: Money, tx_type: str, order_id: int | None = None):
+    """Атомарно списывает сумму, только если на балансе хватает средств. Возвращает новый баланс или None."""
+    new_balance = await session.scalar(
+        update(User)
+        .where(User.telegram_id == user_id, User.balance >= amount)
+        .values(balance=User.balance - amount)
+        .returning(User.balance)
+    )
+    if new_balance is None:
+        return None
+    session.add(FinancialTransaction(user_id=user_id, type=tx_type, amount=-amount, order_id=order_id))
+    return new_balance
+
+
+async def credit_deposit(session: AsyncSession, user_id: int, txid: str, amount: Money):
+    """
+    Зачисляет входящий перевод ровно один раз: txid записывается в той же транзакции, что и начисление,
+    и повторная обработка того же перевода (другим процессом или после сбоя) ничего не меняет.
+    """
+    claimed = await session.scalar(
+        insert(Transaction).values(txid=txid).on_conflict_do_nothing(index_elements=[Transaction.txid]).returning(Transaction.id)
+    )
+    if claimed is None:
+        return None
+    return await credit_balance(session, user_id, amount, 'deposit')
@@ -2,6 +2,7 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import os
+import html
 import asyncio
 import logging
 from decimal import Decimal
@@ -12,35 +13,67 @@ from aiogram import Bot, Dispatcher, types, F
 from aiogram.client.default import DefaultBotProperties
 from aiogram.filters import CommandStart, Command, CommandObject
 from aiogram.filters.callback_data import CallbackData
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import CallbackQuery, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.memory import MemoryStorage
 
 from datetime import datetime, timedelta, UTC 
-from sqlalchemy import select, update, func, or_
+from sqlalchemy import select, update, delete, func, or_
 from sqlalchemy.orm import joinedload
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
+from db import engine, async_session, read_session, dispose_engines, pool_wait_stats
+from migrations import pending_migrations
 from db_models import (
-    Base, User, Transaction, Order, Offer,
-    ChatMessage, Review, FinancialTransaction, Setting,
-    Category
+    User, Order, Offer,
+    ChatMessage, Review, FinancialTransaction, Setting, SupportTicket, CategorySubscription, Category
 )
 from keyboards import main_menu_keyboard, profile_keyboard # Исправлен импорт
-from crypto_logic import generate_new_wallet, check_new_transactions, create_payout
-from states import OrderCreation, MakeOffer, LeaveReview, Withdrawal, AdminBalanceChange, SupportChat
+from crypto_logic import check_new_transactions, create_payout
+from ledger import credit_balance, debit_balance, credit_deposit
+from money import Money
+from metadata_cache import MetadataCache, publish_invalidation, SETTINGS
+from metrics import setup_bot_metrics, timed_job
+from tracing import setup_tracing, setup_bot_tracing, child_span
+from sql_debug import SQL_DEBUG, setup_bot_sql_debug
+from throttling import setup_throttling
+from idempotency import setup_idempotency, IdempotentCall
+from order_states import (
+    transition, expire_stale_open_orders, auto_accept_pending_orders, STATUS_EMOJI, SWEEP_BATCH_SIZE,
+    OPEN, IN_PROGRESS, PENDING_APPROVAL, COMPLETED, DISPUTE, EXPIRED
+)
+from vip import (
+    entitlements, has_order_slot, has_offer_slot, reserve_order_slot, reserve_offer_slot,
+    claim_expiry_reminders, FREE_ORDERS_LIMIT, FREE_OFFERS_LIMIT, REMINDER_BATCH_SIZE
+)
+from support import SupportDesk, SUPPORT_AGENT_IDS, SUPPORT_DIGEST_MINUTES, OPEN as SUPPORT_OPEN
+from broadcast import (
+    BroadcastRunner, create_broadcast, cancel_broadcast, parse_segment, format_progress, setup_activity_tracking
+)
+from delivery import DeliveryQueue
+from channel_posts import ChannelPosts
+from deposit_pool import DepositPoolRefiller, assign_address, assign_generated_address
+from cluster import Membership, PollingLeader, HEARTBEAT_SECONDS, BOT_POLLING
+from partitions import maintain_partitions
+from message_templates import orders_feed, order_line, deal_line, public_profile_header, own_profile_header, admin_profile_card
+from media_store import store_media, collect_media
+from subscriptions import SubscriptionIndex, SUBSCRIPTIONS_LIMIT, parse_price_range, format_price_range, unsubscribe_user
+from states import OrderCreation, MakeOffer, LeaveReview, Withdrawal, AdminBalanceChange, SupportChat, SubscriptionSetup
 
 logging.basicConfig(level=logging.INFO)
 PAGE_SIZE = 3
-DB_URL = f"postgresql+asyncpg://{os.getenv('DB_USER')}:{os.getenv('DB_PASS')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
+OFFERS_PAGE_SIZE = 5
+HISTORY_PAGE_SIZE = 10
 ADMIN_ID = int(os.getenv("ADMIN_ID"))
 LOG_CHANNEL_ID = int(os.getenv("LOG_CHANNEL_ID"))
 ORDER_CHANNEL_ID = os.getenv("ORDER_CHANNEL_ID")
-
-engine = create_async_engine(DB_URL)
-async_session = async_sessionmaker(engine, expire_on_commit=False)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9101"))
+# Пауза между массовыми уведомлениями, чтобы не упираться в лимиты Telegram (~30 сообщений/с).
+NOTIFY_DELAY = 0.05
+# Запас до лимита Telegram в 4096 символов на заголовок тикета и HTML-разметку.
+SUPPORT_MESSAGE_LIMIT = 3500
 
 # --- Настройка FSM хранилища и бота ---
 storage = MemoryStorage()
@@ -49,8 +82,8 @@ bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
 dp = Dispatcher(storage=storage)
 
 VIP_PLANS = {
-    30: Decimal("5.00"),  # 30 дней за 5 USDT
-    90: Decimal("12.00"), # 90 дней за 12 USDT
+    30: Money.parse("5.00"),  # 30 дней за 5 USDT
+    90: Money.parse("12.00"), # 90 дней за 12 USDT
 }
 
 class OrderCallback(CallbackData, prefix="order"):
@@ -66,15 +99,59 @@ class ReviewCallback(CallbackData, prefix="review"):
 class AdminCallback(CallbackData, prefix="admin"):
     action: str
     user_id: int
+class OffersPage(CallbackData, prefix="offers"):
+    order_id: int
+    page: int = 0
+    rating: Decimal | None = None
+    after_id: int = 0
+class SupportCallback(CallbackData, prefix="support"):
+    action: str
+    ticket_id: int
 class Paginator(CallbackData, prefix="pag"):
     action: str
     page: int
+class HistoryPage(CallbackData, prefix="hist"):
+    view: str
+    kind: str = "all"
+    page: int = 0
+    # Курсор — (время, id) последней показанной строки; время в микросекундах от эпохи.
+    # Заказы листаются только по id: время смены статуса меняется, пока пользователь листает.
+    before_ts: int = 0
+    before_id: int = 0
 class VIPCallback(CallbackData, prefix="vip"):
     action: str
     days: int
 class CategoryCallback(CallbackData, prefix="category"):
     action: str # 'select'
     category_id: int
+class SubscriptionCallback(CallbackData, prefix="sub"):
+    action: str # 'add', 'category', 'delete'
+    category_id: int = 0
+
+def build_categories_keyboard(categories: list):
+    return types.InlineKeyboardMarkup(inline_keyboard=[
+        [types.InlineKeyboardButton(text=cat.name, callback_data=CategoryCallback(action="select", category_id=cat.id).pack())]
+        for cat in categories
+    ])
+
+metadata = MetadataCache(build_categories_keyboard)
+support = SupportDesk(SUPPORT_AGENT_IDS or [ADMIN_ID])
+broadcasts = BroadcastRunner(bot, engine, async_session, on_progress=lambda broadcast: report_broadcast_progress(broadcast))
+subscription_index = SubscriptionIndex()
+channel_posts = ChannelPosts(
+    bot, ORDER_CHANNEL_ID, async_session,
+    offer_keyboard=lambda order_id: offer_keyboard(order_id),
+    on_failed=lambda customer_id, order_id: report_channel_failure(customer_id, order_id),
+)
+deposit_pool = DepositPoolRefiller(engine, async_session)
+membership = Membership(async_session)
+polling_leader = PollingLeader(engine)
+notifications = DeliveryQueue(bot, on_blocked=lambda user_id: drop_unreachable_subscriber(user_id))
+
+vip_plans_keyboard = types.InlineKeyboardMarkup(inline_keyboard=[
+    [types.InlineKeyboardButton(text=f"{days} дней - {price:.2f} USDT", callback_data=VIPCallback(action="buy", days=days).pack())]
+    for days, price in VIP_PLANS.items()
+])
 
 def admin_only(func):
     @wraps(func)
@@ -107,27 +184,96 @@ def block_check(func):
         return await func(event, *args, **kwargs)
     return wrapper
 
-async def create_tables():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+async def check_schema() -> bool:
+    pending = await pending_migrations(engine)
+    for version, module in pending:
+        logging.critical(f"Не применена миграция {version:04d}: {module.DESCRIPTION}")
+    return not pending
 
+@timed_job("check_payments")
 async def check_payments():
-    async with async_session() as session:
-        users_with_wallets = await session.execute(select(User).where(User.wallet_address.isnot(None)))
-        for user in users_with_wallets.scalars().all():
-            new_transactions = await check_new_transactions(user.wallet_address)
+    # Каждый процесс проверяет только свою долю кошельков. Во время перераспределения кошелёк
+    # могут проверить двое, но credit_deposit зачисляет перевод с данным txid только один раз.
+    async with read_session() as session:
+        wallets = (await session.execute(
+            select(User.telegram_id, User.wallet_address).where(User.wallet_address.isnot(None))
+        )).all()
+    for user_id, wallet_address in wallets:
+        if not membership.owns(wallet_address): continue
+        new_transactions = await check_new_transactions(wallet_address)
+        if not new_transactions: continue
+        credited = []
+        async with async_session() as session:
             for tx in new_transactions:
-                existing_tx = await session.execute(select(Transaction).where(Transaction.txid == tx['txid']))
-                if existing_tx.scalar_one_or_none(): continue
-                user.balance += tx['amount']
-                session.add(FinancialTransaction(user_id=user.telegram_id, type='deposit', amount=tx['amount']))
-                new_tx_record = Transaction(txid=tx['txid'])
-                session.add(new_tx_record)
-                try:
-                    await bot.send_message(user.telegram_id, f"✅ Ваш баланс пополнен на <b>{tx['amount']:.2f} USDT</b>!")
-                except Exception as e:
-                    logging.error(f"Не удалось отправить уведомление о пополнении пользователю {user.telegram_id}: {e}")
-        await session.commit()
+                if await credit_deposit(session, user_id, tx['txid'], tx['amount']) is not None:
+                    credited.append(tx['amount'])
+            await session.commit()
+        for amount in credited:
+            try:
+                await bot.send_message(user_id, f"✅ Ваш баланс пополнен на <b>{amount:.2f} USDT</b>!")
+            except Exception as e:
+                logging.error(f"Не удалось отправить уведомление о пополнении пользователю {user_id}: {e}")
+
+@timed_job("sweep_orders")
+async def sweep_orders():
+    # Каждая пачка — отдельная короткая транзакция; уведомления уходят уже после коммита.
+    expired, accepted = [], []
+    while True:
+        async with async_session() as session:
+            batch = await expire_stale_open_orders(session)
+            await session.commit()
+        expired.extend(batch)
+        channel_posts.mark_closed([order.id for order in batch])
+        if len(batch) < SWEEP_BATCH_SIZE: break
+    commission_percent = Decimal(await metadata.setting("commission_percent", "0"))
+    while True:
+        async with async_session() as session:
+            batch = await auto_accept_pending_orders(session, commission_percent)
+            await session.commit()
+        accepted.extend(batch)
+        if len(batch) < SWEEP_BATCH_SIZE: break
+
+    if expired or accepted:
+        logging.info(f"Просрочено заказов: {len(expired)}, автоматически принято работ: {len(accepted)}")
+    for order in expired:
+        refund_info = f" Сумма {order.price:.2f} USDT возвращена на баланс." if order.price > 0 else ""
+        await notify(order.customer_id, f"⚫️ Заказ №{order.id} ('{order.title}') закрыт: исполнитель так и не был выбран.{refund_info}")
+    for order in accepted:
+        await notify(order.customer_id, f"✅ Работа по заказу №{order.id} ('{order.title}') принята автоматически: срок проверки истёк.")
+        await notify(order.executor_id, f"🎉 Работа по заказу №{order.id} ('{order.title}') принята автоматически.\n"
+                                        f"{order.payout:.2f} USDT зачислены на ваш баланс.")
+
+@timed_job("maintain_partitions")
+async def run_partition_maintenance():
+    await maintain_partitions(engine)
+
+@timed_job("collect_media")
+async def run_media_collection():
+    await collect_media(engine)
+
+@timed_job("refill_deposit_addresses")
+async def refill_deposit_addresses():
+    await deposit_pool.refill()
+
+@timed_job("remind_vip_expiry")
+async def remind_vip_expiry():
+    reminders = []
+    while True:
+        async with async_session() as session:
+            batch = await claim_expiry_reminders(session)
+            await session.commit()
+        reminders.extend(batch)
+        if len(batch) < REMINDER_BATCH_SIZE: break
+    for user_id, expires_at in reminders:
+        await notify(user_id, f"👑 Ваш VIP-статус истекает {expires_at.strftime('%d.%m.%Y')}.\n"
+                              "Продлите его в профиле, чтобы сохранить безлимитные заказы и отклики.")
+
+async def notify(user_id: int, text: str):
+    try:
+        await bot.send_message(user_id, text)
+    except Exception as e:
+        logging.error(f"Не удалось отправить уведомление пользователю {user_id}: {e}")
+    await asyncio.sleep(NOTIFY_DELAY)
 
 def create_pagination_keyboard(page: int, total_pages: int):
     buttons = []
@@ -144,34 +290,12 @@ def create_pagination_keyboard(page: int, total_pages: int):
         return None
     return types.InlineKeyboardMarkup(inline_keyboard=[buttons])
 
-async def format_orders_page(orders: list):
-    if not orders:
-        return "На данный момент нет доступных заказов. Загляните позже!"
-    text = "<b>🔥 Доступные заказы:</b>\n\n"
-    for order in orders:
-        customer_username = f"@{order.customer.username}" if order.customer.username else "Скрыт"
-        category_name = order.category.name if order.category else "Без категории" # Получаем имя категории
-        text += (f"<b>Заказ №{order.id}</b> | {order.title}\n"
-                 f"<b>Категория:</b> {category_name}\n"
-                 f"<b>Цена:</b> {order.price:.2f} USDT\n"
-                 f"<b>Заказчик:</b> {customer_username}\n"
-                 f"<i>{order.description[:100]}...</i>\n"
-                 f"➡️ /order {order.id} - для деталей и отклика\n\n")
-    return text
-
 async def show_user_profile(message_or_callback: types.Message | types.CallbackQuery, user_id: int):
     async with async_session() as session:
         user = await session.scalar(select(User).where(User.telegram_id == user_id))
         if not user:
             return await message_or_callback.answer(f"Пользователь с ID '{user_id}' не найден.")
-        status = "🔴 Заблокирован" if user.is_blocked else "🟢 Активен"
-        user_info_text = (f"<b>👤 Информация о пользователе:</b>\n\n"
-                          f"<b>ID:</b> <code>{user.telegram_id}</code>\n"
-                          f"<b>Username:</b> @{user.username if user.username else 'N/A'}\n"
-                          f"<b>Баланс:</b> {user.balance:.2f} USDT\n"
-                          f"<b>Рейтинг:</b> {user.rating:.2f} ⭐ ({user.reviews_count} отзывов)\n"
-                          f"<b>Статус:</b> {status}\n"
-                          f"<b>Дата регистрации:</b> {user.registration_date.strftime('%Y-%m-%d %H:%M')}")
+        user_info_text = admin_profile_card(user)
         block_action = "unblock" if user.is_blocked else "block"
         block_text = "Разблокировать" if user.is_blocked else "Заблокировать"
         admin_keyboard = types.InlineKeyboardMarkup(inline_keyboard=[
@@ -190,6 +314,10 @@ async def handle_start(message: types.Message, state: FSMContext, command: Comma
     await state.clear()
     
     if command and command.args and command.args.startswith("offer_"):
+        order_id = command.args.removeprefix("offer_")
+        if order_id.isdigit() and channel_posts.is_closed(int(order_id)):
+            await message.answer("❌ Этот заказ уже закрыт и не принимает отклики.")
+            return
         async with async_session() as session:
             user = await session.scalar(select(User).where(User.telegram_id == message.from_user.id))
             if not user:
@@ -198,12 +326,9 @@ async def handle_start(message: types.Message, state: FSMContext, command: Comma
                 await session.commit()
                 return
 
-            is_vip = user.vip_expires_at and user.vip_expires_at > datetime.now(UTC)
-            if not is_vip:
-                offers_count = await session.scalar(select(func.count(Offer.id)).where(Offer.executor_id == message.from_user.id))
-                if offers_count >= 3:
-                    await message.answer("❌ Вы достигли лимита на отклики (10).")
-                    return
+            if not await has_offer_slot(session, message.from_user.id):
+                await message.answer(f"❌ Вы достигли лимита активных откликов ({FREE_OFFERS_LIMIT}).")
+                return
         try:
             order_id = int(command.args.split("_")[1])
             await state.set_state(MakeOffer.enter_message)
@@ -247,7 +372,8 @@ async def get_stats(message: types.Message):
         completed_orders = await session.scalar(select(func.count(Order.id)).where(Order.status == "completed"))
         
         hold_amount_res = await session.scalar(select(func.sum(Order.price)).where(Order.status == "in_progress"))
-        hold_amount = hold_amount_res or Decimal("0.00")
+        hold_amount = hold_amount_res or Money(0)
+        avg_pool_wait_ms = pool_wait_stats.total_seconds / pool_wait_stats.count * 1000 if pool_wait_stats.count else 0
 
         stats_text = (
             "<b>📊 Статистика бота:</b>\n\n"
@@ -258,7 +384,10 @@ async def get_stats(message: types.Message):
             f"  - 🔴 В споре: {dispute_orders}\n"
             f"  - ⚪️ Завершенные: {completed_orders}\n\n"
             f"<b>Финансы:</b>\n"
-            f"  - 💰 Зарезервировано в сделках: {hold_amount:.2f} USDT"
+            f"  - 💰 Зарезервировано в сделках: {hold_amount:.2f} USDT\n\n"
+            f"<b>Пул соединений БД:</b>\n"
+            f"  - ⏱ Ожидание: среднее {avg_pool_wait_ms:.1f} мс, максимум {pool_wait_stats.max_seconds * 1000:.1f} мс\n"
+            f"  - ⛔️ Таймауты: {pool_wait_stats.timeouts}"
         )
         await message.answer(stats_text)
 
@@ -266,28 +395,15 @@ async def get_stats(message: types.Message):
 @block_check
 async def order_creation_start(message: types.Message, state: FSMContext):
     async with async_session() as session:
-        user = await session.scalar(select(User).where(User.telegram_id == message.from_user.id))
-        is_vip = user.vip_expires_at and user.vip_expires_at > datetime.now(UTC)
-        if not is_vip:
-            orders_count = await session.scalar(
-                select(func.count(Order.id)).where(Order.customer_id == message.from_user.id)
+        if not await has_order_slot(session, message.from_user.id):
+            return await message.answer(
+                f"❌ Вы достигли лимита активных заказов ({FREE_ORDERS_LIMIT}).\n"
+                "Чтобы снять ограничения, приобретите VIP-статус."
             )
-            if orders_count >= 10:
-                return await message.answer(
-                    "❌ Вы достигли лимита на создание заказов (10).\n"
-                    "Чтобы снять ограничения, приобретите VIP-статус."
-                )
-
-        categories_result = await session.execute(select(Category).order_by(Category.name))
-        categories = categories_result.scalars().all()
-        if not categories:
-            return await message.answer("Категории еще не созданы. Администратор скоро их добавит.")
-
-    buttons = [
-        [types.InlineKeyboardButton(text=cat.name, callback_data=CategoryCallback(action="select", category_id=cat.id).pack())]
-        for cat in categories
-    ]
-    keyboard = types.InlineKeyboardMarkup(inline_keyboard=buttons)
+
+    categories, keyboard = await metadata.categories()
+    if not categories:
+        return await message.answer("Категории еще не созданы. Администратор скоро их добавит.")
     
     await state.set_state(OrderCreation.enter_category)
     await message.answer("Пожалуйста, выберите категорию для вашего заказа:", reply_markup=keyboard)
@@ -316,7 +432,7 @@ async def enter_description(message: types.Message, state: FSMContext):
 @block_check
 async def enter_price(message: types.Message, state: FSMContext):
     try:
-        price = Decimal(message.text)
+        price = Money.parse(message.text)
         if price < 0:
             await message.answer("Цена не может быть отрицательной. Попробуйте еще раз.")
             return
@@ -327,14 +443,14 @@ async def enter_price(message: types.Message, state: FSMContext):
     await state.update_data(price=price)
     order_data = await state.get_data()
     
-    async with async_session() as session:
-        category = await session.get(Category, order_data['category_id'])
-        category_name = category.name if category else "Не выбрана"
-        await state.update_data(category_name=category_name)
+    categories, _ = await metadata.categories()
+    category_name = next((cat.name for cat in categories if cat.id == order_data['category_id']), "Не выбрана")
+    await state.update_data(category_name=category_name)
 
+    async with async_session() as session:
         user = await session.scalar(select(User).where(User.telegram_id == message.from_user.id))
         if not user or (price > 0 and user.balance < price):
-            balance = user.balance if user else Decimal("0.00")
+            balance = user.balance if user else Money(0)
             await message.answer(f"На вашем балансе недостаточно средств ({balance:.2f} USDT). Пожалуйста, пополните баланс и попробуйте снова.", reply_markup=main_menu_keyboard)
             await state.clear()
             return
@@ -350,20 +466,13 @@ async def enter_price(message: types.Message, state: FSMContext):
     await state.set_state(OrderCreation.confirm_order)
     await message.answer(text, reply_markup=confirm_keyboard)
 
-@dp.callback_query(OrderCreation.confirm_order, F.data == "order_confirm")
-async def confirm_order_creation(callback: CallbackQuery, state: FSMContext):
+@dp.callback_query(OrderCreation.confirm_order, F.data == "order_confirm", flags={"idempotent": True})
+async def confirm_order_creation(callback: CallbackQuery, state: FSMContext, idempotency: IdempotentCall | None = None):
     await callback.answer("Создаем заказ...")
     order_data = await state.get_data()
     
     async with async_session() as session:
-        price = order_data['price']
-        user = await session.scalar(select(User).where(User.telegram_id == callback.from_user.id))
-        
-        if not user or (price > 0 and user.balance < price):
-            await callback.message.edit_text("Ошибка! На вашем балансе больше недостаточно средств.")
-            await state.clear()
-            return
-
+        price = Money(order_data['price'])
         new_order = Order(
             title=order_data['title'],
             description=order_data['description'],
@@ -372,51 +481,72 @@ async def confirm_order_creation(callback: CallbackQuery, state: FSMContext):
             category_id=order_data['category_id']
         )
         session.add(new_order)
-        
-        if price > 0:
-            user.balance -= price
-            await session.flush([new_order])
-            session.add(FinancialTransaction(user_id=user.telegram_id, type='order_payment', amount=-price, order_id=new_order.id))
-        
+        await session.flush([new_order])
+
+        if not await reserve_order_slot(session, callback.from_user.id):
+            await session.rollback()
+            await callback.message.edit_text(f"❌ Вы достигли лимита активных заказов ({FREE_ORDERS_LIMIT}).")
+            await state.clear()
+            return
+
+        if price > 0 and await debit_balance(session, callback.from_user.id, price, 'order_payment', new_order.id) is None:
+            await session.rollback()
+            await callback.message.edit_text("Ошибка! На вашем балансе больше недостаточно средств.")
+            await state.clear()
+            return
+
         await session.commit()
+        if idempotency:
+            idempotency.done()
         await callback.message.edit_text(f"✅ Ваш заказ №{new_order.id} успешно создан!", reply_markup=None)
-        
-        try:
-            bot_info = await bot.get_me()
-            bot_username = bot_info.username
-            
-            keyboard = types.InlineKeyboardMarkup(inline_keyboard=[[
-                types.InlineKeyboardButton(
-                    text="🚀 Откликнуться", 
-                    url=f"https://t.me/{bot_username}?start=offer_{new_order.id}"
-                )
-            ]])
-            
-            category_name = order_data.get('category_name', 'Без категории')
-            
-            order_text = (
-                f"<b>🟢 Новый заказ №{new_order.id}</b>\n\n"
-                f"<b>Название:</b> {new_order.title}\n"
-                f"<b>Категория:</b> {category_name}\n"
-                f"<b>Цена:</b> {new_order.price:.2f} USDT\n\n"
-                f"<i>{new_order.description}</i>"
-            )
-            await bot.send_message(ORDER_CHANNEL_ID, order_text, reply_markup=keyboard)
-        except Exception as e:
-            logging.error(f"Не удалось отправить заказ {new_order.id} в канал: {e}")
-            await callback.message.answer("Не удалось опубликовать заказ в канале. Обратитесь к администратору.")
+        # Публикация уходит в фоне в общем с правками темпе канала.
+        channel_posts.publish(new_order.id)
+    notify_subscribers(new_order, order_data.get('category_name', 'Без категории'))
     await state.clear()
     
+def offer_keyboard(order_id: int) -> types.InlineKeyboardMarkup:
+    return types.InlineKeyboardMarkup(inline_keyboard=[[
+        types.InlineKeyboardButton(text="🚀 Откликнуться", url=f"https://t.me/{metadata.bot_username}?start=offer_{order_id}")
+    ]])
+
+async def report_channel_failure(customer_id: int, order_id: int):
+    try:
+        await bot.send_message(customer_id, f"Не удалось опубликовать заказ №{order_id} в канале. Обратитесь к администратору.")
+    except Exception as e:
+        logging.error(f"Не удалось сообщить заказчику {customer_id} об ошибке публикации: {e}")
+
+def notify_subscribers(order: Order, category_name: str):
+    """Ставит уведомления подписчикам категории в очередь; отправка идёт в фоне в общем темпе массовых отправок."""
+    text = (
+        f"<b>🔔 Новый заказ по вашей подписке</b>\n\n"
+        f"<b>Название:</b> {order.title}\n"
+        f"<b>Категория:</b> {category_name}\n"
+        f"<b>Цена:</b> {order.price:.2f} USDT"
+    )
+    keyboard = types.InlineKeyboardMarkup(inline_keyboard=[[types.InlineKeyboardButton(
+        text="🚀 Откликнуться", callback_data=OrderCallback(action="offer", order_id=order.id).pack())]])
+    for user_id in subscription_index.match(order.category_id, order.price):
+        if user_id != order.customer_id:
+            notifications.put(user_id, text, reply_markup=keyboard)
+
+async def drop_unreachable_subscriber(user_id: int):
+    # Пользователь заблокировал бота — подписки больше не нужны, рассылки его тоже пропустят.
+    async with async_session() as session:
+        await unsubscribe_user(session, user_id)
+        await session.execute(update(User).where(User.telegram_id == user_id).values(is_active=False))
+        await session.commit()
+    subscription_index.remove_user(user_id)
+
 @dp.callback_query(OrderCreation.confirm_order, F.data == "order_cancel")
 async def cancel_order_creation(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
     await state.clear()
     await callback.message.edit_text("Создание заказа отменено.", reply_markup=None)
 
-@dp.message(F.text == "🔥 Лента заказов")
+@dp.message(F.text == "🔥 Лента заказов", flags={"throttle_cost": 2})
 @block_check
 async def handle_order_feed(message: types.Message):
-    async with async_session() as session:
+    async with read_session() as session:
         total_orders_res = await session.scalar(
             select(func.count(Order.id)).where(Order.status == "open", Order.customer_id != message.from_user.id)
         )
@@ -431,16 +561,16 @@ async def handle_order_feed(message: types.Message):
         )
         orders = (await session.execute(stmt)).scalars().all()
         
-        text = await format_orders_page(orders)
+        text = orders_feed(orders)
         keyboard = create_pagination_keyboard(page=0, total_pages=total_pages)
         
         await message.answer(text, reply_markup=keyboard)
     
-@dp.callback_query(Paginator.filter())
+@dp.callback_query(Paginator.filter(), flags={"throttle_coalesce": True})
 @block_check
 async def handle_order_feed_page(callback: CallbackQuery, callback_data: Paginator):
     page = callback_data.page
-    async with async_session() as session:
+    async with read_session() as session:
         total_orders_res = await session.scalar(
             select(func.count(Order.id)).where(Order.status == "open", Order.customer_id != callback.from_user.id)
         )
@@ -455,7 +585,7 @@ async def handle_order_feed_page(callback: CallbackQuery, callback_data: Paginat
     )
         orders = (await session.execute(stmt)).scalars().all()
         
-        text = await format_orders_page(orders)
+        text = orders_feed(orders)
         keyboard = create_pagination_keyboard(page=page, total_pages=total_pages)
 
         await callback.message.edit_text(text, reply_markup=keyboard)
@@ -464,48 +594,9 @@ async def handle_order_feed_page(callback: CallbackQuery, callback_data: Paginat
 @dp.message(F.text == "📂 Мои заказы")
 @block_check
 async def handle_my_orders(message: types.Message):
-    async with async_session() as session:
-        user_id = message.from_user.id
-        
-        created_orders_stmt = (
-            select(Order)
-            .where(Order.customer_id == user_id)
-            .options(joinedload(Order.category)) # <--- Добавлено
-            .order_by(Order.status.desc(), Order.creation_date.desc())
-        )
-        created_orders_res = await session.execute(created_orders_stmt)
-        created_orders = created_orders_res.scalars().unique().all()
-
-        executing_orders_stmt = (
-            select(Order)
-            .where(Order.executor_id == user_id)
-            .options(joinedload(Order.category)) # <--- Добавлено
-            .order_by(Order.status.desc(), Order.creation_date.desc())
-        )
-        executing_orders_res = await session.execute(executing_orders_stmt)
-        executing_orders = executing_orders_res.scalars().unique().all()
+    text, keyboard = await render_history_page(message.from_user.id, HistoryPage(view="orders"))
+    await message.answer(text, reply_markup=keyboard)
 
-        if not created_orders and not executing_orders:
-            return await message.answer("У вас пока нет активных заказов. \nСоздайте свой или найдите в ленте /feed")
-        
-        response_text = ""
-        status_emoji = {"open": "🟢", "in_progress": "🟡", "pending_approval": "🔵", "completed": "⚪️", "dispute": "🔴"}
-
-        if created_orders:
-            response_text += "<b>🗂️ Ваши созданные заказы:</b>\n"
-            for order in created_orders:
-                category_name = f" ({order.category.name})" if order.category else ""
-                response_text += f"{status_emoji.get(order.status, '')} №{order.id}: {order.title}{category_name}\n"
-        
-        if executing_orders:
-            response_text += "\n<b>💼 Заказы, которые вы выполняете:</b>\n"
-            for order in executing_orders:
-                category_name = f" ({order.category.name})" if order.category else ""
-                response_text += f"{status_emoji.get(order.status, '')} №{order.id}: {order.title}{category_name}\n"
-        
-        response_text += "\n\nℹ️ Для просмотра деталей и действий по заказу, используйте команду /order `id_заказа`"
-        await message.answer(response_text)
-        
 @dp.message(Command("order"))
 @block_check
 async def view_specific_order(message: types.Message, command: CommandObject):
@@ -525,11 +616,10 @@ async def view_specific_order(message: types.Message, command: CommandObject):
         if order.status != 'open' and not is_participant:
             return await message.answer("У вас нет доступа к этому заказу, так как он уже в работе или завершен.")
 
-        status_emoji = {"open": "🟢", "in_progress": "🟡", "pending_approval": "🔵", "completed": "⚪️", "dispute": "🔴"}
         customer_username = f"@{order.customer.username}" if order.customer.username else "Скрыт"
         category_name = order.category.name if order.category else "Без категории"
         text = (
-            f"{status_emoji.get(order.status, '')} <b>Заказ №{order.id}: {order.title}</b>\n\n"
+            f"{STATUS_EMOJI.get(order.status, '')} <b>Заказ №{order.id}: {order.title}</b>\n\n"
             f"<b>Категория:</b> {category_name}\n"
             f"<b>Описание:</b> {order.description}\n\n"
             f"<b>Цена:</b> {order.price:.2f} USDT\n"
@@ -554,26 +644,122 @@ async def view_specific_order(message: types.Message, command: CommandObject):
                 text="✅ Сдать работу", callback_data=OrderCallback(action="submit_work", order_id=order.id).pack())]])
         await message.answer(text, reply_markup=keyboard)
 
+async def render_subscriptions(user_id: int):
+    async with read_session() as session:
+        subscriptions = (await session.scalars(
+            select(CategorySubscription)
+            .where(CategorySubscription.user_id == user_id)
+            .options(joinedload(CategorySubscription.category))
+            .order_by(CategorySubscription.id)
+        )).all()
+    lines = ["<b>🔔 Подписки на новые заказы</b>\n"]
+    buttons = []
+    for subscription in subscriptions:
+        lines.append(f"• {subscription.category.name}: {format_price_range(subscription.min_price, subscription.max_price)}")
+        buttons.append([types.InlineKeyboardButton(
+            text=f"❌ {subscription.category.name}",
+            callback_data=SubscriptionCallback(action="delete", category_id=subscription.category_id).pack()
+        )])
+    if not subscriptions:
+        lines.append("Подписок пока нет. Добавьте категорию — и новые заказы в ней будут приходить вам в личные сообщения.")
+    if len(subscriptions) < SUBSCRIPTIONS_LIMIT:
+        buttons.append([types.InlineKeyboardButton(text="➕ Добавить", callback_data=SubscriptionCallback(action="add").pack())])
+    return "\n".join(lines), types.InlineKeyboardMarkup(inline_keyboard=buttons)
+
+@dp.message(Command("subscriptions"))
+@block_check
+async def handle_subscriptions_command(message: types.Message):
+    text, keyboard = await render_subscriptions(message.from_user.id)
+    await message.answer(text, reply_markup=keyboard)
+
+@dp.callback_query(F.data == "subscriptions")
+@block_check
+async def handle_subscriptions(callback: CallbackQuery):
+    await callback.answer()
+    text, keyboard = await render_subscriptions(callback.from_user.id)
+    await callback.message.answer(text, reply_markup=keyboard)
+
+@dp.callback_query(SubscriptionCallback.filter(F.action == "add"))
+@block_check
+async def add_subscription_start(callback: CallbackQuery):
+    categories, _ = await metadata.categories()
+    if not categories:
+        return await callback.answer("Категории еще не созданы.", show_alert=True)
+    keyboard = types.InlineKeyboardMarkup(inline_keyboard=[
+        [types.InlineKeyboardButton(text=cat.name, callback_data=SubscriptionCallback(action="category", category_id=cat.id).pack())]
+        for cat in categories
+    ])
+    await callback.answer()
+    await callback.message.edit_text("Выберите категорию для подписки:", reply_markup=keyboard)
+
+@dp.callback_query(SubscriptionCallback.filter(F.action == "category"))
+@block_check
+async def add_subscription_category(callback: CallbackQuery, callback_data: SubscriptionCallback, state: FSMContext):
+    async with read_session() as session:
+        category = await session.get(Category, callback_data.category_id)
+        count = await session.scalar(
+            select(func.count(CategorySubscription.id)).where(CategorySubscription.user_id == callback.from_user.id)
+        )
+    if category is None:
+        return await callback.answer("Эта категория удалена. Откройте список подписок заново.", show_alert=True)
+    if count >= SUBSCRIPTIONS_LIMIT:
+        return await callback.answer(f"Можно подписаться не более чем на {SUBSCRIPTIONS_LIMIT} категорий.", show_alert=True)
+    await state.update_data(category_id=callback_data.category_id)
+    await state.set_state(SubscriptionSetup.enter_price_range)
+    await callback.answer()
+    await callback.message.edit_text(
+        "Укажите диапазон цен в USDT, например <code>10-100</code>, <code>50-</code> (от 50) или <code>-</code> (любая цена).\n\n"
+        "Для отмены введите /cancel"
+    )
+
+@dp.message(SubscriptionSetup.enter_price_range, F.text)
+@block_check
+async def add_subscription_price_range(message: types.Message, state: FSMContext):
+    try:
+        min_price, max_price = parse_price_range(message.text)
+    except (ArithmeticError, ValueError):
+        return await message.answer("Неверный формат. Введите диапазон, например <code>10-100</code>.")
+    category_id = (await state.get_data())['category_id']
+    async with async_session() as session:
+        # FOR SHARE не даёт удалить категорию, пока подписка не сохранена.
+        if await session.scalar(select(Category.id).where(Category.id == category_id).with_for_update(read=True)) is None:
+            await state.clear()
+            return await message.answer("Пока вы вводили диапазон, категорию удалили. Выберите другую в разделе подписок.")
+        subscription = await session.scalar(select(CategorySubscription).where(
+            CategorySubscription.user_id == message.from_user.id, CategorySubscription.category_id == category_id
+        ))
+        if subscription is None:
+            subscription = CategorySubscription(user_id=message.from_user.id, category_id=category_id)
+            session.add(subscription)
+        subscription.min_price, subscription.max_price = min_price, max_price
+        await session.commit()
+    subscription_index.set(category_id, message.from_user.id, min_price, max_price)
+    await state.clear()
+    text, keyboard = await render_subscriptions(message.from_user.id)
+    await message.answer(f"✅ Подписка сохранена: {format_price_range(min_price, max_price)}.\n\n{text}", reply_markup=keyboard)
+
+@dp.callback_query(SubscriptionCallback.filter(F.action == "delete"))
+async def delete_subscription(callback: CallbackQuery, callback_data: SubscriptionCallback):
+    async with async_session() as session:
+        await session.execute(delete(CategorySubscription).where(
+            CategorySubscription.user_id == callback.from_user.id,
+            CategorySubscription.category_id == callback_data.category_id
+        ))
+        await session.commit()
+    subscription_index.remove(callback_data.category_id, callback.from_user.id)
+    await callback.answer("Подписка удалена.")
+    text, keyboard = await render_subscriptions(callback.from_user.id)
+    await callback.message.edit_text(text, reply_markup=keyboard)
+
 @dp.callback_query(F.data == "buy_vip")
 @block_check
 async def buy_vip_handler(callback: CallbackQuery):
     await callback.answer()
-    
-    keyboard_buttons = []
-    for days, price in VIP_PLANS.items():
-        keyboard_buttons.append([
-            types.InlineKeyboardButton(
-                text=f"{days} дней - {price:.2f} USDT",
-                callback_data=VIPCallback(action="buy", days=days).pack()
-            )
-        ])
-
-    keyboard = types.InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
-    await callback.message.answer("Выберите план подписки:", reply_markup=keyboard)
+    await callback.message.answer("Выберите план подписки:", reply_markup=vip_plans_keyboard)
 
-@dp.callback_query(VIPCallback.filter(F.action == "buy"))
+@dp.callback_query(VIPCallback.filter(F.action == "buy"), flags={"idempotent": True})
 @block_check
-async def process_vip_buy(callback: CallbackQuery, callback_data: VIPCallback):
+async def process_vip_buy(callback: CallbackQuery, callback_data: VIPCallback, idempotency: IdempotentCall | None = None):
     days = callback_data.days
     price = VIP_PLANS.get(days)
 
@@ -581,22 +767,21 @@ async def process_vip_buy(callback: CallbackQuery, callback_data: VIPCallback):
         return await callback.answer("План не найден.", show_alert=True)
 
     async with async_session() as session:
-        user = await session.scalar(select(User).where(User.telegram_id == callback.from_user.id))
-        
-        if user.balance < price:
+        if await debit_balance(session, callback.from_user.id, price, 'vip_payment') is None:
             await callback.answer("На вашем балансе недостаточно средств.", show_alert=True)
             return
 
-        user.balance -= price
-        session.add(FinancialTransaction(user_id=user.telegram_id, type='vip_payment', amount=-price))
-        
+        user = await session.scalar(select(User).where(User.telegram_id == callback.from_user.id).with_for_update())
         current_expiry = user.vip_expires_at or datetime.now(UTC)
         if current_expiry < datetime.now(UTC):
             current_expiry = datetime.now(UTC)
         
         user.vip_expires_at = current_expiry + timedelta(days=days)
         await session.commit()
-    
+    if idempotency:
+        idempotency.done()
+    entitlements.update(user.telegram_id, user.vip_expires_at)
+
     await callback.message.edit_text(
         f"🎉 Поздравляем! Вы успешно приобрели VIP-статус на {days} дней.\n"
         f"Он активен до {user.vip_expires_at.strftime('%d.%m.%Y')}."
@@ -610,19 +795,8 @@ async def handle_profile(message: types.Message):
         user = await session.scalar(select(User).where(User.telegram_id == message.from_user.id))
         if not user:
             return await message.answer("Произошла ошибка. Пожалуйста, нажмите /start для регистрации.")
-        
-        vip_status = "Активен ✅" if user.vip_expires_at and user.vip_expires_at > datetime.now(UTC) else "Неактивен ❌"
-        
-        profile_text = (
-            f"<b>👤 Ваш профиль</b>\n\n"
-            f"<b>Баланс:</b> <code>{user.balance:.2f} USDT</code>\n"
-            f"<b>Рейтинг:</b> {user.rating:.2f} ⭐ ({user.reviews_count} отзывов)\n"
-            f"<b>VIP Статус:</b> {vip_status}"
-        )
-        if vip_status == "Активен ✅":
-            profile_text += f"\n  (до {user.vip_expires_at.strftime('%d.%m.%Y')})"
-            
-        await message.answer(profile_text, reply_markup=profile_keyboard)
+
+        await message.answer(own_profile_header(user), reply_markup=profile_keyboard)
 
 @dp.message(Command("grant_vip"))
 @admin_only
@@ -648,6 +822,7 @@ async def grant_vip(message: types.Message, command: CommandObject):
             
         user.vip_expires_at = current_expiry + timedelta(days=days)
         await session.commit()
+        entitlements.update(user_id, user.vip_expires_at)
         
         await message.answer(f"✅ VIP-статус для пользователя {user_id} успешно продлен на {days} дней.\n"
                              f"Новая дата окончания: {user.vip_expires_at.strftime('%d.%m.%Y')}")
@@ -717,7 +892,7 @@ async def start_balance_change(callback: CallbackQuery, callback_data: AdminCall
 @dp.message(AdminBalanceChange.enter_amount)
 async def process_balance_change_amount(message: types.Message, state: FSMContext):
     try:
-        amount = Decimal(message.text)
+        amount = Money.parse(message.text)
         if amount <= 0:
             return await message.answer("Сумма должна быть положительным числом.")
     except Exception:
@@ -734,17 +909,14 @@ async def process_balance_change_amount(message: types.Message, state: FSMContex
             return await state.clear()
 
         if action == "credit":
-            user.balance += amount
-            session.add(FinancialTransaction(user_id=user_id, type='admin_credit', amount=amount))
-        
+            await credit_balance(session, user_id, amount, 'admin_credit')
             final_text = f"✅ Успешно начислено {amount:.2f} USDT пользователю {user_id}."
         else: 
-            if user.balance < amount:
-                await message.answer(f"Недостаточно средств. Баланс пользователя: {user.balance:.2f} USDT.")
+            if await debit_balance(session, user_id, amount, 'admin_debit') is None:
+                # Баланс мог измениться после чтения user: показываем текущий.
+                balance = await session.scalar(select(User.balance).where(User.telegram_id == user_id))
+                await message.answer(f"Недостаточно средств. Баланс пользователя: {balance:.2f} USDT.")
                 return await state.clear()
-            user.balance -= amount
-            session.add(FinancialTransaction(user_id=user_id, type='admin_debit', amount=-amount))
-        
             final_text = f"✅ Успешно списано {amount:.2f} USDT с баланса пользователя {user_id}."
 
         await session.commit()
@@ -761,23 +933,21 @@ async def process_balance_change_amount(message: types.Message, state: FSMContex
 @dp.callback_query(OrderCallback.filter(F.action == "offer"))
 @block_check
 async def handle_make_offer_start(callback: CallbackQuery, callback_data: OrderCallback, state: FSMContext):
+    if channel_posts.is_closed(callback_data.order_id):
+        await callback.answer("Этот заказ уже закрыт и не принимает отклики.", show_alert=True)
+        return
     async with async_session() as session:
         user = await session.scalar(select(User).where(User.telegram_id == callback.from_user.id))
         if not user:
             await callback.answer("Чтобы откликнуться, пожалуйста, сначала запустите бота командой /start", show_alert=True)
             return
 
-        is_vip = user.vip_expires_at and user.vip_expires_at > datetime.now(UTC)
-        if not is_vip:
-            offers_count = await session.scalar(
-                select(func.count(Offer.id)).where(Offer.executor_id == callback.from_user.id)
+        if not await has_offer_slot(session, callback.from_user.id):
+            await callback.answer(
+                f"Вы достигли лимита активных откликов ({FREE_OFFERS_LIMIT}). Чтобы снять ограничения, приобретите VIP-статус.",
+                show_alert=True
             )
-            if offers_count >= 2:
-                await callback.answer(
-                    "Вы достигли лимита на отклики (10). Чтобы снять ограничения, приобретите VIP-статус.",
-                    show_alert=True
-                )
-                return
+            return
 
         existing_offer = await session.scalar(
             select(Offer).where(Offer.order_id == callback_data.order_id, Offer.executor_id == callback.from_user.id)
@@ -796,10 +966,13 @@ async def handle_offer_message(message: types.Message, state: FSMContext):
     data = await state.get_data()
     order_id = data.get("order_id")
     async with async_session() as session:
-        new_offer = Offer(order_id=order_id, executor_id=message.from_user.id, message=message.text)
-        session.add(new_offer)
         order = await session.get(Order, order_id)
-        if order:
+        if order and order.status != OPEN:
+            await message.answer("❌ Заказ уже не принимает отклики.")
+        elif order and not await reserve_offer_slot(session, message.from_user.id):
+            await message.answer(f"❌ Вы достигли лимита активных откликов ({FREE_OFFERS_LIMIT}).")
+        elif order:
+            session.add(Offer(order_id=order_id, executor_id=message.from_user.id, message=message.text))
             await session.commit()
             await message.answer("✅ Ваш отклик успешно отправлен!")
             try:
@@ -819,7 +992,7 @@ async def start_withdrawal(callback: CallbackQuery, state: FSMContext):
 @dp.message(Withdrawal.enter_amount)
 async def enter_withdrawal_amount(message: types.Message, state: FSMContext):
     try:
-        amount = Decimal(message.text)
+        amount = Money.parse(message.text)
         if amount <= 0:
             await message.answer("Сумма должна быть больше нуля. Попробуйте еще раз.")
             return
@@ -843,31 +1016,36 @@ async def enter_withdrawal_address(message: types.Message, state: FSMContext):
         return
     await state.update_data(address=address)
     data = await state.get_data()
-    amount = data.get("amount")
+    amount = Money(data.get("amount"))
     text = (f"<b>Пожалуйста, подтвердите вывод средств:</b>\n\n<b>Сумма:</b> {amount:.2f} USDT\n<b>На адрес:</b> <code>{address}</code>\n\n"
             "⚠️ **Внимание!** Проверьте адрес внимательно. В случае ошибки средства будут утеряны.")
     confirm_keyboard = types.InlineKeyboardMarkup(inline_keyboard=[[types.InlineKeyboardButton(text="✅ Подтвердить", callback_data="confirm_withdrawal_yes")], [types.InlineKeyboardButton(text="❌ Отменить", callback_data="confirm_withdrawal_no")]])
     await state.set_state(Withdrawal.confirm_withdrawal)
     await message.answer(text, reply_markup=confirm_keyboard)
 
-@dp.callback_query(Withdrawal.confirm_withdrawal, F.data == "confirm_withdrawal_yes")
-async def confirm_withdrawal(callback: CallbackQuery, state: FSMContext):
+@dp.callback_query(Withdrawal.confirm_withdrawal, F.data == "confirm_withdrawal_yes", flags={"idempotent": True})
+async def confirm_withdrawal(callback: CallbackQuery, state: FSMContext, idempotency: IdempotentCall | None = None):
     await callback.message.edit_text("⏳ Обрабатываем ваш запрос на вывод...")
     data = await state.get_data()
-    amount = data.get("amount")
+    amount = Money(data.get("amount"))
     address = data.get("address")
+    # Средства резервируются до обращения к API, чтобы параллельные операции не могли их потратить.
+    async with async_session() as session:
+        if await debit_balance(session, callback.from_user.id, amount, 'withdrawal') is None:
+            await callback.message.edit_text("❌ На вашем балансе недостаточно средств для вывода.")
+            await state.clear()
+            return
+        await session.commit()
+
     success, result = await create_payout(address, amount)
     if success:
-        async with async_session() as session:
-            user = await session.scalar(select(User).where(User.telegram_id == callback.from_user.id))
-            if user and user.balance >= amount:
-                user.balance -= amount
-                session.add(FinancialTransaction(user_id=user.telegram_id, type='withdrawal', amount=-amount))
-                await session.commit()
-                await callback.message.edit_text(f"✅ Запрос на вывод {amount:.2f} USDT успешно создан. Средства поступят на ваш кошелек в ближайшее время.")
-            else:
-                await callback.message.edit_text("❌ Произошла ошибка сверки баланса. Обратитесь в поддержку.")
+        if idempotency:
+            idempotency.done()
+        await callback.message.edit_text(f"✅ Запрос на вывод {amount:.2f} USDT успешно создан. Средства поступят на ваш кошелек в ближайшее время.")
     else:
+        async with async_session() as session:
+            await credit_balance(session, callback.from_user.id, amount, 'withdrawal_refund')
+            await session.commit()
         await callback.message.edit_text(f"❌ Не удалось создать запрос на вывод.\nПричина: {result}\n\nПопробуйте позже или обратитесь в поддержку.")
     await state.clear()
 
@@ -921,12 +1099,12 @@ async def enter_review_text(message: types.Message, state: FSMContext):
     await message.answer("✅ Спасибо, ваш отзыв принят!")
     await state.clear()
 
-@dp.message(Command("profile"))
+@dp.message(Command("profile"), flags={"throttle_cost": 2})
 @block_check
 async def get_public_profile(message: types.Message, command: CommandObject):
     user_identifier = command.args or str(message.from_user.id)
     
-    async with async_session() as session:
+    async with read_session() as session:
         if user_identifier.isdigit():
             user = await session.scalar(select(User).where(User.telegram_id == int(user_identifier)))
         else:
@@ -941,14 +1119,8 @@ async def get_public_profile(message: types.Message, command: CommandObject):
                 Order.status == 'completed'
             )
         )
-        
-        profile_text = (
-            f"<b>👤 Профиль пользователя @{user.username if user.username else 'N/A'}</b>\n\n"
-            f"<b>Рейтинг:</b> {user.rating:.2f} ⭐ ({user.reviews_count} отзывов)\n"
-            f"<b>Завершено сделок:</b> {completed_deals}\n"
-            f"<b>На сервисе с:</b> {user.registration_date.strftime('%d.%m.%Y')}"
-        )
-        await message.answer(profile_text)
+
+        await message.answer(public_profile_header(user, completed_deals))
         
         reviews = await session.scalars(
             select(Review).where(Review.reviewee_id == user.telegram_id).order_by(Review.id.desc()).limit(3)
@@ -956,101 +1128,152 @@ async def get_public_profile(message: types.Message, command: CommandObject):
         
         reviews_list = reviews.all()
         if reviews_list:
-            review_text = "\n<b>Последние отзывы:</b>\n"
-            for review in reviews_list:
-                review_text += f"  - <i>«{review.text}»</i> ({review.rating}⭐)\n"
-            await message.answer(review_text)
+            review_lines = [f"  - <i>«{review.text}»</i> ({review.rating}⭐)\n" for review in reviews_list]
+            await message.answer("".join(["\n<b>Последние отзывы:</b>\n", *review_lines]))
 
 
-@dp.callback_query(F.data == "deals_history")
+@dp.callback_query(F.data.in_({"deals_history", "finance_history"}))
 @block_check
-async def handle_deals_history(callback: CallbackQuery):
+async def handle_history(callback: CallbackQuery):
     await callback.answer()
-    async with async_session() as session:
-        completed_orders_result = await session.scalars(
-            select(Order).where(
-                or_(Order.customer_id == callback.from_user.id, Order.executor_id == callback.from_user.id),
-                Order.status == 'completed'
-            ).order_by(Order.creation_date.desc()).limit(10)
-        )
-        
-        completed_orders = completed_orders_result.all()
-
-        history_text = "<b>📜 История 10 последних завершенных сделок:</b>\n\n"
-        if not completed_orders:
-            history_text = "У вас пока нет завершенных сделок."
-        else:
-            for order in completed_orders:
-                role = "Заказчик" if order.customer_id == callback.from_user.id else "Исполнитель"
-                history_text += f"• <b>№{order.id}:</b> {order.title} ({order.price:.2f} USDT) - <i>Роль: {role}</i>\n"
+    view = "deals" if callback.data == "deals_history" else "finance"
+    text, keyboard = await render_history_page(callback.from_user.id, HistoryPage(view=view))
+    await callback.message.answer(text, reply_markup=keyboard)
 
-        await callback.message.answer(history_text)
-
-@dp.callback_query(F.data == "finance_history")
+@dp.callback_query(HistoryPage.filter(), flags={"throttle_coalesce": True})
 @block_check
-async def handle_finance_history(callback: CallbackQuery):
+async def handle_history_page(callback: CallbackQuery, callback_data: HistoryPage):
+    text, keyboard = await render_history_page(callback.from_user.id, callback_data)
+    await edit_page(callback.message, text, keyboard)
     await callback.answer()
-    async with async_session() as session:
-        transactions_result = await session.scalars(
-            select(FinancialTransaction)
-            .where(FinancialTransaction.user_id == callback.from_user.id)
-            .order_by(FinancialTransaction.timestamp.desc())
-            .limit(15)
-        )
-        
-        transactions = transactions_result.all()
-
-        history_text = "<b>💸 История 15 последних операций с балансом:</b>\n\n"
-        types_map = {
-            'deposit': '✅ Пополнение', 'withdrawal': '➖ Вывод', 'order_payment': '🧾 Оплата заказа',
-            'order_reward': '💰 Вознаграждение', 'dispute_resolution': '⚖️ Решение по спору',
-            'admin_credit': '⚙️ Начисление', 'admin_debit': '⚙️ Списание'
-        }
-
-        if not transactions:
-            history_text = "У вас пока не было операций с балансом."
-        else:
-            for trans in transactions:
-                sign = "+" if trans.amount > 0 else ""
-                type_str = types_map.get(trans.type, trans.type)
-                history_text += f"• {trans.timestamp.strftime('%d.%m.%y %H:%M')}: {sign}{trans.amount:.2f} USDT ({type_str})\n"
-
-        await callback.message.answer(history_text)
 
 @dp.message(F.text == "🆘 Поддержка")
 async def start_support_chat(message: types.Message, state: FSMContext):
     await state.set_state(SupportChat.in_chat)
     await message.answer(
-        "Вы вошли в чат с поддержкой. Напишите ваше сообщение, и администратор скоро ответит.\n\n"
+        "Вы вошли в чат с поддержкой. Напишите ваше сообщение, и агент поддержки скоро ответит.\n\n"
         "Чтобы выйти из чата, отправьте команду /cancel."
     )
 
+def support_ticket_keyboard(ticket_id: int):
+    return types.InlineKeyboardMarkup(inline_keyboard=[[types.InlineKeyboardButton(
+        text="✅ Закрыть тикет", callback_data=SupportCallback(action="close", ticket_id=ticket_id).pack())]])
+
+async def deliver_to_agent(ticket, messages: list, title: str) -> bool:
+    """Отправляет сообщения тикета агенту (при необходимости несколькими частями) и запоминает связь с тикетом."""
+    header = f"<b>{title} #{ticket.id}</b> от пользователя <code>{ticket.user_id}</code>\n"
+    chunks, current = [], header
+    for support_message in messages:
+        entry = f"\n{support_message.created_at.strftime('%d.%m %H:%M')}: {html.escape(support_message.text)}"
+        if len(current) + len(entry) > SUPPORT_MESSAGE_LIMIT and current != header:
+            chunks.append(current)
+            current = header
+        current += entry[:SUPPORT_MESSAGE_LIMIT]
+    chunks.append(current)
+    try:
+        sent = [await bot.send_message(ticket.agent_id, chunk, reply_markup=support_ticket_keyboard(ticket.id)) for chunk in chunks]
+    except Exception as e:
+        logging.error(f"Не удалось доставить тикет {ticket.id} агенту {ticket.agent_id}: {e}")
+        return False
+    async with async_session() as session:
+        await support.mark_delivered(
+            session, ticket.id, [m.id for m in messages], ticket.agent_id, [m.message_id for m in sent]
+        )
+        await session.commit()
+    return True
+
 @dp.message(SupportChat.in_chat, F.text)
-async def forward_to_admin(message: types.Message, state: FSMContext):
-    user_info = f"@{message.from_user.username}" if message.from_user.username else f"ID: {message.from_user.id}"
-    
-    await bot.send_message(
-        ADMIN_ID,
-        f"<b>Новое сообщение в поддержку от {user_info}</b> (ID: `{message.from_user.id}`)\n\n"
-        f"Текст: {message.text}"
-    )
-    await message.answer("Ваше сообщение отправлено администратору.")
+async def forward_to_support(message: types.Message, state: FSMContext):
+    async with async_session() as session:
+        ticket, created = await support.open_ticket(session, message.from_user.id)
+        support_message = await support.add_message(session, ticket.id, message.from_user.id, message.text)
+        online = await support.is_online(session, ticket.agent_id)
+        await session.commit()
+
+    if created:
+        await message.answer(f"📨 Создан тикет поддержки #{ticket.id}.")
+    if online and await deliver_to_agent(ticket, [support_message], "Тикет"):
+        await message.answer("Ваше сообщение отправлено в поддержку.")
+    else:
+        await message.answer("Ваше сообщение сохранено. Агент поддержки ответит, как только появится в сети.")
 
-@dp.message(F.reply_to_message, lambda msg: msg.from_user.id == ADMIN_ID)
+@dp.message(F.reply_to_message, lambda msg: support.is_agent(msg.from_user.id))
 async def forward_to_user(message: types.Message):
+    if not message.text:
+        return await message.answer("❌ В тикет можно ответить только текстом.")
+    async with async_session() as session:
+        ticket = await support.ticket_for_reply(session, message.chat.id, message.reply_to_message.message_id)
+        if not ticket:
+            return await message.answer("❌ Не удалось отправить ответ. Убедитесь, что вы отвечаете на сообщение тикета.")
+        if ticket.status != SUPPORT_OPEN:
+            return await message.answer(f"❌ Тикет #{ticket.id} уже закрыт.")
+        await support.add_message(session, ticket.id, message.from_user.id, message.text, delivered=True)
+        await session.commit()
     try:
-        replied_message_text = message.reply_to_message.text
-        user_id_str = replied_message_text.split("(ID: `")[1].split("`)")[0]
-        user_id = int(user_id_str)
-
-        await bot.send_message(user_id, f"<b>Ответ от поддержки:</b>\n\n{message.text}")
+        await bot.send_message(ticket.user_id, f"<b>Ответ от поддержки (тикет #{ticket.id}):</b>\n\n{html.escape(message.text)}")
         await message.answer("✅ Ваш ответ отправлен пользователю.")
-    except (IndexError, ValueError):
-        await message.answer("❌ Не удалось отправить ответ. Убедитесь, что вы отвечаете на правильное сообщение от бота.")
     except Exception as e:
-        logging.error(f"Ошибка при ответе админа пользователю: {e}")
+        logging.error(f"Ошибка при ответе агента пользователю по тикету {ticket.id}: {e}")
         await message.answer("❌ Произошла ошибка при отправке ответа.")
 
+@dp.callback_query(SupportCallback.filter(F.action == "close"))
+async def close_support_ticket(callback: CallbackQuery, callback_data: SupportCallback):
+    if not support.is_agent(callback.from_user.id) and callback.from_user.id != ADMIN_ID:
+        return await callback.answer("Действие доступно только поддержке.", show_alert=True)
+    async with async_session() as session:
+        ticket = await support.close_ticket(session, callback_data.ticket_id)
+        await session.commit()
+    await callback.message.edit_reply_markup(reply_markup=None)
+    if not ticket:
+        return await callback.answer("Тикет уже закрыт.")
+    await callback.answer(f"Тикет #{ticket.id} закрыт.")
+    await notify(ticket.user_id, f"✅ Тикет поддержки #{ticket.id} закрыт. Если вопрос остался, напишите в поддержку снова.")
+
+@dp.message(Command("online", "offline"), lambda msg: support.is_agent(msg.from_user.id))
+async def set_support_status(message: types.Message, command: CommandObject):
+    online = command.command == "online"
+    async with async_session() as session:
+        await support.set_online(session, message.from_user.id, online)
+        await session.commit()
+    if online:
+        delivered = await send_support_digests(message.from_user.id)
+        await message.answer(f"🟢 Вы в сети. Тикетов с непрочитанными сообщениями: {delivered}.")
+    else:
+        await message.answer(f"⚪️ Вы не в сети. Новые обращения будут приходить сводкой раз в {SUPPORT_DIGEST_MINUTES} минут.")
+
+@dp.message(Command("tickets"), lambda msg: support.is_agent(msg.from_user.id))
+async def list_support_tickets(message: types.Message):
+    async with read_session() as session:
+        tickets = (await session.scalars(
+            select(SupportTicket)
+            .where(SupportTicket.agent_id == message.from_user.id, SupportTicket.status == SUPPORT_OPEN)
+            .order_by(SupportTicket.id)
+            .limit(50)
+        )).all()
+        load = await support.load(session) if tickets else {}
+    if not tickets:
+        return await message.answer("У вас нет открытых тикетов.")
+    lines = [f"<b>Ваши открытые тикеты ({load.get(message.from_user.id, len(tickets))}):</b>\n"]
+    lines += [f"#{ticket.id} — пользователь <code>{ticket.user_id}</code>, с {ticket.created_at.strftime('%d.%m %H:%M')}" for ticket in tickets]
+    await message.answer("\n".join(lines))
+
+@timed_job("support_digest")
+async def send_support_digests(agent_id: int | None = None) -> int:
+    # Процессов несколько: сообщения забираются атомарно, и сводку по ним отправляет только забравший.
+    async with async_session() as session:
+        digests = await support.claim_digests(session, agent_id)
+        await session.commit()
+    delivered = 0
+    for ticket, messages in digests:
+        if await deliver_to_agent(ticket, messages, "Сводка по тикету"):
+            delivered += 1
+        else:
+            async with async_session() as session:
+                await support.release_messages(session, [m.id for m in messages])
+                await session.commit()
+        await asyncio.sleep(NOTIFY_DELAY)
+    return delivered
+
 @dp.callback_query(F.data == "top_up")
 async def handle_top_up(callback: CallbackQuery):
     await callback.answer()
@@ -1063,42 +1286,212 @@ async def handle_top_up(callback: CallbackQuery):
             return
         wallet = user.wallet_address
         if not wallet:
-            new_wallet_address = await generate_new_wallet()
-            if new_wallet_address:
-                user.wallet_address = new_wallet_address
-                wallet = new_wallet_address
-                await session.commit()
-            else:
+            wallet = await assign_address(session, user.telegram_id)
+            if not wallet:
+                logging.warning("Пул адресов для пополнения пуст, адрес создаётся по запросу")
+                wallet = await assign_generated_address(session, user.telegram_id)
+            if not wallet:
                 await callback.message.answer("Не удалось сгенерировать адрес для пополнения. Попробуйте позже.")
                 return
+            await session.commit()
         top_up_text = (f"Для пополнения баланса, переведите **USDT (в сети TRC-20)** на ваш персональный адрес:\n\n<code>{wallet}</code>\n\n"
                        "⚠️ **Внимание!** Отправляйте только USDT в сети TRC-20.")
         await callback.message.answer(top_up_text)
 
+TRANSACTION_TYPES = {
+    'deposit': '✅ Пополнение', 'withdrawal': '➖ Вывод', 'order_payment': '🧾 Оплата заказа',
+    'order_reward': '💰 Вознаграждение', 'dispute_resolution': '⚖️ Решение по спору',
+    'admin_credit': '⚙️ Начисление', 'admin_debit': '⚙️ Списание',
+    'vip_payment': '👑 Оплата VIP', 'withdrawal_refund': '↩️ Возврат вывода',
+    'order_refund': '↩️ Возврат за заказ'
+}
+# Фильтры истории: ключ (он же значение HistoryPage.kind) -> (подпись кнопки, условие).
+FINANCE_FILTERS = {
+    "all": ("Все", None),
+    "dep": ("Пополнения", ["deposit"]),
+    "wd": ("Выводы", ["withdrawal", "withdrawal_refund"]),
+    "ord": ("Заказы", ["order_payment", "order_reward", "order_refund", "dispute_resolution"]),
+}
+ORDER_FILTERS = {
+    "all": ("Все", None),
+    OPEN: (STATUS_EMOJI[OPEN], OPEN),
+    IN_PROGRESS: (STATUS_EMOJI[IN_PROGRESS], IN_PROGRESS),
+    PENDING_APPROVAL: (STATUS_EMOJI[PENDING_APPROVAL], PENDING_APPROVAL),
+    DISPUTE: (STATUS_EMOJI[DISPUTE], DISPUTE),
+    COMPLETED: (STATUS_EMOJI[COMPLETED], COMPLETED),
+    EXPIRED: (STATUS_EMOJI[EXPIRED], EXPIRED),
+}
+DEAL_FILTERS = {"all": ("Все", None), "customer": ("Как заказчик", None), "executor": ("Как исполнитель", None)}
+EPOCH = datetime(1970, 1, 1, tzinfo=UTC)
+
+def to_cursor_ts(moment: datetime) -> int:
+    # SQLite (бенчмарки) возвращает время без часового пояса; оно всё равно в UTC.
+    return (moment.replace(tzinfo=moment.tzinfo or UTC) - EPOCH) // timedelta(microseconds=1)
+
+def before_cursor(time_column, id_column, cursor: HistoryPage):
+    if not cursor.before_id:
+        return True
+    before = EPOCH + timedelta(microseconds=cursor.before_ts)
+    return or_(time_column < before, (time_column == before) & (id_column < cursor.before_id))
+
+async def fetch_history_rows(user_id: int, cursor: HistoryPage):
+    async with read_session() as session:
+        if cursor.view == "finance":
+            types_filter = FINANCE_FILTERS.get(cursor.kind, FINANCE_FILTERS["all"])[1]
+            stmt = (
+                select(FinancialTransaction)
+                .where(FinancialTransaction.user_id == user_id,
+                       before_cursor(FinancialTransaction.timestamp, FinancialTransaction.id, cursor))
+                .order_by(FinancialTransaction.timestamp.desc(), FinancialTransaction.id.desc())
+            )
+            if types_filter:
+                stmt = stmt.where(FinancialTransaction.type.in_(types_filter))
+        else:
+            if cursor.kind == "customer":
+                participant = Order.customer_id == user_id
+            elif cursor.kind == "executor":
+                participant = Order.executor_id == user_id
+            else:
+                participant = or_(Order.customer_id == user_id, Order.executor_id == user_id)
+            stmt = (
+                select(Order)
+                .where(participant, Order.id < cursor.before_id if cursor.before_id else True)
+                .options(joinedload(Order.category))
+                .order_by(Order.id.desc())
+            )
+            if cursor.view == "deals":
+                stmt = stmt.where(Order.status == COMPLETED)
+            elif cursor.kind in ORDER_FILTERS and cursor.kind != "all":
+                stmt = stmt.where(Order.status == cursor.kind)
+        return (await session.scalars(stmt.limit(HISTORY_PAGE_SIZE + 1))).all()
+
+async def render_history_page(user_id: int, cursor: HistoryPage):
+    rows = await fetch_history_rows(user_id, cursor)
+    has_more = len(rows) > HISTORY_PAGE_SIZE
+    rows = rows[:HISTORY_PAGE_SIZE]
+
+    if cursor.view == "finance":
+        filters = FINANCE_FILTERS
+        lines = ["<b>💸 История операций с балансом</b>\n"]
+        for trans in rows:
+            sign = "+" if trans.amount > 0 else ""
+            type_str = TRANSACTION_TYPES.get(trans.type, trans.type)
+            lines.append(f"• {trans.timestamp.strftime('%d.%m.%y %H:%M')}: {sign}{trans.amount:.2f} USDT ({type_str})")
+        empty_text = "Операций с балансом не найдено."
+        last_moment = rows[-1].timestamp if rows else None
+    else:
+        filters = DEAL_FILTERS if cursor.view == "deals" else ORDER_FILTERS
+        lines = ["<b>📜 История завершенных сделок</b>\n" if cursor.view == "deals" else "<b>📂 Ваши заказы</b>\n"]
+        for order in rows:
+            role = "Заказчик" if order.customer_id == user_id else "Исполнитель"
+            if cursor.view == "deals":
+                lines.append(f"{deal_line(order)} - <i>Роль: {role}</i>")
+            else:
+                lines.append(f"{order_line(order)} - <i>{role}</i>")
+        if cursor.view == "orders":
+            lines.append("\nℹ️ Для просмотра деталей и действий по заказу, используйте команду /order `id_заказа`")
+        empty_text = "Заказов не найдено. \nСоздайте свой или найдите в ленте /feed" if cursor.view == "orders" else "Сделок не найдено."
+        last_moment = None
+
+    filter_buttons = [
+        types.InlineKeyboardButton(
+            text=f"• {title}" if key == cursor.kind else title,
+            callback_data=HistoryPage(view=cursor.view, kind=key).pack())
+        for key, (title, _) in filters.items()
+    ]
+    keyboard = [filter_buttons[i:i + 3] for i in range(0, len(filter_buttons), 3)]
+    navigation = []
+    if cursor.page > 0:
+        navigation.append(types.InlineKeyboardButton(
+            text="⏮ В начало", callback_data=HistoryPage(view=cursor.view, kind=cursor.kind).pack()))
+    if has_more:
+        navigation.append(types.InlineKeyboardButton(text="Далее ▶️", callback_data=HistoryPage(
+            view=cursor.view, kind=cursor.kind, page=cursor.page + 1,
+            before_ts=to_cursor_ts(last_moment) if last_moment else 0, before_id=rows[-1].id).pack()))
+    if navigation:
+        keyboard.append(navigation)
+
+    text = "\n".join(lines) if rows else empty_text
+    return text, types.InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+async def edit_page(message: types.Message, text: str, keyboard: types.InlineKeyboardMarkup):
+    # Повторное нажатие на текущий фильтр или страницу даёт тот же текст, и Telegram отвечает ошибкой.
+    try:
+        await message.edit_text(text, reply_markup=keyboard)
+    except TelegramBadRequest as e:
+        if "message is not modified" not in e.message:
+            raise
+
+async def render_offers_page(order: Order, cursor: OffersPage):
+    async with async_session() as session:
+        total_offers = await session.scalar(select(func.count(Offer.id)).where(Offer.order_id == order.id))
+        # Исполнители без рейтинга идут последними, а ключ курсора никогда не бывает NULL.
+        rating_key = func.coalesce(User.rating, 0)
+        stmt = (
+            select(Offer, User, rating_key)
+            .join(User, User.telegram_id == Offer.executor_id)
+            .where(Offer.order_id == order.id)
+            .order_by(rating_key.desc(), Offer.id)
+            .limit(OFFERS_PAGE_SIZE + 1)
+        )
+        if cursor.page > 0:
+            rating = cursor.rating or 0
+            stmt = stmt.where(or_(rating_key < rating, (rating_key == rating) & (Offer.id > cursor.after_id)))
+        rows = (await session.execute(stmt)).all()
+
+    if not rows:
+        return None, None
+    has_more = len(rows) > OFFERS_PAGE_SIZE
+    rows = rows[:OFFERS_PAGE_SIZE]
+    first_number = cursor.page * OFFERS_PAGE_SIZE + 1
+
+    lines = [f"<b>Отклики на заказ №{order.id} ('{order.title}')</b> — всего {total_offers}\n"]
+    select_buttons = []
+    for number, (offer, executor, rating) in enumerate(rows, start=first_number):
+        executor_username = f"@{executor.username}" if executor.username else "Скрыт"
+        offer_message = offer.message if len(offer.message or "") <= 300 else offer.message[:300] + "..."
+        lines.append(f"<b>{number}. {executor_username}</b> — {rating:.2f} ⭐ ({executor.reviews_count} отзывов)\n"
+                     f"«<i>{offer_message}</i>»\n")
+        select_buttons.append([types.InlineKeyboardButton(
+            text=f"✅ Выбрать {number}. {executor_username}", callback_data=OfferCallback(action="select", offer_id=offer.id).pack())])
+
+    navigation = []
+    if cursor.page > 0:
+        navigation.append(types.InlineKeyboardButton(text="⏮ В начало", callback_data=OffersPage(order_id=order.id).pack()))
+    if has_more:
+        last_offer, _, last_rating = rows[-1]
+        navigation.append(types.InlineKeyboardButton(text="Далее ▶️", callback_data=OffersPage(
+            order_id=order.id, page=cursor.page + 1, rating=last_rating, after_id=last_offer.id).pack()))
+    if navigation:
+        select_buttons.append(navigation)
+    return "\n".join(lines), types.InlineKeyboardMarkup(inline_keyboard=select_buttons)
+
 @dp.callback_query(OrderCallback.filter(F.action == "view"))
 async def view_order_offers(callback: CallbackQuery, callback_data: OrderCallback):
+    async with async_session() as session:
+        order = await session.get(Order, callback_data.order_id)
+    if not order or order.customer_id != callback.from_user.id:
+        return await callback.answer("Это не ваш заказ.", show_alert=True)
     await callback.answer()
+    text, keyboard = await render_offers_page(order, OffersPage(order_id=order.id))
+    if not text:
+        return await callback.message.answer("На этот заказ пока нет откликов.")
+    await callback.message.answer(text, reply_markup=keyboard)
+
+@dp.callback_query(OffersPage.filter(), flags={"throttle_coalesce": True})
+async def view_order_offers_page(callback: CallbackQuery, callback_data: OffersPage):
     async with async_session() as session:
-        stmt = (select(Offer).where(Offer.order_id == callback_data.order_id)
-                .options(joinedload(Offer.executor), joinedload(Offer.order)))
-        result = await session.execute(stmt)
-        offers = result.scalars().unique().all()
-        if not offers:
-            await callback.message.answer("На этот заказ пока нет откликов.")
-            return
-        order_title = offers[0].order.title if offers else "..."
-        await callback.message.answer(f"<b>Отклики на заказ №{callback_data.order_id} ('{order_title}'):</b>")
-        for offer in offers:
-            executor = offer.executor
-            executor_username = f"@{executor.username}" if executor.username else "Скрыт"
-            text = (f"<b>Исполнитель:</b> {executor_username}\n<b>Рейтинг:</b> {executor.rating:.2f} ⭐ ({executor.reviews_count} отзывов)\n\n"
-                    f"<b>Сообщение:</b> «<i>{offer.message}</i>»")
-            keyboard = types.InlineKeyboardMarkup(inline_keyboard=[[types.InlineKeyboardButton(
-                text="Выбрать этого исполнителя", callback_data=OfferCallback(action="select", offer_id=offer.id).pack())]])
-            await callback.message.answer(text, reply_markup=keyboard)
+        order = await session.get(Order, callback_data.order_id)
+    if not order or order.customer_id != callback.from_user.id:
+        return await callback.answer("Это не ваш заказ.", show_alert=True)
+    text, keyboard = await render_offers_page(order, callback_data)
+    if not text:
+        return await callback.answer("Больше откликов нет.", show_alert=True)
+    await edit_page(callback.message, text, keyboard)
+    await callback.answer()
 
-@dp.callback_query(OfferCallback.filter(F.action == "select"))
-async def select_executor(callback: CallbackQuery, callback_data: OfferCallback):
+@dp.callback_query(OfferCallback.filter(F.action == "select"), flags={"idempotent": True})
+async def select_executor(callback: CallbackQuery, callback_data: OfferCallback, idempotency: IdempotentCall | None = None):
     async with async_session() as session:
         offer = await session.get(Offer, callback_data.offer_id, options=[joinedload(Offer.order)])
         if not offer or not offer.order:
@@ -1108,12 +1501,13 @@ async def select_executor(callback: CallbackQuery, callback_data: OfferCallback)
         if order.customer_id != callback.from_user.id:
             await callback.answer("Это не ваш заказ.", show_alert=True)
             return
-        if order.status != "open":
+        if not await transition(session, order.id, IN_PROGRESS, executor_id=offer.executor_id):
             await callback.answer("Исполнитель для этого заказа уже выбран.", show_alert=True)
             return
-        order.status = "in_progress"
-        order.executor_id = offer.executor_id
         await session.commit()
+        if idempotency:
+            idempotency.done()
+        channel_posts.mark_closed([order.id])
         await callback.message.edit_text(f"✅ Исполнитель выбран для заказа №{order.id}!")
         try:
             await bot.send_message(offer.executor_id, f"🎉 Поздравляем! Вас выбрали исполнителем для заказа №{order.id} ('{order.title}'). Теперь вы можете общаться с заказчиком через этот чат.")
@@ -1128,10 +1522,9 @@ async def submit_work(callback: CallbackQuery, callback_data: OrderCallback):
         if not order or order.executor_id != callback.from_user.id:
             await callback.answer("Это не ваш заказ.", show_alert=True)
             return
-        if order.status != "in_progress":
+        if not await transition(session, order.id, PENDING_APPROVAL):
             await callback.answer("Этот заказ не в работе.", show_alert=True)
             return
-        order.status = "pending_approval"
         await session.commit()
         await callback.message.edit_text("Вы сдали работу. Ожидаем подтверждения от заказчика.")
         keyboard = types.InlineKeyboardMarkup(inline_keyboard=[
@@ -1139,29 +1532,28 @@ async def submit_work(callback: CallbackQuery, callback_data: OrderCallback):
             [types.InlineKeyboardButton(text="⛔️ Открыть спор", callback_data=OrderCallback(action="dispute", order_id=order.id).pack())]])
         await bot.send_message(order.customer_id, f"🔔 Исполнитель сдал работу по заказу №{order.id} ('{order.title}').\nПожалуйста, проверьте и примите работу.", reply_markup=keyboard)
 
-@dp.callback_query(OrderCallback.filter(F.action == "accept_work"))
-async def accept_work(callback: CallbackQuery, callback_data: OrderCallback):
+@dp.callback_query(OrderCallback.filter(F.action == "accept_work"), flags={"idempotent": True})
+async def accept_work(callback: CallbackQuery, callback_data: OrderCallback, idempotency: IdempotentCall | None = None):
     async with async_session() as session:
-        order = await session.get(Order, callback_data.order_id, options=[joinedload(Order.executor)])
-        
-        if not order or order.customer_id != callback.from_user.id or order.status != "pending_approval":
+        order = await session.get(Order, callback_data.order_id)
+        if not order or order.customer_id != callback.from_user.id:
             await callback.answer("Действие не может быть выполнено.", show_alert=True)
             return
-        executor = order.executor
-        payout_amount = order.price
-        commission_amount = Decimal("0.00")
-        commission_setting = await session.get(Setting, "commission_percent")
-        if commission_setting and order.price > 0:
-            commission_percent = Decimal(commission_setting.value)
-            commission_amount = (order.price * commission_percent) / 100
-            payout_amount = order.price - commission_amount
+        order = await transition(session, order.id, COMPLETED, from_statuses=[PENDING_APPROVAL])
+        if not order:
+            await callback.answer("Действие не может быть выполнено.", show_alert=True)
+            return
+        commission_amount = Money(0)
+        commission_value = await metadata.setting("commission_percent")
+        if commission_value and order.price > 0:
+            commission_amount = order.price.percent(Decimal(commission_value))
+        payout_amount = Money(order.price - commission_amount)
 
         if payout_amount > 0:
-            executor.balance += payout_amount
-            session.add(FinancialTransaction(user_id=executor.telegram_id, type='order_reward', amount=payout_amount, order_id=order.id))
-        
-        order.status = "completed"
+            await credit_balance(session, order.executor_id, payout_amount, 'order_reward', order.id)
         await session.commit()
+        if idempotency:
+            idempotency.done()
         
         await callback.message.edit_text(f"✅ Вы успешно приняли работу по заказу №{order.id}! Сделка завершена.")
         
@@ -1192,11 +1584,9 @@ async def open_dispute(callback: CallbackQuery, callback_data: OrderCallback):
         if not order or order.customer_id != callback.from_user.id:
             await callback.answer("Это не ваш заказ.", show_alert=True)
             return
-        if order.status not in ["pending_approval", "in_progress"]:
+        if not await transition(session, order.id, DISPUTE):
             await callback.answer("Спор по этому заказу уже нельзя открыть.", show_alert=True)
             return
-        
-        order.status = "dispute"
         await session.commit()
 
         await callback.message.edit_text(f"Вы открыли спор по заказу №{callback_data.order_id}. Администратор скоро свяжется с вами.")
@@ -1214,6 +1604,53 @@ async def open_dispute(callback: CallbackQuery, callback_data: OrderCallback):
         except Exception as e:
             logging.error(f"Не удалось отправить уведомления о споре по заказу {order.id}: {e}")
 
+@dp.message(Command("broadcast"))
+@admin_only
+async def start_broadcast(message: types.Message, command: CommandObject):
+    first_line, _, rest = (command.args or "").partition("\n")
+    try:
+        segment = parse_segment(first_line.split())
+        text = rest.strip()
+    except ValueError:
+        segment = parse_segment([])
+        text = (command.args or "").strip()
+    if not text:
+        return await message.answer(
+            "Используйте: /broadcast [vip] [active=дней] [category=id]\n<i>текст рассылки со следующей строки</i>\n\n"
+            "Без фильтров сообщение получат все пользователи, не заблокировавшие бота."
+        )
+
+    progress_message = await message.answer("📣 Готовим рассылку...")
+    async with async_session() as session:
+        broadcast = await create_broadcast(session, text, message.from_user.id, **segment)
+        broadcast.progress_chat_id = progress_message.chat.id
+        broadcast.progress_message_id = progress_message.message_id
+        await session.commit()
+    await progress_message.edit_text(format_progress(broadcast) + f"\n\nОтменить: /broadcast_cancel {broadcast.id}")
+    broadcasts.start(broadcast.id)
+
+@dp.message(Command("broadcast_cancel"))
+@admin_only
+async def handle_broadcast_cancel(message: types.Message, command: CommandObject):
+    if not command.args or not command.args.isdigit():
+        return await message.answer("Укажите ID рассылки. Пример: /broadcast_cancel 3")
+    async with async_session() as session:
+        broadcast = await cancel_broadcast(session, int(command.args))
+        await session.commit()
+    if not broadcast:
+        return await message.answer("Рассылка не найдена или уже завершена.")
+    await message.answer(format_progress(broadcast))
+
+async def report_broadcast_progress(broadcast):
+    if not broadcast.progress_chat_id:
+        return
+    try:
+        await bot.edit_message_text(
+            format_progress(broadcast), chat_id=broadcast.progress_chat_id, message_id=broadcast.progress_message_id
+        )
+    except Exception as e:
+        logging.warning(f"Не удалось обновить прогресс рассылки {broadcast.id}: {e}")
+
 @dp.message(Command("set_commission"))
 @admin_only
 async def set_commission(message: types.Message, command: CommandObject):
@@ -1234,7 +1671,9 @@ async def set_commission(message: types.Message, command: CommandObject):
         else:
             commission_setting.value = str(percent)
         
+        await publish_invalidation(session, SETTINGS)
         await session.commit()
+    metadata.invalidate(SETTINGS)
     await message.answer(f"✅ Новая комиссия установлена: {percent}%")
 
 @dp.message(Command("dispute_info"))
@@ -1307,35 +1746,33 @@ async def resolve_dispute(message: types.Message, command: CommandObject):
         return await message.answer("Неверные аргументы. Пример: /resolve 123 customer")
 
     async with async_session() as session:
-        order = await session.get(Order, order_id, options=[joinedload(Order.customer), joinedload(Order.executor)])
-        if not order:
+        if not await session.get(Order, order_id):
             return await message.answer(f"Заказ с ID {order_id} не найден.")
-        if order.status != "dispute":
+        order = await transition(session, order_id, COMPLETED, from_statuses=[DISPUTE])
+        if not order:
             return await message.answer(f"Заказ №{order_id} не находится в статусе спора.")
 
         if winner == "customer":
-            if order.price > 0: order.customer.balance += order.price
-            session.add(FinancialTransaction(user_id=order.customer_id, type='dispute_resolution', amount=order.price, order_id=order.id))
+            if order.price > 0:
+                await credit_balance(session, order.customer_id, order.price, 'dispute_resolution', order.id)
             
-            winner_user = order.customer
-            loser_user = order.executor
+            winner_id = order.customer_id
+            loser_id = order.executor_id
             resolution_text = f"Спор по заказу №{order.id} решен в пользу заказчика. Сумма {order.price:.2f} USDT возвращена на его баланс."
         else:
-            if order.price > 0: order.executor.balance += order.price
-            session.add(FinancialTransaction(user_id=order.executor_id, type='dispute_resolution', amount=order.price, order_id=order.id))
+            if order.price > 0:
+                await credit_balance(session, order.executor_id, order.price, 'dispute_resolution', order.id)
             
-            winner_user = order.executor
-            loser_user = order.customer
+            winner_id = order.executor_id
+            loser_id = order.customer_id
             resolution_text = f"Спор по заказу №{order.id} решен в пользу исполнителя. Сумма {order.price:.2f} USDT переведена на его баланс."
-            
-        order.status = "completed"
         await session.commit()
         
         await message.answer(f"✅ Спор успешно решен.\n{resolution_text}")
         
         try:
-            await bot.send_message(winner_user.telegram_id, f"🟢 {resolution_text}")
-            if loser_user: await bot.send_message(loser_user.telegram_id, f"🔴 {resolution_text}")
+            await bot.send_message(winner_id, f"🟢 {resolution_text}")
+            if loser_id: await bot.send_message(loser_id, f"🔴 {resolution_text}")
         except Exception as e:
             logging.error(f"Не удалось отправить уведомления о решении спора по заказу {order.id}: {e}")
 
@@ -1381,15 +1818,13 @@ async def handle_chat_messages(message: types.Message, state: FSMContext):
             file_id = message.photo[-1].file_id
             text_content = message.caption
             file_info = await bot.get_file(file_id)
-            file_ext = file_info.file_path.split('.')[-1]
-            file_path_to_save = f"media/{file_info.file_unique_id}.{file_ext}"
-            await bot.download_file(file_info.file_path, file_path_to_save)
+            with child_span("telegram download_file", **{"telegram.file_path": file_info.file_path}):
+                file_path_to_save = await store_media(bot, file_info.file_path)
         elif message.voice:
             file_id = message.voice.file_id
             file_info = await bot.get_file(file_id)
-            file_ext = file_info.file_path.split('.')[-1]
-            file_path_to_save = f"media/{file_info.file_unique_id}.{file_ext}"
-            await bot.download_file(file_info.file_path, file_path_to_save)
+            with child_span("telegram download_file", **{"telegram.file_path": file_info.file_path}):
+                file_path_to_save = await store_media(bot, file_info.file_path)
         session.add(ChatMessage(order_id=active_order.id, sender_id=user_id, content_type=content_type, text_content=text_content, file_path=file_path_to_save))
         await session.commit()
         
@@ -1404,20 +1839,75 @@ async def handle_chat_messages(message: types.Message, state: FSMContext):
             logging.error(f"Не удалось переслать сообщение от {user_id} к {recipient_id}: {e}")
             await message.answer("❌ Не удалось доставить сообщение.")
 
+async def load_local_state():
+    """Загружает из БД то, что обработчики обновлений держат в памяти процесса."""
+    async with async_session() as session:
+        await subscription_index.load(session)
+        await channel_posts.warm(session)
+
 async def main():
     if not all([ADMIN_ID, LOG_CHANNEL_ID, ORDER_CHANNEL_ID]):
         logging.critical("Один или несколько обязательных ID (ADMIN_ID, LOG_CHANNEL_ID, ORDER_CHANNEL_ID) не указаны в .env файле!")
         return
         
-    await create_tables()
+    if not await check_schema():
+        logging.critical("Схема БД устарела. Выполните 'python -m migrations' и перезапустите бота.")
+        return
+    setup_idempotency(dp)
+    setup_activity_tracking(dp, async_session)
+    setup_throttling(dp)
+    setup_bot_metrics(dp, bot, storage, engine, METRICS_PORT, send_queues={
+        "notifications": notifications.depth,
+        "channel_posts": channel_posts.depth,
+        "channel_edits": channel_posts.edits_depth,
+    })
+    if setup_tracing("p2p-bot"):
+        setup_bot_tracing(dp, bot, engine)
+    if SQL_DEBUG:
+        setup_bot_sql_debug(dp, engine)
+    await metadata.warm(bot)
+    await metadata.listen(engine)
+    await load_local_state()
+    notifications.start()
+    channel_posts.start()
+    await channel_posts.resume_pending()
+    await membership.heartbeat()
     scheduler = AsyncIOScheduler(timezone="Etc/GMT")
-    scheduler.add_job(check_payments, 'interval', minutes=2)
+    scheduler.add_job(membership.heartbeat, 'interval', seconds=HEARTBEAT_SECONDS)
+    scheduler.add_job(check_payments, 'interval', minutes=2, max_instances=1)
+    scheduler.add_job(sweep_orders, 'interval', minutes=10, max_instances=1)
+    scheduler.add_job(refill_deposit_addresses, 'interval', minutes=1, max_instances=1, next_run_time=datetime.now(UTC))
+    scheduler.add_job(run_partition_maintenance, 'interval', days=1, max_instances=1, next_run_time=datetime.now(UTC))
+    scheduler.add_job(run_media_collection, 'interval', minutes=15, max_instances=1)
+    scheduler.add_job(remind_vip_expiry, 'interval', hours=1, max_instances=1)
+    scheduler.add_job(send_support_digests, 'interval', minutes=SUPPORT_DIGEST_MINUTES, max_instances=1)
+    # Рассылки, созданные в админ-панели, и прерванные перезапуском.
+    scheduler.add_job(broadcasts.resume_pending, 'interval', minutes=1, next_run_time=datetime.now(UTC))
+    # Посты заказов, не опубликованные из-за ошибок Telegram.
+    scheduler.add_job(channel_posts.resume_pending, 'interval', minutes=10, max_instances=1)
     scheduler.start()
-    await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
-    
-    await engine.dispose()
-    scheduler.shutdown()
+    try:
+        if BOT_POLLING:
+            # Процессов может быть несколько (check_payments и фоновые задачи делятся между ними),
+            # но обновления Telegram получает только один; остальные ждут в резерве.
+            started_first = await polling_leader.acquire()
+            if not started_first:
+                # Резерв мог ждать часами: подписки и закрытые заказы в памяти устарели.
+                await load_local_state()
+            # Накопившиеся обновления сбрасываются только при обычном запуске, не при смене ведущего.
+            await bot.delete_webhook(drop_pending_updates=started_first)
+            polling_leader.watch(dp.stop_polling)
+            await dp.start_polling(bot)
+        else:
+            await asyncio.Event().wait()
+    finally:
+        await polling_leader.release()
+        await membership.leave()
+        await notifications.close()
+        await channel_posts.close()
+        await metadata.close()
+        await dispose_engines()
+        scheduler.shutdown()
 
 if __name__ == "__main__":
     print("Запускаем бота и проверку платежей...")
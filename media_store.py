@@ -0,0 +1,232 @@
+import os
+import uuid
+import asyncio
+import hashlib
+import logging
+import time
+from datetime import datetime, timedelta, UTC
+
+from sqlalchemy import select, update, delete, text, Integer, column
+from sqlalchemy.dialects.postgresql import insert
+
+from db_models import ChatMessage, Order, Setting, UnlinkedMedia, ArchivedMedia
+from order_states import on_enter, COMPLETED, EXPIRED, DISPUTE
+
+# Произвольный постоянный ключ: чистку медиа выполняет только один процесс бота.
+MEDIA_LOCK_KEY = 72_430_003
+MEDIA_DIR = "media"
+# Файлы лежат по содержимому: media/<первые 2 символа sha256>/<sha256>.<расширение>.
+MEDIA_RETENTION_DAYS = int(os.getenv("MEDIA_RETENTION_DAYS", "30"))
+MEDIA_GC_BATCH_SIZE = int(os.getenv("MEDIA_GC_BATCH_SIZE", "500"))
+# Только что записанный файл может ещё не иметь закоммиченной строки chat_messages.
+MEDIA_GC_GRACE = timedelta(hours=1)
+LEGACY_CURSOR_KEY = "media_legacy_cursor"
+
+
+def content_path(digest: str, ext: str) -> str:
+    return f"{MEDIA_DIR}/{digest[:2]}/{digest}.{ext}"
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _place(source: str, target: str, keep_source: bool = False):
+    """Кладёт файл по адресу содержимого; если такой уже есть — оставляет существующий."""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    if os.path.exists(target):
+        # Свежая ссылка на старый файл: продлеваем ему отсрочку перед сборкой мусора.
+        os.utime(target)
+        if not keep_source:
+            os.remove(source)
+    elif keep_source:
+        os.link(source, target)
+    else:
+        os.replace(source, target)
+
+
+async def store_media(bot, telegram_path: str) -> str:
+    """Скачивает файл Telegram в хранилище; одинаковое содержимое хранится один раз. Возвращает путь для chat_messages."""
+    ext = telegram_path.rsplit(".", 1)[-1]
+    incoming = os.path.join(MEDIA_DIR, f".incoming-{uuid.uuid4().hex}")
+    await bot.download_file(telegram_path, incoming)
+    path = content_path(await asyncio.to_thread(_sha256, incoming), ext)
+    await asyncio.to_thread(_place, incoming, path)
+    return path
+
+
+@on_enter(DISPUTE)
+async def _keep_disputed_media(session, order_ids: list[int]):
+    await session.execute(update(Order).where(Order.id.in_(order_ids)).values(was_disputed=True))
+
+
+# Отвязанные пути запоминаются в unlinked_media в том же запросе: сборка мусора удаляет только их,
+# а не всё, на что в БД не осталось ссылок (например, после выгрузки секции в архив).
+_EXPIRE_MEDIA = text("""
+    WITH expired AS (
+        SELECT chat_messages.id, chat_messages.file_path
+        FROM chat_messages JOIN orders ON orders.id = chat_messages.order_id
+        WHERE chat_messages.file_path IS NOT NULL
+          AND orders.status IN (:completed, :expired)
+          AND NOT orders.was_disputed
+          AND orders.status_changed_at < :cutoff
+        LIMIT :batch_size
+    ), cleared AS (
+        UPDATE chat_messages SET file_path = NULL FROM expired WHERE chat_messages.id = expired.id
+    ), queued AS (
+        INSERT INTO unlinked_media (path) SELECT DISTINCT file_path FROM expired ON CONFLICT DO NOTHING
+    )
+    SELECT count(*) AS cleared FROM expired
+""").columns(column("cleared", Integer))
+
+
+async def expire_media(conn, now: datetime | None = None, batch_size: int = MEDIA_GC_BATCH_SIZE) -> int:
+    """
+    Отвязывает файлы от сообщений заказов, завершённых больше MEDIA_RETENTION_DAYS назад и ни разу
+    не бывших в споре. Сами файлы удаляет collect_unlinked, когда на них не остаётся ссылок.
+    """
+    cutoff = (now or datetime.now(UTC)) - timedelta(days=MEDIA_RETENTION_DAYS)
+    total = 0
+    while True:
+        cleared = await conn.scalar(_EXPIRE_MEDIA, {
+            "completed": COMPLETED, "expired": EXPIRED, "cutoff": cutoff, "batch_size": batch_size
+        })
+        total += cleared
+        if cleared < batch_size:
+            return total
+
+
+async def _referenced(conn, paths: list[str]) -> set[str]:
+    if not paths:
+        return set()
+    return set(await conn.scalars(select(ChatMessage.file_path).where(ChatMessage.file_path.in_(paths)).distinct()))
+
+
+async def _archived(conn, paths: list[str]) -> set[str]:
+    if not paths:
+        return set()
+    return set(await conn.scalars(select(ArchivedMedia.path).where(ArchivedMedia.path.in_(paths))))
+
+
+def _scan_after(directory: str, cursor: str | None, count: int) -> tuple[list[tuple[str, float]], bool]:
+    """
+    До count файлов каталога, идущих в порядке scandir после файла cursor, и признак того,
+    что каталог пройден до конца. Если файла cursor уже нет, обход начинается сначала.
+    """
+    files, seen = [], cursor is None
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not seen:
+                    seen = entry.name == cursor
+                elif entry.is_file(follow_symlinks=False):
+                    files.append((entry.name, entry.stat().st_mtime))
+                    if len(files) == count:
+                        return files, False
+    except FileNotFoundError:
+        pass
+    if not seen:
+        return _scan_after(directory, None, count)
+    return files, True
+
+
+def _remove(paths: list[str]):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _remove_untouched(paths: list[str], deadline: float) -> tuple[list[str], int]:
+    """
+    Удаляет файлы, не тронутые после deadline. mtime перечитывается прямо перед удалением:
+    _place продлевает его, когда то же содержимое приходит в новом сообщении, строка которого
+    может быть ещё не закоммичена. Возвращает (обработанные пути, число удалённых файлов).
+    """
+    done, removed = [], 0
+    for path in paths:
+        try:
+            if os.stat(path).st_mtime >= deadline:
+                continue
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+        done.append(path)
+    return done, removed
+
+
+async def collect_unlinked(conn, grace: timedelta = MEDIA_GC_GRACE, batch_size: int = MEDIA_GC_BATCH_SIZE) -> int:
+    """Удаляет файлы из unlinked_media, на которые больше не ссылаются ни сообщения, ни архив секций."""
+    deadline = time.time() - grace.total_seconds()
+    removed, last_path = 0, ""
+    while True:
+        paths = list(await conn.scalars(
+            select(UnlinkedMedia.path).where(UnlinkedMedia.path > last_path).order_by(UnlinkedMedia.path).limit(batch_size)
+        ))
+        if not paths:
+            return removed
+        last_path = paths[-1]
+        in_use = await _referenced(conn, paths) | await _archived(conn, paths)
+        # Используемый файл снова попадёт в очередь, когда истечёт срок и у последней ссылки на него.
+        done, count = await asyncio.to_thread(_remove_untouched, [path for path in paths if path not in in_use], deadline)
+        removed += count
+        await conn.execute(delete(UnlinkedMedia).where(UnlinkedMedia.path.in_([*in_use, *done])))
+
+
+async def migrate_legacy(conn, limit: int = MEDIA_GC_BATCH_SIZE, grace: timedelta = MEDIA_GC_GRACE) -> int:
+    """
+    Разбирает следующие limit файлов прежней плоской раскладки media/<file_unique_id>.<ext>: используемые
+    переносятся в хранилище по содержимому, брошенные удаляются. Файлы, на которые ссылается только
+    архив секций, остаются на месте: по их путям архив и читается.
+    """
+    # Позиция обхода хранится в settings: оставшиеся на месте файлы (архивные и свежие)
+    # не просматриваются заново при каждом запуске, а только на следующем круге.
+    cursor = await conn.scalar(select(Setting.value).where(Setting.key == LEGACY_CURSOR_KEY)) or None
+    files, finished = await asyncio.to_thread(_scan_after, MEDIA_DIR, cursor, limit)
+    deadline = time.time() - grace.total_seconds()
+    paths = {f"{MEDIA_DIR}/{name}": (name, mtime) for name, mtime in files}
+    referenced = await _referenced(conn, list(paths))
+    archived = await _archived(conn, [path for path in paths if path not in referenced])
+    processed = []
+    for path, (name, mtime) in paths.items():
+        if path in referenced:
+            target = content_path(await asyncio.to_thread(_sha256, path), path.rsplit(".", 1)[-1])
+            # Старый файл удаляется только после того, как сообщения переписаны на новый путь.
+            await asyncio.to_thread(_place, path, target, True)
+            await conn.execute(update(ChatMessage).where(ChatMessage.file_path == path).values(file_path=target))
+            processed.append(path)
+        elif path not in archived and mtime < deadline:
+            processed.append(path)
+        else:
+            # Курсор — последний оставшийся файл: разобранные удаляются, и с них продолжить нельзя.
+            cursor = name
+    await asyncio.to_thread(_remove, processed)
+    cursor = "" if finished else cursor or ""
+    await conn.execute(
+        insert(Setting)
+        .values(key=LEGACY_CURSOR_KEY, value=cursor)
+        .on_conflict_do_update(index_elements=[Setting.key], set_={"value": cursor})
+    )
+    return len(processed)
+
+
+async def collect_media(engine):
+    """Периодическая чистка: срок хранения, перенос старой раскладки и удаление отвязанных файлов."""
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        if not await conn.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": MEDIA_LOCK_KEY}):
+            return
+        try:
+            expired = await expire_media(conn)
+            migrated = await migrate_legacy(conn)
+            removed = await collect_unlinked(conn)
+            if expired or migrated or removed:
+                logging.info(f"Медиа: отвязано {expired}, разобрано в корне {migrated}, удалено {removed}")
+        finally:
+            await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MEDIA_LOCK_KEY})
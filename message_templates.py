@@ -0,0 +1,165 @@
+import os
+from collections import OrderedDict
+from datetime import datetime, UTC
+
+from order_states import on_enter, STATUS_EMOJI, IN_PROGRESS, PENDING_APPROVAL, COMPLETED, DISPUTE, EXPIRED
+
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "20000"))
+
+ORDER_CARD = "order_card"
+ORDER_LINE = "order_line"
+DEAL_LINE = "deal_line"
+PUBLIC_PROFILE = "public_profile"
+OWN_PROFILE = "own_profile"
+ADMIN_PROFILE = "admin_profile"
+
+# Шаблоны собраны в одном месте и форматируются одним вызовом str.format вместо цепочек text +=.
+ORDER_CARD_TEMPLATE = (
+    "<b>Заказ №{id}</b> | {title}\n"
+    "<b>Категория:</b> {category}\n"
+    "<b>Цена:</b> {price:.2f} USDT\n"
+    "<b>Заказчик:</b> {customer}\n"
+    "<i>{description}...</i>\n"
+    "➡️ /order {id} - для деталей и отклика\n\n"
+)
+ORDER_LINE_TEMPLATE = "{emoji} №{id}: {title}{category}"
+DEAL_LINE_TEMPLATE = "• <b>№{id}:</b> {title} ({price:.2f} USDT)"
+PUBLIC_PROFILE_TEMPLATE = (
+    "<b>👤 Профиль пользователя @{username}</b>\n\n"
+    "<b>Рейтинг:</b> {rating:.2f} ⭐ ({reviews_count} отзывов)\n"
+    "<b>Завершено сделок:</b> {completed_deals}\n"
+    "<b>На сервисе с:</b> {registered:%d.%m.%Y}"
+)
+OWN_PROFILE_TEMPLATE = (
+    "<b>👤 Ваш профиль</b>\n\n"
+    "<b>Баланс:</b> <code>{balance:.2f} USDT</code>\n"
+    "<b>Рейтинг:</b> {rating:.2f} ⭐ ({reviews_count} отзывов)\n"
+    "<b>VIP Статус:</b> {vip_status}"
+)
+ADMIN_PROFILE_TEMPLATE = (
+    "<b>👤 Информация о пользователе:</b>\n\n"
+    "<b>ID:</b> <code>{id}</code>\n"
+    "<b>Username:</b> @{username}\n"
+    "<b>Баланс:</b> {balance:.2f} USDT\n"
+    "<b>Рейтинг:</b> {rating:.2f} ⭐ ({reviews_count} отзывов)\n"
+    "<b>Статус:</b> {status}\n"
+    "<b>Дата регистрации:</b> {registered:%Y-%m-%d %H:%M}"
+)
+FEED_HEADER = "<b>🔥 Доступные заказы:</b>\n\n"
+FEED_EMPTY = "На данный момент нет доступных заказов. Загляните позже!"
+
+
+class RenderCache:
+    """
+    LRU отрендеренных фрагментов по (вид, id сущности). Рядом с текстом хранится версия — поля строки,
+    от которых зависит фрагмент, — так что изменённая сущность перерисовывается даже в другом процессе бота.
+    """
+
+    def __init__(self, maxsize: int = RENDER_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[tuple[str, int], tuple[tuple, str]] = OrderedDict()
+
+    def get(self, kind: str, entity_id: int, version: tuple, render) -> str:
+        key = (kind, entity_id)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            self._entries.move_to_end(key)
+            return entry[1]
+        text = render()
+        self._entries[key] = (version, text)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return text
+
+    def invalidate(self, kind: str, entity_ids: list[int]):
+        for entity_id in entity_ids:
+            self._entries.pop((kind, entity_id), None)
+
+
+render_cache = RenderCache()
+
+
+@on_enter(IN_PROGRESS)
+@on_enter(PENDING_APPROVAL)
+@on_enter(COMPLETED)
+@on_enter(DISPUTE)
+@on_enter(EXPIRED)
+async def _invalidate_orders(session, order_ids: list[int]):
+    # Заказ ушёл из ленты или сменил статус — его фрагменты больше не нужны.
+    for kind in (ORDER_CARD, ORDER_LINE, DEAL_LINE):
+        render_cache.invalidate(kind, order_ids)
+
+
+def order_card(order) -> str:
+    """Карточка заказа в ленте; заказ должен быть загружен с customer и category."""
+    category = order.category.name if order.category else "Без категории"
+    customer = f"@{order.customer.username}" if order.customer.username else "Скрыт"
+    return render_cache.get(
+        ORDER_CARD, order.id, (order.status_changed_at, category, customer),
+        lambda: ORDER_CARD_TEMPLATE.format(
+            id=order.id, title=order.title, category=category, price=order.price,
+            customer=customer, description=order.description[:100],
+        ),
+    )
+
+
+def orders_feed(orders: list) -> str:
+    if not orders:
+        return FEED_EMPTY
+    return "".join([FEED_HEADER, *map(order_card, orders)])
+
+
+def order_line(order) -> str:
+    """Строка заказа в «Моих заказах» без роли пользователя: она зависит от смотрящего."""
+    category = f" ({order.category.name})" if order.category else ""
+    return render_cache.get(
+        ORDER_LINE, order.id, (order.status, order.status_changed_at, category),
+        lambda: ORDER_LINE_TEMPLATE.format(
+            emoji=STATUS_EMOJI.get(order.status, ""), id=order.id, title=order.title, category=category,
+        ),
+    )
+
+
+def deal_line(order) -> str:
+    return render_cache.get(
+        DEAL_LINE, order.id, (order.status_changed_at,),
+        lambda: DEAL_LINE_TEMPLATE.format(id=order.id, title=order.title, price=order.price),
+    )
+
+
+def public_profile_header(user, completed_deals: int) -> str:
+    username = user.username or "N/A"
+    return render_cache.get(
+        PUBLIC_PROFILE, user.telegram_id, (username, user.rating, user.reviews_count, completed_deals),
+        lambda: PUBLIC_PROFILE_TEMPLATE.format(
+            username=username, rating=user.rating, reviews_count=user.reviews_count,
+            completed_deals=completed_deals, registered=user.registration_date,
+        ),
+    )
+
+
+def own_profile_header(user) -> str:
+    is_vip = bool(user.vip_expires_at and user.vip_expires_at > datetime.now(UTC))
+    version = (user.balance, user.rating, user.reviews_count, is_vip and user.vip_expires_at)
+
+    def render():
+        text = OWN_PROFILE_TEMPLATE.format(
+            balance=user.balance, rating=user.rating, reviews_count=user.reviews_count,
+            vip_status="Активен ✅" if is_vip else "Неактивен ❌",
+        )
+        return f"{text}\n  (до {user.vip_expires_at:%d.%m.%Y})" if is_vip else text
+
+    return render_cache.get(OWN_PROFILE, user.telegram_id, version, render)
+
+
+def admin_profile_card(user) -> str:
+    username = user.username or "N/A"
+    return render_cache.get(
+        ADMIN_PROFILE, user.telegram_id, (username, user.balance, user.rating, user.reviews_count, user.is_blocked),
+        lambda: ADMIN_PROFILE_TEMPLATE.format(
+            id=user.telegram_id, username=username, balance=user.balance, rating=user.rating,
+            reviews_count=user.reviews_count, status="🔴 Заблокирован" if user.is_blocked else "🟢 Активен",
+            registered=user.registration_date,
+        ),
+    )
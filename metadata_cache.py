@@ -0,0 +1,82 @@
+import time
+import logging
+
+from sqlalchemy import select, text
+
+from db import async_session
+from db_models import Category, Setting
+
+# Канал Postgres LISTEN/NOTIFY: админ-панель и бот работают в разных процессах.
+INVALIDATION_CHANNEL = "metadata_cache"
+CATEGORIES = "categories"
+SETTINGS = "settings"
+
+
+class MetadataCache:
+    """Редко меняющиеся данные, которые раньше читались из БД и Bot API на каждом запросе."""
+
+    def __init__(self, build_categories_keyboard, ttl: float = 300):
+        self.ttl = ttl
+        self.bot_username = None
+        self._build_categories_keyboard = build_categories_keyboard
+        self._categories = []
+        self._categories_keyboard = None
+        self._settings = {}
+        self._loaded_at = {CATEGORIES: 0.0, SETTINGS: 0.0}
+        self._listen_conn = None
+
+    async def warm(self, bot):
+        self.bot_username = (await bot.get_me()).username
+        await self._load_categories()
+        await self._load_settings()
+
+    def invalidate(self, kind: str | None = None):
+        for key in ([kind] if kind in self._loaded_at else self._loaded_at):
+            self._loaded_at[key] = 0.0
+
+    def _is_stale(self, kind: str) -> bool:
+        return time.monotonic() - self._loaded_at[kind] > self.ttl
+
+    async def _load_categories(self):
+        async with async_session() as session:
+            categories = (await session.scalars(select(Category).order_by(Category.name))).all()
+        self._categories = categories
+        self._categories_keyboard = self._build_categories_keyboard(categories) if categories else None
+        self._loaded_at[CATEGORIES] = time.monotonic()
+
+    async def _load_settings(self):
+        async with async_session() as session:
+            settings = (await session.scalars(select(Setting))).all()
+        self._settings = {setting.key: setting.value for setting in settings}
+        self._loaded_at[SETTINGS] = time.monotonic()
+
+    async def categories(self):
+        """Возвращает (список категорий, готовая клавиатура выбора)."""
+        if self._is_stale(CATEGORIES):
+            await self._load_categories()
+        return self._categories, self._categories_keyboard
+
+    async def setting(self, key: str, default: str | None = None):
+        if self._is_stale(SETTINGS):
+            await self._load_settings()
+        return self._settings.get(key, default)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        logging.info(f"Сброс кэша метаданных: {payload or 'all'}")
+        self.invalidate(payload or None)
+
+    async def listen(self, engine):
+        """Подписывается на уведомления об изменениях из других процессов."""
+        self._listen_conn = await engine.connect()
+        raw_connection = await self._listen_conn.get_raw_connection()
+        await raw_connection.driver_connection.add_listener(INVALIDATION_CHANNEL, self._on_notify)
+
+    async def close(self):
+        if self._listen_conn is not None:
+            await self._listen_conn.close()
+            self._listen_conn = None
+
+
+async def publish_invalidation(session, kind: str):
+    """Уведомление уходит подписчикам при фиксации транзакции сессии."""
+    await session.execute(text("SELECT pg_notify(:channel, :kind)"), {"channel": INVALIDATION_CHANNEL, "kind": kind})
@@ -0,0 +1,174 @@
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from prometheus_client import Counter, Gauge, Histogram, start_http_server, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import REGISTRY, CounterMetricFamily, GaugeMetricFamily, SummaryMetricFamily
+from sqlalchemy import event
+
+from db import pool_wait_stats
+
+UPDATES_TOTAL = Counter("bot_updates_total", "Полученные обновления Telegram", ["event_type"])
+HANDLER_LATENCY = Histogram("bot_handler_duration_seconds", "Время выполнения обработчиков aiogram", ["handler"])
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Исключения в обработчиках aiogram", ["handler"])
+BOT_API_LATENCY = Histogram("bot_api_request_duration_seconds", "Время запросов к Telegram Bot API", ["method"])
+BOT_API_ERRORS = Counter("bot_api_errors_total", "Ошибки запросов к Telegram Bot API", ["method"])
+BOT_API_IN_FLIGHT = Gauge("bot_api_requests_in_flight", "Исходящие запросы к Bot API, ожидающие ответа")
+DB_QUERIES = Counter("db_queries_total", "Выполненные SQL-запросы", ["operation"])
+DB_QUERY_LATENCY = Histogram("db_query_duration_seconds", "Время выполнения SQL-запросов", ["operation"])
+DB_QUERY_ERRORS = Counter("db_query_errors_total", "SQL-запросы, завершившиеся ошибкой", ["operation"])
+EXTERNAL_LATENCY = Histogram("external_api_duration_seconds", "Время запросов к внешним API", ["service", "operation"])
+EXTERNAL_ERRORS = Counter("external_api_errors_total", "Ошибки запросов к внешним API", ["service", "operation"])
+JOB_LATENCY = Histogram(
+    "scheduler_job_duration_seconds", "Время выполнения фоновых задач", ["job"],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+HTTP_LATENCY = Histogram("admin_http_request_duration_seconds", "Время обработки запросов админ-панели", ["method", "route"])
+
+
+def _operation(statement: str) -> str:
+    return statement.lstrip().split(" ", 1)[0].upper() or "OTHER"
+
+
+def instrument_engine(engine):
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["metrics_query_start"].pop()
+        operation = _operation(statement)
+        DB_QUERIES.labels(operation).inc()
+        DB_QUERY_LATENCY.labels(operation).observe(elapsed)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _handle_error(exception_context):
+        starts = exception_context.connection.info.get("metrics_query_start") if exception_context.connection else None
+        if starts:
+            starts.pop()
+        DB_QUERY_ERRORS.labels(_operation(exception_context.statement or "")).inc()
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Внешний middleware на dp.update: считает входящий поток обновлений."""
+
+    async def __call__(self, handler, event, data):
+        UPDATES_TOTAL.labels(event.event_type).inc()
+        return await handler(event, data)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Внутренний middleware: к этому моменту aiogram уже выбрал обработчик по фильтрам."""
+
+    async def __call__(self, handler, event, data):
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object else "unknown"
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.labels(name).inc()
+            raise
+        finally:
+            HANDLER_LATENCY.labels(name).observe(time.perf_counter() - started)
+
+
+class BotApiMetricsMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot, method):
+        method_name = type(method).__name__
+        BOT_API_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            BOT_API_ERRORS.labels(method_name).inc()
+            raise
+        finally:
+            BOT_API_IN_FLIGHT.dec()
+            BOT_API_LATENCY.labels(method_name).observe(time.perf_counter() - started)
+
+
+@contextmanager
+def observe_external(service: str, operation: str):
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        EXTERNAL_ERRORS.labels(service, operation).inc()
+        raise
+    finally:
+        EXTERNAL_LATENCY.labels(service, operation).observe(time.perf_counter() - started)
+
+
+def timed_job(name: str):
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            with JOB_LATENCY.labels(name).time():
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class PoolWaitCollector:
+    def collect(self):
+        yield SummaryMetricFamily(
+            "db_pool_wait_seconds", "Ожидание свободного соединения в пуле БД",
+            count_value=pool_wait_stats.count, sum_value=pool_wait_stats.total_seconds
+        )
+        yield GaugeMetricFamily("db_pool_wait_max_seconds", "Максимальное ожидание соединения в пуле БД", value=pool_wait_stats.max_seconds)
+        yield CounterMetricFamily("db_pool_timeouts", "Таймауты ожидания соединения в пуле БД", value=pool_wait_stats.timeouts)
+
+
+class FSMStateCollector:
+    """Считает пользователей в каждом состоянии FSM на момент опроса."""
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def collect(self):
+        counts = {}
+        for record in list(self.storage.storage.values()):
+            if record.state:
+                counts[record.state] = counts.get(record.state, 0) + 1
+        family = GaugeMetricFamily("bot_fsm_states", "Пользователи в состояниях FSM", labels=["state"])
+        for state, count in counts.items():
+            family.add_metric([state], count)
+        yield family
+
+
+class SendQueueCollector:
+    """Глубина очередей исходящих отправок: сообщения, ещё не переданные в Bot API."""
+
+    def __init__(self, queues: dict):
+        self.queues = queues
+
+    def collect(self):
+        family = GaugeMetricFamily("bot_send_queue_depth", "Отправки, ожидающие в очереди", labels=["queue"])
+        for name, depth in self.queues.items():
+            family.add_metric([name], depth())
+        yield family
+
+
+REGISTRY.register(PoolWaitCollector())
+
+
+def setup_bot_metrics(dp, bot, storage, engine, port: int, send_queues: dict | None = None):
+    instrument_engine(engine)
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    dp.message.middleware(HandlerMetricsMiddleware())
+    dp.callback_query.middleware(HandlerMetricsMiddleware())
+    bot.session.middleware(BotApiMetricsMiddleware())
+    REGISTRY.register(FSMStateCollector(storage))
+    if send_queues:
+        REGISTRY.register(SendQueueCollector(send_queues))
+    start_http_server(port)
+
+
+def render_latest():
+    return generate_latest(), CONTENT_TYPE_LATEST
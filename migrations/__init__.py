@@ -0,0 +1,72 @@
+import importlib
+import logging
+import pkgutil
+import re
+
+from sqlalchemy import text
+
+# Произвольный постоянный ключ: не даёт двум процессам применять миграции одновременно.
+MIGRATIONS_LOCK_KEY = 72_430_001
+_MODULE_RE = re.compile(r"^v(\d{4})_\w+$")
+
+
+def discover_migrations():
+    """Возвращает модули миграций пакета, отсортированные по номеру версии."""
+    migrations = []
+    for module_info in pkgutil.iter_modules(__path__):
+        match = _MODULE_RE.match(module_info.name)
+        if match:
+            module = importlib.import_module(f"{__name__}.{module_info.name}")
+            migrations.append((int(match.group(1)), module))
+    return sorted(migrations, key=lambda item: item[0])
+
+
+async def _ensure_version_table(conn):
+    await conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, "
+        "description VARCHAR(255) NOT NULL, "
+        "applied_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+    ))
+
+
+async def _applied_versions(conn) -> set[int]:
+    result = await conn.execute(text("SELECT version FROM schema_migrations"))
+    return set(result.scalars().all())
+
+
+async def pending_migrations(engine):
+    async with engine.begin() as conn:
+        await _ensure_version_table(conn)
+        applied = await _applied_versions(conn)
+    return [(version, module) for version, module in discover_migrations() if version not in applied]
+
+
+async def run_migrations(engine):
+    async with engine.connect() as lock_conn:
+        lock_conn = await lock_conn.execution_options(isolation_level="AUTOCOMMIT")
+        await lock_conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATIONS_LOCK_KEY})
+        try:
+            for version, module in await pending_migrations(engine):
+                logging.info(f"Применяю миграцию {version:04d}: {module.DESCRIPTION}")
+                if getattr(module, "TRANSACTIONAL", True):
+                    async with engine.begin() as conn:
+                        for statement in module.STATEMENTS:
+                            await conn.execute(text(statement))
+                        await _record(conn, version, module.DESCRIPTION)
+                else:
+                    # CREATE INDEX CONCURRENTLY и подобные команды нельзя выполнять внутри транзакции.
+                    async with engine.connect() as conn:
+                        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                        for statement in module.STATEMENTS:
+                            await conn.execute(text(statement))
+                        await _record(conn, version, module.DESCRIPTION)
+        finally:
+            await lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATIONS_LOCK_KEY})
+
+
+async def _record(conn, version: int, description: str):
+    await conn.execute(
+        text("INSERT INTO schema_migrations (version, description) VALUES (:version, :description)"),
+        {"version": version, "description": description}
+    )
@@ -0,0 +1,20 @@
+from dotenv import load_dotenv
+load_dotenv()
+
+import asyncio
+import logging
+
+from db import dispose_engines, engine
+from migrations import run_migrations
+
+
+async def main():
+    try:
+        await run_migrations(engine)
+    finally:
+        await dispose_engines()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
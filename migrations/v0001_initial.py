@@ -0,0 +1,73 @@
+DESCRIPTION = "Базовая схема (таблицы, ранее создаваемые через create_all)"
+
+# IF NOT EXISTS позволяет принять под управление базы, созданные старым create_tables().
+STATEMENTS = [
+    """CREATE TABLE IF NOT EXISTS categories (
+        id SERIAL PRIMARY KEY,
+        name VARCHAR(100) NOT NULL UNIQUE
+    )""",
+    """CREATE TABLE IF NOT EXISTS users (
+        id SERIAL PRIMARY KEY,
+        telegram_id BIGINT NOT NULL,
+        username VARCHAR(32),
+        balance NUMERIC(10, 2),
+        wallet_address VARCHAR(64) UNIQUE,
+        rating NUMERIC(3, 2),
+        reviews_count INTEGER,
+        registration_date TIMESTAMPTZ,
+        is_blocked BOOLEAN NOT NULL,
+        vip_expires_at TIMESTAMPTZ
+    )""",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_users_telegram_id ON users (telegram_id)",
+    """CREATE TABLE IF NOT EXISTS orders (
+        id SERIAL PRIMARY KEY,
+        title VARCHAR(100) NOT NULL,
+        description VARCHAR(1000),
+        price NUMERIC(10, 2) NOT NULL,
+        status VARCHAR(20) NOT NULL,
+        customer_id BIGINT NOT NULL REFERENCES users (telegram_id),
+        executor_id BIGINT REFERENCES users (telegram_id),
+        creation_date TIMESTAMPTZ,
+        category_id INTEGER REFERENCES categories (id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS offers (
+        id SERIAL PRIMARY KEY,
+        order_id INTEGER NOT NULL REFERENCES orders (id),
+        executor_id BIGINT NOT NULL REFERENCES users (telegram_id),
+        message TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS chat_messages (
+        id SERIAL PRIMARY KEY,
+        order_id INTEGER NOT NULL REFERENCES orders (id),
+        sender_id BIGINT NOT NULL,
+        timestamp TIMESTAMPTZ,
+        content_type VARCHAR(20) NOT NULL,
+        text_content TEXT,
+        file_path VARCHAR(255)
+    )""",
+    """CREATE TABLE IF NOT EXISTS reviews (
+        id SERIAL PRIMARY KEY,
+        order_id INTEGER NOT NULL REFERENCES orders (id),
+        reviewer_id BIGINT NOT NULL REFERENCES users (telegram_id),
+        reviewee_id BIGINT NOT NULL REFERENCES users (telegram_id),
+        rating INTEGER NOT NULL,
+        text TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS transactions (
+        id SERIAL PRIMARY KEY,
+        txid VARCHAR(128) NOT NULL
+    )""",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_transactions_txid ON transactions (txid)",
+    """CREATE TABLE IF NOT EXISTS settings (
+        key VARCHAR(50) PRIMARY KEY,
+        value VARCHAR(255) NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS financial_transactions (
+        id SERIAL PRIMARY KEY,
+        user_id BIGINT NOT NULL REFERENCES users (telegram_id),
+        type VARCHAR(50) NOT NULL,
+        amount NUMERIC(10, 2) NOT NULL,
+        order_id INTEGER,
+        timestamp TIMESTAMPTZ
+    )""",
+]
@@ -0,0 +1,15 @@
+DESCRIPTION = "Индексы для фильтров в горячих обработчиках"
+
+# Индексы строятся CONCURRENTLY, чтобы не блокировать запись в работающей базе.
+TRANSACTIONAL = False
+
+STATEMENTS = [
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_orders_status_creation_date ON orders (status, creation_date)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_orders_customer_id ON orders (customer_id)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_orders_executor_id ON orders (executor_id)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_offers_order_id_executor_id ON offers (order_id, executor_id)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chat_messages_order_id_timestamp ON chat_messages (order_id, timestamp)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_financial_transactions_user_id_timestamp ON financial_transactions (user_id, timestamp)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_reviews_reviewee_id ON reviews (reviewee_id)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_username ON users (username)",
+]
@@ -0,0 +1,7 @@
+DESCRIPTION = "Индекс (order_id, id) для постраничного просмотра откликов"
+
+TRANSACTIONAL = False
+
+STATEMENTS = [
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_offers_order_id_id ON offers (order_id, id)",
+]
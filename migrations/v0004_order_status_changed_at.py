@@ -0,0 +1,7 @@
+DESCRIPTION = "Время последней смены статуса заказа для автоматического закрытия по срокам"
+
+STATEMENTS = [
+    "ALTER TABLE orders ADD COLUMN IF NOT EXISTS status_changed_at TIMESTAMP WITH TIME ZONE",
+    "UPDATE orders SET status_changed_at = creation_date WHERE status_changed_at IS NULL",
+    "ALTER TABLE orders ALTER COLUMN status_changed_at SET DEFAULT now()",
+]
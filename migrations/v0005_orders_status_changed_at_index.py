@@ -0,0 +1,7 @@
+DESCRIPTION = "Индекс (status, status_changed_at) для фоновой обработки просроченных заказов"
+
+TRANSACTIONAL = False
+
+STATEMENTS = [
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_orders_status_status_changed_at ON orders (status, status_changed_at)",
+]
@@ -0,0 +1,26 @@
+DESCRIPTION = "Счётчики активных заказов и откликов, отметка о напоминании про окончание VIP"
+
+STATEMENTS = [
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS active_orders_count INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS active_offers_count INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS vip_reminded_for TIMESTAMP WITH TIME ZONE",
+    """
+    UPDATE users SET active_orders_count = counts.amount
+    FROM (
+        SELECT customer_id, COUNT(*) AS amount FROM orders
+        WHERE status IN ('open', 'in_progress', 'pending_approval', 'dispute')
+        GROUP BY customer_id
+    ) AS counts
+    WHERE users.telegram_id = counts.customer_id
+    """,
+    """
+    UPDATE users SET active_offers_count = counts.amount
+    FROM (
+        SELECT offers.executor_id, COUNT(*) AS amount FROM offers
+        JOIN orders ON orders.id = offers.order_id
+        WHERE orders.status = 'open'
+        GROUP BY offers.executor_id
+    ) AS counts
+    WHERE users.telegram_id = counts.executor_id
+    """,
+]
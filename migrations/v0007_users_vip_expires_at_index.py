@@ -0,0 +1,7 @@
+DESCRIPTION = "Частичный индекс по vip_expires_at для рассылки напоминаний"
+
+TRANSACTIONAL = False
+
+STATEMENTS = [
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_vip_expires_at ON users (vip_expires_at) WHERE vip_expires_at IS NOT NULL",
+]
@@ -0,0 +1,8 @@
+DESCRIPTION = "Индексы (участник, status_changed_at) для постраничной истории заказов"
+
+TRANSACTIONAL = False
+
+STATEMENTS = [
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_orders_customer_id_status_changed_at ON orders (customer_id, status_changed_at)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_orders_executor_id_status_changed_at ON orders (executor_id, status_changed_at)",
+]
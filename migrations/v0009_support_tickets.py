@@ -0,0 +1,34 @@
+DESCRIPTION = "Тикеты поддержки, их сообщения, связь сообщений агента с тикетом и статус агентов"
+
+STATEMENTS = [
+    """CREATE TABLE IF NOT EXISTS support_tickets (
+        id SERIAL PRIMARY KEY,
+        user_id BIGINT NOT NULL REFERENCES users (telegram_id),
+        agent_id BIGINT NOT NULL,
+        status VARCHAR(20) NOT NULL,
+        created_at TIMESTAMPTZ,
+        closed_at TIMESTAMPTZ
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_support_tickets_user_id_status ON support_tickets (user_id, status)",
+    "CREATE INDEX IF NOT EXISTS ix_support_tickets_agent_id_status ON support_tickets (agent_id, status)",
+    """CREATE TABLE IF NOT EXISTS support_messages (
+        id SERIAL PRIMARY KEY,
+        ticket_id INTEGER NOT NULL REFERENCES support_tickets (id),
+        sender_id BIGINT NOT NULL,
+        text TEXT NOT NULL,
+        delivered BOOLEAN NOT NULL DEFAULT FALSE,
+        created_at TIMESTAMPTZ
+    )""",
+    """CREATE INDEX IF NOT EXISTS ix_support_messages_ticket_id_undelivered
+        ON support_messages (ticket_id) WHERE delivered IS false""",
+    """CREATE TABLE IF NOT EXISTS support_message_links (
+        chat_id BIGINT NOT NULL,
+        message_id BIGINT NOT NULL,
+        ticket_id INTEGER NOT NULL REFERENCES support_tickets (id),
+        PRIMARY KEY (chat_id, message_id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS support_agents (
+        telegram_id BIGINT PRIMARY KEY,
+        is_online BOOLEAN NOT NULL DEFAULT TRUE
+    )""",
+]
@@ -0,0 +1,24 @@
+DESCRIPTION = "Рассылки: таблица broadcasts, признак доступности пользователя и время последней активности"
+
+STATEMENTS = [
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS is_active BOOLEAN NOT NULL DEFAULT TRUE",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS last_seen_at TIMESTAMPTZ",
+    """CREATE TABLE IF NOT EXISTS broadcasts (
+        id SERIAL PRIMARY KEY,
+        text TEXT NOT NULL,
+        vip_only BOOLEAN NOT NULL DEFAULT FALSE,
+        active_days INTEGER,
+        category_id INTEGER REFERENCES categories (id) ON DELETE SET NULL,
+        status VARCHAR(20) NOT NULL,
+        created_by BIGINT NOT NULL,
+        created_at TIMESTAMPTZ,
+        finished_at TIMESTAMPTZ,
+        last_user_id INTEGER NOT NULL DEFAULT 0,
+        total INTEGER NOT NULL DEFAULT 0,
+        sent INTEGER NOT NULL DEFAULT 0,
+        failed INTEGER NOT NULL DEFAULT 0,
+        blocked INTEGER NOT NULL DEFAULT 0,
+        progress_chat_id BIGINT,
+        progress_message_id BIGINT
+    )""",
+]
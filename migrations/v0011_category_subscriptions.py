@@ -0,0 +1,13 @@
+DESCRIPTION = "Подписки исполнителей на категории и диапазоны цен"
+
+STATEMENTS = [
+    """CREATE TABLE IF NOT EXISTS category_subscriptions (
+        id SERIAL PRIMARY KEY,
+        user_id BIGINT NOT NULL REFERENCES users (telegram_id),
+        category_id INTEGER NOT NULL REFERENCES categories (id) ON DELETE CASCADE,
+        min_price NUMERIC(10, 2),
+        max_price NUMERIC(10, 2),
+        created_at TIMESTAMPTZ,
+        CONSTRAINT uq_category_subscriptions_user_id_category_id UNIQUE (user_id, category_id)
+    )""",
+]
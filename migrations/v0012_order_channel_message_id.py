@@ -0,0 +1,5 @@
+DESCRIPTION = "Идентификатор поста заказа в канале для правки при закрытии"
+
+STATEMENTS = [
+    "ALTER TABLE orders ADD COLUMN IF NOT EXISTS channel_message_id BIGINT",
+]
@@ -0,0 +1,12 @@
+DESCRIPTION = "Пул заранее созданных адресов для пополнения"
+
+STATEMENTS = [
+    """CREATE TABLE IF NOT EXISTS deposit_addresses (
+        id SERIAL PRIMARY KEY,
+        address VARCHAR(64) NOT NULL UNIQUE,
+        user_id BIGINT REFERENCES users (telegram_id),
+        created_at TIMESTAMPTZ,
+        assigned_at TIMESTAMPTZ
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_deposit_addresses_free ON deposit_addresses (id) WHERE user_id IS NULL",
+]
@@ -0,0 +1,8 @@
+DESCRIPTION = "Аренды процессов бота для распределения кошельков при проверке платежей"
+
+STATEMENTS = [
+    """CREATE TABLE IF NOT EXISTS worker_leases (
+        worker_id VARCHAR(128) PRIMARY KEY,
+        heartbeat_at TIMESTAMPTZ NOT NULL
+    )""",
+]
@@ -0,0 +1,10 @@
+DESCRIPTION = "Денежные суммы в целых микро-USDT (BIGINT) вместо NUMERIC(10, 2)"
+
+# ALTER COLUMN TYPE переписывает таблицу под эксклюзивной блокировкой — применять при остановленном боте.
+STATEMENTS = [
+    "ALTER TABLE users ALTER COLUMN balance TYPE BIGINT USING round(balance * 1000000)",
+    "ALTER TABLE orders ALTER COLUMN price TYPE BIGINT USING round(price * 1000000)",
+    "ALTER TABLE financial_transactions ALTER COLUMN amount TYPE BIGINT USING round(amount * 1000000)",
+    "ALTER TABLE category_subscriptions ALTER COLUMN min_price TYPE BIGINT USING round(min_price * 1000000)",
+    "ALTER TABLE category_subscriptions ALTER COLUMN max_price TYPE BIGINT USING round(max_price * 1000000)",
+]
@@ -0,0 +1,75 @@
+DESCRIPTION = "Помесячное секционирование chat_messages и financial_transactions"
+
+# Таблицы пересоздаются секционированными с переносом данных в одной транзакции — применять при остановленном боте.
+# Ключ секционирования обязан входить в первичный ключ, поэтому PK становится (id, timestamp);
+# уникальность id по-прежнему обеспечивает последовательность.
+TABLES = {
+    "chat_messages": {
+        "columns": """
+            id INTEGER NOT NULL DEFAULT nextval('chat_messages_id_seq'),
+            order_id INTEGER NOT NULL REFERENCES orders (id),
+            sender_id BIGINT NOT NULL,
+            timestamp TIMESTAMPTZ NOT NULL DEFAULT now(),
+            content_type VARCHAR(20) NOT NULL,
+            text_content TEXT,
+            file_path VARCHAR(255),
+            PRIMARY KEY (id, timestamp)
+        """,
+        "copy": "id, order_id, sender_id, timestamp, content_type, text_content, file_path",
+        "index": ("ix_chat_messages_order_id_timestamp", "order_id, timestamp"),
+    },
+    "financial_transactions": {
+        "columns": """
+            id INTEGER NOT NULL DEFAULT nextval('financial_transactions_id_seq'),
+            user_id BIGINT NOT NULL REFERENCES users (telegram_id),
+            type VARCHAR(50) NOT NULL,
+            amount BIGINT NOT NULL,
+            order_id INTEGER,
+            timestamp TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (id, timestamp)
+        """,
+        "copy": "id, user_id, type, amount, order_id, timestamp",
+        "index": ("ix_financial_transactions_user_id_timestamp", "user_id, timestamp"),
+    },
+}
+
+# Секции создаются с месяца самой старой строки до PARTITIONS_AHEAD месяцев вперёд (как в partitions.py).
+_CREATE_MONTHLY_PARTITIONS = """
+DO $$
+DECLARE
+    month TIMESTAMP;
+BEGIN
+    month := date_trunc('month', coalesce((SELECT min(timestamp) FROM {table}_legacy), now()) AT TIME ZONE 'UTC');
+    WHILE month <= date_trunc('month', now() AT TIME ZONE 'UTC') + interval '2 months' LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF {table} FOR VALUES FROM (%L) TO (%L)',
+            '{table}_p' || to_char(month, 'YYYYMM'),
+            month AT TIME ZONE 'UTC',
+            (month + interval '1 month') AT TIME ZONE 'UTC'
+        );
+        month := month + interval '1 month';
+    END LOOP;
+END $$
+"""
+
+
+def _partition(table: str, columns: str, copy: str, index: tuple[str, str]) -> list[str]:
+    index_name, index_columns = index
+    copy_from = copy.replace("timestamp", "coalesce(timestamp, now())")
+    return [
+        f"ALTER TABLE {table} RENAME TO {table}_legacy",
+        f"ALTER TABLE {table}_legacy RENAME CONSTRAINT {table}_pkey TO {table}_legacy_pkey",
+        f"DROP INDEX IF EXISTS {index_name}",
+        f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE",
+        f"CREATE TABLE {table} ({columns}) PARTITION BY RANGE (timestamp)",
+        f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id",
+        # Страховка на случай, если задача обслуживания не успела создать секцию на новый месяц.
+        f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT",
+        _CREATE_MONTHLY_PARTITIONS.format(table=table),
+        f"INSERT INTO {table} ({copy}) SELECT {copy_from} FROM {table}_legacy",
+        f"DROP TABLE {table}_legacy",
+        f"CREATE INDEX {index_name} ON {table} ({index_columns})",
+    ]
+
+
+STATEMENTS = [statement for table, spec in TABLES.items() for statement in _partition(table, **spec)]
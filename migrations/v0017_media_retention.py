@@ -0,0 +1,11 @@
+DESCRIPTION = "Признак спора у заказа и индекс chat_messages.file_path для чистки медиа"
+
+STATEMENTS = [
+    "ALTER TABLE orders ADD COLUMN IF NOT EXISTS was_disputed BOOLEAN NOT NULL DEFAULT false",
+    # Раньше споры нигде не отмечались: восстанавливаем признак по текущему статусу и проводкам решения спора.
+    """UPDATE orders SET was_disputed = true
+    WHERE status = 'dispute'
+       OR id IN (SELECT order_id FROM financial_transactions WHERE type = 'dispute_resolution' AND order_id IS NOT NULL)""",
+    # На секционированной таблице CONCURRENTLY недоступен; индекс строится по секциям и мал — только строки с файлами.
+    "CREATE INDEX IF NOT EXISTS ix_chat_messages_file_path ON chat_messages (file_path) WHERE file_path IS NOT NULL",
+]
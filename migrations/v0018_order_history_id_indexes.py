@@ -0,0 +1,10 @@
+DESCRIPTION = "История заказов листается по id: индексы (участник, id) вместо (участник, status_changed_at)"
+
+TRANSACTIONAL = False
+
+STATEMENTS = [
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_orders_customer_id_id ON orders (customer_id, id)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_orders_executor_id_id ON orders (executor_id, id)",
+    "DROP INDEX CONCURRENTLY IF EXISTS ix_orders_customer_id_status_changed_at",
+    "DROP INDEX CONCURRENTLY IF EXISTS ix_orders_executor_id_status_changed_at",
+]
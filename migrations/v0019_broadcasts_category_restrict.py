@@ -0,0 +1,7 @@
+DESCRIPTION = "broadcasts.category_id: ON DELETE RESTRICT вместо SET NULL, чтобы удаление категории не превращало рассылку в общую"
+
+STATEMENTS = [
+    "ALTER TABLE broadcasts DROP CONSTRAINT IF EXISTS broadcasts_category_id_fkey",
+    """ALTER TABLE broadcasts ADD CONSTRAINT broadcasts_category_id_fkey
+        FOREIGN KEY (category_id) REFERENCES categories (id) ON DELETE RESTRICT""",
+]
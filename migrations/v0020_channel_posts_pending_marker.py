@@ -0,0 +1,8 @@
+DESCRIPTION = "Пустой orders.channel_message_id теперь означает неопубликованный пост: заказы до v0012 помечаются 0"
+
+STATEMENTS = [
+    # Эти заказы публиковались до учёта постов; номер поста неизвестен, повторно публиковать их не нужно.
+    """UPDATE orders SET channel_message_id = 0
+    WHERE channel_message_id IS NULL
+      AND creation_date < (SELECT applied_at FROM schema_migrations WHERE version = 12)""",
+]
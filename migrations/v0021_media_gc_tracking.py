@@ -0,0 +1,13 @@
+DESCRIPTION = "Сборка мусора медиа по списку отвязанных файлов; файлы из архива секций не удаляются"
+
+STATEMENTS = [
+    """CREATE TABLE IF NOT EXISTS unlinked_media (
+        path VARCHAR(255) PRIMARY KEY,
+        unlinked_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )""",
+    """CREATE TABLE IF NOT EXISTS archived_media (
+        path VARCHAR(255) PRIMARY KEY
+    )""",
+    # Курсор прежнего обхода шардов больше не нужен.
+    "DELETE FROM settings WHERE key = 'media_gc_shard'",
+]
@@ -0,0 +1,77 @@
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+
+from sqlalchemy import BigInteger
+from sqlalchemy.types import TypeDecorator
+
+# 1 USDT = 10^6 микро-USDT: столько же знаков, сколько у TRC-20 USDT, поэтому суммы переводов хранятся без потерь.
+MICRO = 1_000_000
+DIGITS = 6
+
+
+class Money(int):
+    """
+    Сумма в микро-USDT. Арифметика унаследована от int и возвращает int — так она остаётся
+    на скорости встроенных целых; Money(...) нужен на границах: при разборе ввода и для вывода
+    (format(amount, ".2f") форматирует в USDT, а не в микро-единицах).
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def parse(cls, value) -> "Money":
+        """Сумма в USDT из ввода пользователя или Decimal. Больше 6 знаков после точки — ValueError."""
+        try:
+            micros = Decimal(str(value).strip().replace(",", ".")).scaleb(DIGITS)
+        except InvalidOperation:
+            raise ValueError(value) from None
+        if not micros.is_finite() or micros != micros.to_integral_value():
+            raise ValueError(value)
+        return cls(int(micros))
+
+    def to_decimal(self) -> Decimal:
+        return Decimal(int(self)).scaleb(-DIGITS)
+
+    def percent(self, percent: Decimal) -> "Money":
+        """Доля суммы, округлённая до микро-USDT (половина — от нуля), в целых числах без Decimal-арифметики."""
+        numerator, denominator = _percent_ratio(percent)
+        value = int(self) * numerator
+        quotient, remainder = divmod(abs(value), denominator)
+        if 2 * remainder >= denominator:
+            quotient += 1
+        return Money(quotient if value >= 0 else -quotient)
+
+    def __format__(self, spec: str) -> str:
+        return format(self.to_decimal(), spec) if spec else str(self)
+
+    def __str__(self) -> str:
+        return str(self.to_decimal().normalize() if self % MICRO else int(self) // MICRO)
+
+    def __repr__(self) -> str:
+        return f"Money({int(self)})"
+
+
+@lru_cache(maxsize=64)
+def _percent_ratio(percent) -> tuple[int, int]:
+    # Процент комиссии меняется редко, а считается на каждой сделке.
+    numerator, denominator = Decimal(percent).as_integer_ratio()
+    return numerator, denominator * 100
+
+
+class MoneyType(TypeDecorator):
+    """BIGINT с суммой в микро-USDT; из БД всегда возвращается Money."""
+
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, int):
+            return value
+        return int(Money.parse(value))
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else Money(value)
+
+    @property
+    def python_type(self):
+        return Money
@@ -0,0 +1,138 @@
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta, UTC
+from decimal import Decimal
+
+from sqlalchemy import update, text, func, column, Integer, BigInteger, String
+
+from db_models import Order
+from money import MoneyType
+
+OPEN = "open"
+IN_PROGRESS = "in_progress"
+PENDING_APPROVAL = "pending_approval"
+COMPLETED = "completed"
+DISPUTE = "dispute"
+EXPIRED = "expired"
+
+TRANSITIONS = {
+    OPEN: {IN_PROGRESS, EXPIRED},
+    IN_PROGRESS: {PENDING_APPROVAL, DISPUTE},
+    PENDING_APPROVAL: {COMPLETED, DISPUTE},
+    DISPUTE: {COMPLETED},
+}
+
+STATUS_EMOJI = {OPEN: "🟢", IN_PROGRESS: "🟡", PENDING_APPROVAL: "🔵", COMPLETED: "⚪️", DISPUTE: "🔴", EXPIRED: "⚫️"}
+
+OPEN_ORDER_TTL = timedelta(days=int(os.getenv("ORDER_OPEN_TTL_DAYS", "14")))
+APPROVAL_TIMEOUT = timedelta(days=int(os.getenv("ORDER_APPROVAL_TIMEOUT_DAYS", "3")))
+SWEEP_BATCH_SIZE = int(os.getenv("ORDER_SWEEP_BATCH_SIZE", "500"))
+
+_hooks = defaultdict(list)
+
+
+def on_enter(status: str):
+    """Регистрирует хук async def hook(session, order_ids), вызываемый в той же транзакции."""
+    def decorator(hook):
+        _hooks[status].append(hook)
+        return hook
+    return decorator
+
+
+async def run_hooks(session, status: str, order_ids: list[int]):
+    if order_ids:
+        for hook in _hooks[status]:
+            await hook(session, order_ids)
+
+
+def sources_for(to_status: str) -> list[str]:
+    return [status for status, targets in TRANSITIONS.items() if to_status in targets]
+
+
+async def transition(session, order_id: int, to_status: str, from_statuses: list[str] | None = None, **values):
+    """
+    Атомарно переводит заказ в to_status, только если текущий статус допускает такой переход
+    (и входит в from_statuses, если они заданы). Возвращает обновлённый заказ или None.
+    """
+    allowed = sources_for(to_status)
+    if from_statuses is not None:
+        allowed = [status for status in allowed if status in from_statuses]
+    order = await session.scalar(
+        update(Order)
+        .where(Order.id == order_id, Order.status.in_(allowed))
+        .values(status=to_status, status_changed_at=func.now(), **values)
+        .returning(Order)
+    )
+    if order is not None:
+        await run_hooks(session, to_status, [order.id])
+    return order
+
+
+_EXPIRE_STALE_OPEN_ORDERS = text("""
+    WITH expired AS (
+        UPDATE orders SET status = :expired, status_changed_at = now()
+        WHERE id IN (
+            SELECT id FROM orders
+            WHERE status = :open AND creation_date < :cutoff
+            ORDER BY id LIMIT :batch_size
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, customer_id, price, title
+    ), refunded AS (
+        UPDATE users SET balance = users.balance + totals.amount
+        FROM (SELECT customer_id, SUM(price) AS amount FROM expired WHERE price > 0 GROUP BY customer_id) AS totals
+        WHERE users.telegram_id = totals.customer_id
+    ), ledger AS (
+        INSERT INTO financial_transactions (user_id, type, amount, order_id, timestamp)
+        SELECT customer_id, 'order_refund', price, id, now() FROM expired WHERE price > 0
+    )
+    SELECT id, customer_id, price, title FROM expired
+""").columns(column("id", Integer), column("customer_id", BigInteger), column("price", MoneyType), column("title", String))
+
+_AUTO_ACCEPT_PENDING_ORDERS = text("""
+    WITH accepted AS (
+        UPDATE orders SET status = :completed, status_changed_at = now()
+        WHERE id IN (
+            SELECT id FROM orders
+            WHERE status = :pending AND status_changed_at < :cutoff
+            ORDER BY id LIMIT :batch_size
+            FOR UPDATE SKIP LOCKED
+        )
+        -- Без CAST параметр получил бы тип price (bigint) и дробный процент обрезался бы до целого.
+        -- ROUND(numeric) округляет половину от нуля, как Money.percent в accept_work.
+        RETURNING id, customer_id, executor_id, title,
+            (price - ROUND(price * CAST(:commission_percent AS NUMERIC) / 100))::bigint AS payout
+    ), credited AS (
+        UPDATE users SET balance = users.balance + totals.amount
+        FROM (SELECT executor_id, SUM(payout) AS amount FROM accepted WHERE payout > 0 GROUP BY executor_id) AS totals
+        WHERE users.telegram_id = totals.executor_id
+    ), ledger AS (
+        INSERT INTO financial_transactions (user_id, type, amount, order_id, timestamp)
+        SELECT executor_id, 'order_reward', payout, id, now() FROM accepted WHERE payout > 0
+    )
+    SELECT id, customer_id, executor_id, title, payout FROM accepted
+""").columns(
+    column("id", Integer), column("customer_id", BigInteger), column("executor_id", BigInteger),
+    column("title", String), column("payout", MoneyType)
+)
+
+
+async def expire_stale_open_orders(session, now: datetime | None = None):
+    """Закрывает одну пачку устаревших открытых заказов и возвращает заказчикам зарезервированные суммы."""
+    cutoff = (now or datetime.now(UTC)) - OPEN_ORDER_TTL
+    rows = (await session.execute(_EXPIRE_STALE_OPEN_ORDERS, {
+        "expired": EXPIRED, "open": OPEN, "cutoff": cutoff, "batch_size": SWEEP_BATCH_SIZE
+    })).all()
+    await run_hooks(session, EXPIRED, [row.id for row in rows])
+    return rows
+
+
+async def auto_accept_pending_orders(session, commission_percent: Decimal, now: datetime | None = None):
+    """Принимает одну пачку работ, которые заказчик не проверил за APPROVAL_TIMEOUT, и выплачивает исполнителям."""
+    cutoff = (now or datetime.now(UTC)) - APPROVAL_TIMEOUT
+    rows = (await session.execute(_AUTO_ACCEPT_PENDING_ORDERS, {
+        "completed": COMPLETED, "pending": PENDING_APPROVAL, "cutoff": cutoff,
+        "batch_size": SWEEP_BATCH_SIZE, "commission_percent": commission_percent
+    })).all()
+    await run_hooks(session, COMPLETED, [row.id for row in rows])
+    return rows
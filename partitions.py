@@ -0,0 +1,160 @@
+import os
+import re
+import json
+import gzip
+import asyncio
+import logging
+from datetime import date, datetime, UTC
+
+from sqlalchemy import text
+
+# Произвольный постоянный ключ: обслуживание секций выполняет только один процесс бота.
+PARTITIONS_LOCK_KEY = 72_430_002
+PARTITIONS_AHEAD = 2
+ARCHIVE_DIR = os.getenv("PARTITION_ARCHIVE_DIR", "archive")
+ARCHIVE_BATCH_SIZE = 5000
+# Сколько месяцев секция остаётся в БД; 0 — не архивировать.
+RETENTION_MONTHS = {
+    "chat_messages": int(os.getenv("CHAT_MESSAGES_RETENTION_MONTHS", "12")),
+    "financial_transactions": int(os.getenv("FINANCIAL_TRANSACTIONS_RETENTION_MONTHS", "0")),
+}
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+async def ensure_partitions(conn, table: str, today: date, ahead: int = PARTITIONS_AHEAD) -> list[str]:
+    """Создаёт секции текущего и следующих ahead месяцев; возвращает созданные."""
+    created = []
+    current = today.replace(day=1)
+    for offset in range(ahead + 1):
+        month = add_months(current, offset)
+        name = partition_name(table, month)
+        exists = await conn.scalar(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name})
+        if exists:
+            continue
+        await create_partition(conn.engine, table, name, month)
+        created.append(name)
+    return created
+
+
+async def create_partition(engine, table: str, name: str, month: date):
+    """
+    Если обслуживание пропустило месяц, его строки уже лежат в <table>_default, и
+    CREATE TABLE ... PARTITION OF падает. Поэтому секция создаётся отдельной таблицей,
+    строки месяца переносятся в неё из default и секция присоединяется — всё в одной транзакции.
+    """
+    start = datetime(month.year, month.month, 1, tzinfo=UTC)
+    end = datetime.combine(add_months(month, 1), start.timetz())
+    default = f"{table}_default"
+    async with engine.begin() as conn:
+        # Новые строки месяца не попадут в default между переносом и присоединением.
+        await conn.execute(text(f"LOCK TABLE {default} IN SHARE ROW EXCLUSIVE MODE"))
+        await conn.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+        moved = await conn.execute(text(f"""
+            WITH moved AS (
+                DELETE FROM {default} WHERE "timestamp" >= :start AND "timestamp" < :end
+                RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+        """), {"start": start, "end": end})
+        await conn.execute(text(
+            f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        ))
+    if moved.rowcount:
+        logging.warning(f"В секцию {name} перенесено строк из {default}: {moved.rowcount}")
+
+
+async def expired_partitions(conn, table: str, today: date, retention_months: int) -> list[str]:
+    """Секции старше срока хранения, в том числе отсоединённые, но не удалённые прерванным архивированием."""
+    cutoff = partition_name(table, add_months(today.replace(day=1), -retention_months))
+    names = await conn.scalars(
+        text("SELECT relname FROM pg_class WHERE relkind = 'r' AND relname ~ :pattern ORDER BY relname"),
+        {"pattern": f"^{re.escape(table)}_p[0-9]{{6}}$"},
+    )
+    return [name for name in names if name < cutoff]
+
+
+def _write_rows(archive, rows: list[dict]):
+    for row in rows:
+        archive.write(json.dumps(row, ensure_ascii=False, default=str).encode() + b"\n")
+
+
+async def _pin_media(conn, paths: set[str]):
+    # Архив ссылается на файлы сообщений: сборка мусора медиа (media_store.py) их не удалит.
+    if paths:
+        await conn.execute(
+            text("INSERT INTO archived_media (path) SELECT unnest(CAST(:paths AS varchar[])) ON CONFLICT DO NOTHING"),
+            {"paths": sorted(paths)},
+        )
+
+
+async def archive_partition(conn, table: str, name: str, archive_dir: str = ARCHIVE_DIR) -> str:
+    """
+    Отсоединяет секцию, выгружает её в <archive_dir>/<table>/<секция>.ndjson.gz и удаляет.
+    Файл пишется под временным именем и переименовывается только после полной записи,
+    так что при сбое секция остаётся в БД и будет выгружена заново.
+    """
+    attached = await conn.scalar(
+        text("SELECT EXISTS (SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(:name))"), {"name": name}
+    )
+    if attached:
+        await conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+
+    directory = os.path.join(archive_dir, table)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.ndjson.gz")
+    archive = await asyncio.to_thread(gzip.open, f"{path}.tmp", "wb")
+    try:
+        # Страницами по id (keyset), чтобы не держать всю секцию в памяти; gzip пишется вне цикла событий.
+        last_id = 0
+        while True:
+            rows = (await conn.execute(
+                text(f"SELECT * FROM {name} WHERE id > :last_id ORDER BY id LIMIT :limit"),
+                {"last_id": last_id, "limit": ARCHIVE_BATCH_SIZE},
+            )).mappings().all()
+            if not rows:
+                break
+            await asyncio.to_thread(_write_rows, archive, [dict(row) for row in rows])
+            await _pin_media(conn, {row["file_path"] for row in rows if row.get("file_path")})
+            last_id = rows[-1]["id"]
+    finally:
+        await asyncio.to_thread(archive.close)
+    os.replace(f"{path}.tmp", path)
+
+    await conn.execute(text(f"DROP TABLE {name}"))
+    return path
+
+
+async def maintain_table(conn, table: str, today: date, retention_months: int):
+    for name in await ensure_partitions(conn, table, today):
+        logging.info(f"Создана секция {name}")
+    if not retention_months:
+        return
+    for name in await expired_partitions(conn, table, today, retention_months):
+        path = await archive_partition(conn, table, name)
+        logging.info(f"Секция {name} выгружена в {path} и удалена")
+
+
+async def maintain_partitions(engine, today: date | None = None):
+    """Ежедневное обслуживание: секции на будущие месяцы, архивирование и удаление старых."""
+    today = today or datetime.now(UTC).date()
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        if not await conn.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": PARTITIONS_LOCK_KEY}):
+            return
+        try:
+            for table, retention_months in RETENTION_MONTHS.items():
+                # Сбой одной таблицы не должен оставить остальные без секций на следующий месяц.
+                try:
+                    await maintain_table(conn, table, today, retention_months)
+                except Exception:
+                    logging.exception(f"Обслуживание секций {table} не выполнено")
+        finally:
+            await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": PARTITIONS_LOCK_KEY})
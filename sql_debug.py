@@ -0,0 +1,107 @@
+import os
+import time
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from aiogram import BaseMiddleware
+from sqlalchemy import event
+
+SQL_DEBUG = os.getenv("SQL_DEBUG", "false").lower() == "true"
+SLOW_QUERY_MS = float(os.getenv("SQL_DEBUG_SLOW_QUERY_MS", "100"))
+# Сколько одинаковых по форме запросов за одно обновление считается признаком N+1.
+N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_DEBUG_N_PLUS_ONE_THRESHOLD", "5"))
+
+logger = logging.getLogger("sql_debug")
+
+
+class QueryLog:
+    """Запросы, выполненные в рамках одного обновления или HTTP-запроса."""
+
+    __slots__ = ("label", "count", "total_seconds", "shapes")
+
+    def __init__(self, label: str):
+        self.label = label
+        self.count = 0
+        self.total_seconds = 0.0
+        self.shapes = Counter()
+
+    def repeated_shapes(self, threshold: int = N_PLUS_ONE_THRESHOLD):
+        return [(statement, count) for statement, count in self.shapes.items() if count >= threshold]
+
+
+_current_log: ContextVar[QueryLog | None] = ContextVar("sql_debug_log", default=None)
+
+
+@contextmanager
+def track_queries(label: str, report: bool = True):
+    log = QueryLog(label)
+    token = _current_log.set(log)
+    try:
+        yield log
+    finally:
+        _current_log.reset(token)
+        if report:
+            report_queries(log)
+
+
+def report_queries(log: QueryLog):
+    if not log.count:
+        return
+    logger.info(f"{log.label}: {log.count} SQL-запросов, {log.total_seconds * 1000:.1f} мс")
+    for statement, count in log.repeated_shapes():
+        logger.warning(f"{log.label}: возможный N+1 — запрос выполнен {count} раз:\n{statement}")
+
+
+def _explain(conn, statement: str, parameters) -> str:
+    # Сырой курсор DBAPI: так EXPLAIN не проходит через события движка и не учитывается повторно.
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(f"EXPLAIN {statement}", parameters)
+        return "\n".join(str(row[-1]) for row in cursor.fetchall())
+    finally:
+        cursor.close()
+
+
+def instrument_engine(engine):
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _current_log.get() is not None:
+            context._sql_debug_started = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        log = _current_log.get()
+        started = getattr(context, "_sql_debug_started", None)
+        if log is None or started is None:
+            return
+        elapsed = time.perf_counter() - started
+        log.count += 1
+        log.total_seconds += elapsed
+        # Параметры передаются отдельно, поэтому текст запроса уже и есть его «форма».
+        log.shapes[statement] += 1
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            plan = ""
+            if statement.lstrip().upper().startswith("SELECT") and not executemany:
+                try:
+                    plan = "\n" + _explain(conn, statement, parameters)
+                except Exception as e:
+                    plan = f"\n(EXPLAIN не удался: {e})"
+            logger.warning(f"{log.label}: медленный запрос {elapsed * 1000:.1f} мс:\n{statement}\n{parameters}{plan}")
+
+
+class QueryTrackingMiddleware(BaseMiddleware):
+    async def __call__(self, handler, event, data):
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object else "unknown"
+        with track_queries(name):
+            return await handler(event, data)
+
+
+def setup_bot_sql_debug(dp, engine):
+    instrument_engine(engine)
+    dp.message.middleware(QueryTrackingMiddleware())
+    dp.callback_query.middleware(QueryTrackingMiddleware())
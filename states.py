@@ -23,6 +23,9 @@ class Withdrawal(StatesGroup):
 class SupportChat(StatesGroup):
     in_chat = State()
 
+class SubscriptionSetup(StatesGroup):
+    enter_price_range = State()
+
 class AdminBalanceChange(StatesGroup):
     enter_amount = State()
     confirm_change = State()
\ No newline at end of file
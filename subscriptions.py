@@ -0,0 +1,129 @@
+import os
+import math
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+from sqlalchemy import select, delete
+
+from db_models import CategorySubscription
+from money import Money
+
+SUBSCRIPTIONS_LIMIT = int(os.getenv("SUBSCRIPTIONS_LIMIT", "10"))
+
+
+class IntervalTree:
+    """
+    Статическое центрированное дерево интервалов [low, high] с user_id в качестве значения.
+    В узле интервалы, содержащие центр, хранятся дважды — по возрастанию начала и по возрастанию конца,
+    поэтому совпадения в узле находятся бинарным поиском и забираются срезом списка, без цикла по интервалам.
+    """
+
+    __slots__ = ("center", "starts", "start_ids", "ends", "end_ids", "left", "right")
+
+    def __init__(self, intervals: list[tuple[float, float, int]]):
+        endpoints = sorted(point for low, high, _ in intervals for point in (low, high) if math.isfinite(point))
+        self.center = endpoints[len(endpoints) // 2] if endpoints else 0.0
+        here, left, right = [], [], []
+        for interval in intervals:
+            if interval[1] < self.center:
+                left.append(interval)
+            elif interval[0] > self.center:
+                right.append(interval)
+            else:
+                here.append(interval)
+        by_start = sorted(here, key=lambda interval: interval[0])
+        by_end = sorted(here, key=lambda interval: interval[1])
+        self.starts = [interval[0] for interval in by_start]
+        self.start_ids = [interval[2] for interval in by_start]
+        self.ends = [interval[1] for interval in by_end]
+        self.end_ids = [interval[2] for interval in by_end]
+        self.left = IntervalTree(left) if left else None
+        self.right = IntervalTree(right) if right else None
+
+    def stab(self, point: float, out: list):
+        node = self
+        while node is not None:
+            if point < node.center:
+                # Все интервалы узла заканчиваются не раньше центра — достаточно проверить начало.
+                out += node.start_ids[:bisect_right(node.starts, point)]
+                node = node.left
+            elif point > node.center:
+                out += node.end_ids[bisect_left(node.ends, point):]
+                node = node.right
+            else:
+                out += node.start_ids
+                return out
+        return out
+
+
+class SubscriptionIndex:
+    """Подписки исполнителей в памяти: категория -> дерево диапазонов цен. Перестраивается только изменённая категория."""
+
+    def __init__(self):
+        self._ranges: dict[int, dict[int, tuple[float, float]]] = defaultdict(dict)
+        self._trees: dict[int, IntervalTree] = {}
+
+    async def load(self, session):
+        self._ranges.clear()
+        rows = await session.execute(select(
+            CategorySubscription.category_id, CategorySubscription.user_id,
+            CategorySubscription.min_price, CategorySubscription.max_price
+        ))
+        for category_id, user_id, min_price, max_price in rows:
+            self._ranges[category_id][user_id] = _bounds(min_price, max_price)
+        self._trees = {category_id: self._build(category_id) for category_id in self._ranges}
+
+    def _build(self, category_id: int):
+        ranges = self._ranges.get(category_id)
+        if not ranges:
+            return None
+        return IntervalTree([(low, high, user_id) for user_id, (low, high) in ranges.items()])
+
+    def set(self, category_id: int, user_id: int, min_price: Money | None, max_price: Money | None):
+        self._ranges[category_id][user_id] = _bounds(min_price, max_price)
+        self._trees[category_id] = self._build(category_id)
+
+    def remove(self, category_id: int, user_id: int):
+        if self._ranges[category_id].pop(user_id, None) is not None:
+            self._trees[category_id] = self._build(category_id)
+
+    def remove_user(self, user_id: int):
+        for category_id in [category_id for category_id, ranges in self._ranges.items() if user_id in ranges]:
+            self.remove(category_id, user_id)
+
+    def match(self, category_id: int, price: Money) -> list[int]:
+        tree = self._trees.get(category_id)
+        return tree.stab(float(price), []) if tree else []
+
+
+def _bounds(min_price: Money | None, max_price: Money | None) -> tuple[float, float]:
+    return (
+        float(min_price) if min_price is not None else -math.inf,
+        float(max_price) if max_price is not None else math.inf,
+    )
+
+
+def parse_price_range(text: str) -> tuple[Money | None, Money | None]:
+    """'10-100', '10-', '-100' или '-' (любая цена). Некорректный ввод — ValueError."""
+    low, separator, high = text.replace(" ", "").partition("-")
+    if not separator:
+        raise ValueError(text)
+    min_price = Money.parse(low) if low else None
+    max_price = Money.parse(high) if high else None
+    if (min_price is not None and min_price < 0) or (min_price is not None and max_price is not None and min_price > max_price):
+        raise ValueError(text)
+    return min_price, max_price
+
+
+def format_price_range(min_price: Money | None, max_price: Money | None) -> str:
+    if min_price is None and max_price is None:
+        return "любая цена"
+    if max_price is None:
+        return f"от {min_price:.2f} USDT"
+    if min_price is None:
+        return f"до {max_price:.2f} USDT"
+    return f"{min_price:.2f}–{max_price:.2f} USDT"
+
+
+async def unsubscribe_user(session, user_id: int):
+    await session.execute(delete(CategorySubscription).where(CategorySubscription.user_id == user_id))
@@ -0,0 +1,150 @@
+import os
+from datetime import datetime, timedelta, UTC
+
+from sqlalchemy import select, update, func, or_
+from sqlalchemy.dialects.postgresql import insert
+
+from db_models import SupportTicket, SupportMessage, SupportMessageLink, SupportAgent
+from idempotency import ExpiringMap
+
+SUPPORT_AGENT_IDS = [int(agent_id) for agent_id in os.getenv("SUPPORT_AGENT_IDS", "").split(",") if agent_id.strip()]
+SUPPORT_DIGEST_MINUTES = int(os.getenv("SUPPORT_DIGEST_MINUTES", "30"))
+# Сообщения онлайн-агентам доставляются сразу; дайджест подбирает только те, что не ушли за это время.
+UNDELIVERED_GRACE = timedelta(minutes=2)
+LINK_CACHE_TTL = 24 * 60 * 60
+
+OPEN = "open"
+CLOSED = "closed"
+
+
+class SupportDesk:
+    """
+    Маршрутизация обращений между агентами поддержки. Процессов бота может быть несколько,
+    поэтому нагрузка (число открытых тикетов) и статус агентов читаются из БД в момент выбора.
+    """
+
+    def __init__(self, agent_ids: list[int]):
+        self.agent_ids = agent_ids
+        self._agents = set(agent_ids)
+        self._links = ExpiringMap(LINK_CACHE_TTL)
+
+    def is_agent(self, user_id: int) -> bool:
+        return user_id in self._agents
+
+    async def is_online(self, session, agent_id: int) -> bool:
+        # Агент без строки в support_agents ни разу не уходил из сети.
+        online = await session.scalar(select(SupportAgent.is_online).where(SupportAgent.telegram_id == agent_id))
+        return online is not False
+
+    async def set_online(self, session, agent_id: int, online: bool):
+        await session.execute(
+            insert(SupportAgent)
+            .values(telegram_id=agent_id, is_online=online)
+            .on_conflict_do_update(index_elements=[SupportAgent.telegram_id], set_={"is_online": online})
+        )
+
+    async def load(self, session) -> dict[int, int]:
+        """Число открытых тикетов у каждого агента."""
+        counts = await session.execute(
+            select(SupportTicket.agent_id, func.count())
+            .where(SupportTicket.status == OPEN, SupportTicket.agent_id.in_(self.agent_ids))
+            .group_by(SupportTicket.agent_id)
+        )
+        return dict.fromkeys(self.agent_ids, 0) | dict(counts.all())
+
+    async def pick_agent(self, session) -> int:
+        """Наименее загруженный агент среди онлайн, а если онлайн никого нет — среди всех."""
+        offline = set(await session.scalars(
+            select(SupportAgent.telegram_id)
+            .where(SupportAgent.is_online.is_(False), SupportAgent.telegram_id.in_(self.agent_ids))
+        ))
+        load = await self.load(session)
+        candidates = [agent_id for agent_id in self.agent_ids if agent_id not in offline] or self.agent_ids
+        return min(candidates, key=lambda agent_id: load[agent_id])
+
+    async def open_ticket(self, session, user_id: int):
+        """Возвращает (тикет, создан_ли_сейчас): у пользователя не больше одного открытого тикета."""
+        ticket = await session.scalar(
+            select(SupportTicket).where(SupportTicket.user_id == user_id, SupportTicket.status == OPEN)
+        )
+        if ticket and ticket.agent_id in self._agents:
+            return ticket, False
+        if ticket:
+            # Агента убрали из SUPPORT_AGENT_IDS — тикет переходит к другому.
+            ticket.agent_id = await self.pick_agent(session)
+        else:
+            ticket = SupportTicket(user_id=user_id, agent_id=await self.pick_agent(session), status=OPEN)
+            session.add(ticket)
+        await session.flush([ticket])
+        return ticket, True
+
+    async def close_ticket(self, session, ticket_id: int):
+        return await session.scalar(
+            update(SupportTicket)
+            .where(SupportTicket.id == ticket_id, SupportTicket.status == OPEN)
+            .values(status=CLOSED, closed_at=func.now())
+            .returning(SupportTicket)
+        )
+
+    async def add_message(self, session, ticket_id: int, sender_id: int, text: str, delivered: bool = False):
+        message = SupportMessage(ticket_id=ticket_id, sender_id=sender_id, text=text, delivered=delivered)
+        session.add(message)
+        await session.flush([message])
+        return message
+
+    async def mark_delivered(self, session, ticket_id: int, message_ids: list[int], chat_id: int, sent_message_ids: list[int]):
+        await session.execute(update(SupportMessage).where(SupportMessage.id.in_(message_ids)).values(delivered=True))
+        for sent_message_id in sent_message_ids:
+            session.add(SupportMessageLink(chat_id=chat_id, message_id=sent_message_id, ticket_id=ticket_id))
+            self._links.set((chat_id, sent_message_id), ticket_id)
+
+    async def ticket_for_reply(self, session, chat_id: int, message_id: int):
+        ticket_id = self._links.get((chat_id, message_id))
+        if ticket_id is None:
+            ticket_id = await session.scalar(
+                select(SupportMessageLink.ticket_id)
+                .where(SupportMessageLink.chat_id == chat_id, SupportMessageLink.message_id == message_id)
+            )
+            if ticket_id is None:
+                return None
+            self._links.set((chat_id, message_id), ticket_id)
+        return await session.get(SupportTicket, ticket_id)
+
+    async def claim_digests(self, session, agent_id: int | None = None):
+        """
+        Забирает недоставленные сообщения открытых тикетов, сгруппированные по тикету:
+        [(тикет, [сообщения])]. У онлайн-агентов берутся только «зависшие» сообщения.
+        Сообщения сразу помечаются доставленными (SKIP LOCKED), так что другой процесс
+        их уже не возьмёт; не доставленные нужно вернуть через release_messages.
+        """
+        pending = (
+            select(SupportMessage.id)
+            .join(SupportTicket, SupportTicket.id == SupportMessage.ticket_id)
+            .where(SupportMessage.delivered.is_(False), SupportTicket.status == OPEN)
+            .with_for_update(of=SupportMessage, skip_locked=True)
+        )
+        if agent_id is not None:
+            pending = pending.where(SupportTicket.agent_id == agent_id)
+        else:
+            pending = pending.outerjoin(SupportAgent, SupportAgent.telegram_id == SupportTicket.agent_id).where(or_(
+                SupportAgent.is_online.is_(False),
+                SupportMessage.created_at <= datetime.now(UTC) - UNDELIVERED_GRACE,
+            ))
+        messages = (await session.scalars(
+            update(SupportMessage)
+            .where(SupportMessage.id.in_(pending))
+            .values(delivered=True)
+            .returning(SupportMessage)
+        )).all()
+        if not messages:
+            return []
+        tickets = {ticket.id: ticket for ticket in await session.scalars(
+            select(SupportTicket).where(SupportTicket.id.in_({message.ticket_id for message in messages}))
+        )}
+        digests = {}
+        for message in sorted(messages, key=lambda message: (message.ticket_id, message.id)):
+            digests.setdefault(message.ticket_id, (tickets[message.ticket_id], []))[1].append(message)
+        return list(digests.values())
+
+    async def release_messages(self, session, message_ids: list[int]):
+        await session.execute(update(SupportMessage).where(SupportMessage.id.in_(message_ids)).values(delivered=False))
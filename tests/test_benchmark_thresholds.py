@@ -0,0 +1,28 @@
+from benchmarks.harness import check_thresholds
+
+THRESHOLDS = {
+    "min_throughput_ups": 100, "max_failed_updates": 0,
+    "handlers": {"confirm_order_creation": {"p95_ms": 120, "p99_ms": 250, "max_queries": 3, "n_plus_one_shapes": 0}},
+}
+
+
+def _report(**stats) -> dict:
+    handler = {"p95_ms": 240.0, "p99_ms": 300.0, "max_queries": 3, "n_plus_one_shapes": 0} | stats
+    return {"throughput_ups": 50.0, "failed_updates": 0, "handlers": {"confirm_order_creation": handler}}
+
+
+def test_slow_run_only_warns():
+    violations, warnings = check_thresholds(_report(), THRESHOLDS)
+    assert violations == []
+    assert len(warnings) == 3
+
+
+def test_strict_timing_fails_slow_run():
+    violations, warnings = check_thresholds(_report(), THRESHOLDS, strict_timing=True)
+    assert len(violations) == 3 and warnings == []
+
+
+def test_extra_queries_fail_run():
+    violations, _ = check_thresholds(_report(max_queries=5, n_plus_one_shapes=1), THRESHOLDS)
+    assert violations == ["confirm_order_creation: max_queries = 5.0 > 3",
+                          "confirm_order_creation: n_plus_one_shapes = 1.0 > 0"]
@@ -0,0 +1,82 @@
+import asyncio
+from collections import Counter
+
+import pytest
+from aiogram import Bot
+from sqlalchemy import insert, select, delete
+from sqlalchemy.exc import IntegrityError
+
+from benchmarks.fake_bot import FakeSession
+from benchmarks.harness import BENCH_ENV
+from broadcast import BroadcastRunner, create_broadcast, detach_category, COMPLETED, CANCELLED
+from conftest import requires_postgres
+from db import engine, async_session
+from db_models import User, Order, Category, Broadcast
+
+
+class RecordingSession(FakeSession):
+    def __init__(self):
+        super().__init__()
+        self.recipients = Counter()
+
+    async def make_request(self, bot, method, timeout=None):
+        if type(method).__name__ == "SendMessage":
+            self.recipients[method.chat_id] += 1
+        return await super().make_request(bot, method, timeout)
+
+
+async def _create_users(count: int):
+    async with async_session() as session:
+        await session.execute(insert(User), [{"telegram_id": 1000 + number} for number in range(count)])
+        await session.commit()
+
+
+async def _drain(*runners: BroadcastRunner):
+    await asyncio.gather(*(runner.resume_pending() for runner in runners))
+    await asyncio.gather(*(task for runner in runners for task in list(runner.active.values())))
+
+
+@requires_postgres
+async def test_each_process_resumes_but_one_sends(database):
+    await _create_users(30)
+    async with async_session() as session:
+        broadcast = await create_broadcast(session, "Новости", created_by=1)
+        await session.commit()
+
+    sessions = [RecordingSession() for _ in range(3)]
+    runners = [BroadcastRunner(Bot(BENCH_ENV["BOT_TOKEN"], session=bot_session), engine, async_session)
+               for bot_session in sessions]
+    await _drain(*runners)
+
+    recipients = sum((bot_session.recipients for bot_session in sessions), Counter())
+    assert recipients == Counter({1000 + number: 1 for number in range(30)})
+    async with async_session() as session:
+        assert (await session.get(Broadcast, broadcast.id)).status == COMPLETED
+
+
+@requires_postgres
+async def test_deleted_category_cancels_broadcast(database):
+    await _create_users(10)
+    async with async_session() as session:
+        category = Category(name="Дизайн")
+        session.add(category)
+        await session.flush()
+        session.add(Order(title="Логотип", description="Описание", price=1_000_000, customer_id=1000, category_id=category.id))
+        broadcast = await create_broadcast(session, "Заказы по дизайну", created_by=1, category_id=category.id)
+        await session.commit()
+
+    async with async_session() as session:
+        with pytest.raises(IntegrityError):
+            await session.execute(delete(Category).where(Category.id == category.id))
+
+    async with async_session() as session:
+        await session.execute(delete(Order))
+        assert await detach_category(session, category.id) == 1
+        await session.execute(delete(Category).where(Category.id == category.id))
+        await session.commit()
+
+    bot_session = RecordingSession()
+    await _drain(BroadcastRunner(Bot(BENCH_ENV["BOT_TOKEN"], session=bot_session), engine, async_session))
+    assert not bot_session.recipients
+    async with async_session() as session:
+        assert await session.scalar(select(Broadcast.status).where(Broadcast.id == broadcast.id)) == CANCELLED
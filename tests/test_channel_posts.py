@@ -0,0 +1,111 @@
+import asyncio
+from collections import Counter
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramNetworkError
+from sqlalchemy import insert, select
+
+from benchmarks.fake_bot import FakeSession
+from benchmarks.harness import BENCH_ENV
+from channel_posts import ChannelPosts, CHANNEL_PUBLISH_ATTEMPTS
+from conftest import requires_postgres
+from db import async_session
+from db_models import User, Order
+
+CHANNEL_ID = -100
+CUSTOMER = 1
+
+
+class ChannelSession(FakeSession):
+    def __init__(self, failing: bool = False):
+        super().__init__()
+        self.failing = failing
+        self.posts = Counter()
+        self.attempts = 0
+
+    async def make_request(self, bot, method, timeout=None):
+        if type(method).__name__ == "SendMessage" and method.chat_id == CHANNEL_ID:
+            self.attempts += 1
+            if self.failing:
+                raise TelegramNetworkError(method, "Connection reset")
+            self.posts[method.text] += 1
+        return await super().make_request(bot, method, timeout)
+
+
+def _channel(bot_session, on_failed=None) -> ChannelPosts:
+    return ChannelPosts(Bot(BENCH_ENV["BOT_TOKEN"], session=bot_session), CHANNEL_ID, async_session,
+                        offer_keyboard=lambda order_id: None, on_failed=on_failed, interval=0)
+
+
+async def _create_orders(count: int) -> list[int]:
+    async with async_session() as session:
+        await session.execute(insert(User).values(telegram_id=CUSTOMER))
+        ids = list(await session.scalars(insert(Order).returning(Order.id), [
+            {"title": f"Заказ {number}", "description": "Описание", "price": 1_000_000, "customer_id": CUSTOMER}
+            for number in range(count)
+        ]))
+        await session.commit()
+    return ids
+
+
+async def _unpublished() -> list[int]:
+    async with async_session() as session:
+        return list(await session.scalars(select(Order.id).where(Order.channel_message_id.is_(None))))
+
+
+async def _unpublished_is_empty() -> bool:
+    return not await _unpublished()
+
+
+async def _until(condition, timeout: float = 10):
+    async with asyncio.timeout(timeout):
+        while not await condition():
+            await asyncio.sleep(0.02)
+
+
+@requires_postgres
+async def test_pending_posts_are_published_once_after_restart(database):
+    # Процесс упал, не успев опубликовать заказы: в БД остались пустые channel_message_id.
+    await _create_orders(12)
+    sessions = [ChannelSession() for _ in range(3)]
+    channels = [_channel(bot_session) for bot_session in sessions]
+    for channel in channels:
+        channel.start()
+    try:
+        await asyncio.gather(*(channel.resume_pending() for channel in channels))
+        await _until(_unpublished_is_empty)
+    finally:
+        await asyncio.gather(*(channel.close() for channel in channels))
+
+    posts = sum((bot_session.posts for bot_session in sessions), Counter())
+    assert len(posts) == 12 and set(posts.values()) == {1}
+
+
+@requires_postgres
+async def test_failed_post_notifies_customer_and_is_retried(database):
+    [order_id] = await _create_orders(1)
+    failures = []
+
+    async def on_failed(customer_id, failed_order_id):
+        failures.append((customer_id, failed_order_id))
+
+    bot_session = ChannelSession(failing=True)
+    channel = _channel(bot_session, on_failed)
+    channel.start()
+    try:
+        channel.publish(order_id)
+
+        async def notified():
+            return bool(failures)
+        await _until(notified)
+        assert bot_session.attempts == CHANNEL_PUBLISH_ATTEMPTS
+        assert await _unpublished() == [order_id]
+
+        # Telegram снова доступен: плановый resume_pending публикует заказ, уведомление не повторяется.
+        bot_session.failing = False
+        await channel.resume_pending()
+        await _until(_unpublished_is_empty)
+    finally:
+        await channel.close()
+    assert failures == [(CUSTOMER, order_id)]
+    assert sum(bot_session.posts.values()) == 1
@@ -0,0 +1,20 @@
+import asyncio
+
+from cluster import PollingLeader
+from conftest import requires_postgres
+from db import engine
+
+
+@requires_postgres
+async def test_one_process_polls_and_a_standby_takes_over(migrated):
+    leader, standby = PollingLeader(engine, retry_seconds=0.05), PollingLeader(engine, retry_seconds=0.05)
+    assert await leader.acquire() is True
+
+    takeover = asyncio.create_task(standby.acquire())
+    await asyncio.sleep(0.3)
+    assert not takeover.done()
+
+    await leader.release()
+    # Резервный процесс сменил ведущего, поэтому накопившиеся обновления не сбрасываются.
+    assert await asyncio.wait_for(takeover, 5) is False
+    await standby.release()
@@ -0,0 +1,50 @@
+import asyncio
+import itertools
+
+from sqlalchemy import insert, select, func
+
+import deposit_pool
+from conftest import requires_postgres
+from db import engine, async_session
+from db_models import User, DepositAddress
+from deposit_pool import DepositPoolRefiller, assign_address
+
+USER_ID = 7
+
+
+@requires_postgres
+async def test_concurrent_top_ups_claim_one_address(database):
+    async with async_session() as session:
+        await session.execute(insert(User).values(telegram_id=USER_ID))
+        await session.execute(insert(DepositAddress), [{"address": f"T{number}"} for number in range(20)])
+        await session.commit()
+
+    async def top_up():
+        async with async_session() as session:
+            address = await assign_address(session, USER_ID)
+            await session.commit()
+            return address
+
+    addresses = await asyncio.gather(*(top_up() for _ in range(10)))
+    async with async_session() as session:
+        claimed = list(await session.scalars(select(DepositAddress.address).where(DepositAddress.user_id.is_not(None))))
+        wallet = await session.scalar(select(User.wallet_address).where(User.telegram_id == USER_ID))
+    assert claimed == [wallet]
+    assert set(addresses) == {wallet}
+
+
+@requires_postgres
+async def test_refill_runs_in_one_process_at_a_time(database, monkeypatch):
+    numbers = itertools.count()
+
+    async def generate_new_wallet():
+        await asyncio.sleep(0.01)
+        return f"T{next(numbers)}"
+
+    monkeypatch.setattr(deposit_pool, "generate_new_wallet", generate_new_wallet)
+    refillers = [DepositPoolRefiller(engine, async_session, low=5, high=30, batch_size=10) for _ in range(3)]
+    await asyncio.gather(*(refiller.refill() for refiller in refillers))
+
+    async with async_session() as session:
+        assert await session.scalar(select(func.count(DepositAddress.id))) == 30
+    assert next(numbers) == 30
@@ -0,0 +1,68 @@
+from datetime import datetime, UTC
+
+import pytest
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import EditMessageText
+from aiogram.types import Message
+from sqlalchemy import insert, update
+
+from benchmarks.fake_bot import FakeSession
+from benchmarks.harness import BENCH_ENV
+from conftest import requires_postgres
+from db import async_session
+from db_models import User, Order
+
+
+@requires_postgres
+async def test_order_pages_survive_status_changes(bot_module):
+    main = bot_module
+    async with async_session() as session:
+        await session.execute(insert(User).values(telegram_id=1, username="customer"))
+        ids = list(await session.scalars(insert(Order).returning(Order.id), [
+            {"title": f"Заказ {number}", "description": "Описание", "price": 1_000_000, "customer_id": 1}
+            for number in range(main.HISTORY_PAGE_SIZE * 3)
+        ]))
+        await session.commit()
+
+    seen, cursor = [], main.HistoryPage(view="orders")
+    while True:
+        rows = (await main.fetch_history_rows(1, cursor))[:main.HISTORY_PAGE_SIZE]
+        seen += [order.id for order in rows]
+        # Пока пользователь листает, у старых заказов меняется статус.
+        async with async_session() as session:
+            await session.execute(update(Order).where(Order.id == min(ids)).values(status_changed_at=datetime.now(UTC)))
+            await session.commit()
+        _, keyboard = await main.render_history_page(1, cursor)
+        following = [button for row in keyboard.inline_keyboard for button in row if button.text == "Далее ▶️"]
+        if not following:
+            break
+        cursor = main.HistoryPage.unpack(following[0].callback_data)
+
+    assert seen == sorted(ids, reverse=True)
+
+
+class EditErrorSession(FakeSession):
+    def __init__(self, error: str):
+        super().__init__()
+        self.error = error
+
+    async def make_request(self, bot, method, timeout=None):
+        if isinstance(method, EditMessageText):
+            raise TelegramBadRequest(method, f"Bad Request: {self.error}")
+        return await super().make_request(bot, method, timeout)
+
+
+def _message(bot) -> Message:
+    return Message.model_validate({
+        "message_id": 1, "date": datetime.now(UTC), "chat": {"id": 1, "type": "private"}, "text": "Страница",
+    }, context={"bot": bot})
+
+
+async def test_pressing_active_filter_is_not_an_error():
+    import main
+    await main.edit_page(_message(Bot(BENCH_ENV["BOT_TOKEN"], session=EditErrorSession("message is not modified"))),
+                         "Страница", None)
+    with pytest.raises(TelegramBadRequest):
+        await main.edit_page(_message(Bot(BENCH_ENV["BOT_TOKEN"], session=EditErrorSession("message to edit not found"))),
+                             "Страница", None)
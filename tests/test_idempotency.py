@@ -0,0 +1,39 @@
+from datetime import datetime, UTC
+
+from aiogram import Bot
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.types import CallbackQuery
+
+from benchmarks.fake_bot import FakeSession
+from benchmarks.harness import BENCH_ENV
+from idempotency import CallbackIdempotencyMiddleware
+
+
+def _callback(bot, data: str) -> CallbackQuery:
+    return CallbackQuery.model_validate({
+        "id": "1", "from": {"id": 5, "is_bot": False, "first_name": "User"}, "chat_instance": "5", "data": data,
+        "message": {"message_id": 10, "date": datetime.now(UTC), "chat": {"id": 5, "type": "private"}, "text": "..."},
+    }, context={"bot": bot})
+
+
+async def _press(middleware, handler, event):
+    data = {"handler": HandlerObject(callback=handler, flags={"idempotent": True})}
+    return await middleware(lambda event, data: handler(event, **data), event, data)
+
+
+async def test_only_successful_calls_are_cached():
+    bot = Bot(BENCH_ENV["BOT_TOKEN"], session=FakeSession())
+    middleware = CallbackIdempotencyMiddleware()
+    calls = []
+
+    async def accept_work(callback, idempotency, **kwargs):
+        calls.append(callback.data)
+        # Первое нажатие упирается в нехватку средств, второе проходит.
+        if len(calls) > 1:
+            idempotency.done()
+
+    event = _callback(bot, "order:accept_work:1")
+    await _press(middleware, accept_work, event)
+    await _press(middleware, accept_work, event)
+    await _press(middleware, accept_work, event)
+    assert calls == ["order:accept_work:1", "order:accept_work:1"]
@@ -0,0 +1,56 @@
+import asyncio
+import random
+
+from sqlalchemy import select, func, insert
+
+from conftest import requires_postgres
+from db import async_session
+from db_models import User, FinancialTransaction
+from ledger import credit_balance, debit_balance
+from money import Money
+
+USERS = [1001, 1002, 1003]
+INITIAL_BALANCE = Money.parse("50")
+OPERATIONS = 3000
+
+
+async def _apply(semaphore, user_id: int, amount: Money, is_debit: bool):
+    async with semaphore, async_session() as session:
+        if is_debit:
+            new_balance = await debit_balance(session, user_id, amount, "order_payment")
+        else:
+            new_balance = await credit_balance(session, user_id, amount, "deposit")
+        await session.commit()
+    return None if new_balance is None else (amount if not is_debit else -amount)
+
+
+@requires_postgres
+async def test_parallel_credits_and_debits_keep_ledger_in_sync(database):
+    async with async_session() as session:
+        await session.execute(insert(User), [{"telegram_id": user_id, "balance": INITIAL_BALANCE} for user_id in USERS])
+        await session.commit()
+
+    rng = random.Random(26)
+    # Списаний больше, чем начислений: часть из них обязана упереться в нехватку средств.
+    operations = [
+        (rng.choice(USERS), Money.parse(rng.choice(["0.5", "1", "2.25", "5"])), rng.random() < 0.6)
+        for _ in range(OPERATIONS)
+    ]
+    semaphore = asyncio.Semaphore(25)
+    results = await asyncio.gather(*(_apply(semaphore, *operation) for operation in operations))
+
+    applied = {user_id: 0 for user_id in USERS}
+    for (user_id, _, _), delta in zip(operations, results):
+        if delta is not None:
+            applied[user_id] += delta
+    assert any(result is None for result in results), "ни одно списание не было отклонено"
+
+    async with async_session() as session:
+        balances = dict((await session.execute(select(User.telegram_id, User.balance))).all())
+        ledger = dict((await session.execute(
+            select(FinancialTransaction.user_id, func.sum(FinancialTransaction.amount)).group_by(FinancialTransaction.user_id)
+        )).all())
+    for user_id in USERS:
+        assert balances[user_id] >= 0
+        assert balances[user_id] == INITIAL_BALANCE + applied[user_id]
+        assert balances[user_id] == INITIAL_BALANCE + ledger.get(user_id, 0)
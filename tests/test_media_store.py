@@ -0,0 +1,97 @@
+import os
+import time
+from datetime import datetime, timedelta, UTC
+
+from sqlalchemy import insert, select
+
+import media_store
+from conftest import requires_postgres
+from db import engine, async_session
+from db_models import User, Order, ChatMessage, Setting, UnlinkedMedia, ArchivedMedia
+from order_states import COMPLETED
+from partitions import archive_partition, create_partition, partition_name, add_months
+
+
+def _file(path: str, age: timedelta) -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(path.encode())
+    moment = time.time() - age.total_seconds()
+    os.utime(path, (moment, moment))
+    return path
+
+
+@requires_postgres
+async def test_gc_keeps_archived_and_freshly_reused_media(database, monkeypatch, tmp_path):
+    monkeypatch.setattr(media_store, "MEDIA_DIR", str(tmp_path / "media"))
+    old = timedelta(days=60)
+    expired_file = _file(media_store.content_path("aa" * 32, "jpg"), old)
+    disputed_file = _file(media_store.content_path("bb" * 32, "jpg"), old)
+    # Файл отвязан, но то же содержимое только что пришло в новом сообщении: _place продлил mtime.
+    reused_file = _file(media_store.content_path("cc" * 32, "jpg"), timedelta(0))
+
+    month = add_months(datetime.now(UTC).date().replace(day=1), -14)
+    archived_partition = partition_name("chat_messages", month)
+    await create_partition(engine, "chat_messages", archived_partition, month)
+    async with async_session() as session:
+        await session.execute(insert(User).values(telegram_id=1))
+        finished = datetime.now(UTC) - old
+        expired_order, disputed_order = list(await session.scalars(insert(Order).returning(Order.id), [
+            {"title": "Логотип", "description": "...", "price": 1_000_000, "customer_id": 1, "status": COMPLETED,
+             "status_changed_at": finished, "was_disputed": False},
+            {"title": "Баннер", "description": "...", "price": 1_000_000, "customer_id": 1, "status": COMPLETED,
+             "status_changed_at": finished, "was_disputed": True},
+        ]))
+        await session.execute(insert(ChatMessage), [
+            {"order_id": expired_order, "sender_id": 1, "content_type": "photo", "file_path": expired_file},
+            {"order_id": disputed_order, "sender_id": 1, "content_type": "photo", "file_path": disputed_file,
+             "timestamp": datetime(month.year, month.month, 10, tzinfo=UTC)},
+        ])
+        session.add(UnlinkedMedia(path=reused_file))
+        await session.commit()
+
+    # Секция с перепиской спорного заказа уходит в архив: в БД ссылок на файл больше нет.
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await archive_partition(conn, "chat_messages", archived_partition, archive_dir=str(tmp_path / "archive"))
+
+    await media_store.collect_media(engine)
+
+    assert not os.path.exists(expired_file)
+    assert os.path.exists(disputed_file)
+    assert os.path.exists(reused_file)
+    async with async_session() as session:
+        assert list(await session.scalars(select(UnlinkedMedia.path))) == [reused_file]
+        assert await session.scalar(select(ChatMessage.file_path).where(ChatMessage.order_id == expired_order)) is None
+
+
+@requires_postgres
+async def test_legacy_migration_resumes_after_pinned_files(database, monkeypatch, tmp_path):
+    monkeypatch.setattr(media_store, "MEDIA_DIR", str(tmp_path / "media"))
+    old = timedelta(days=2)
+    pinned = [_file(f"{media_store.MEDIA_DIR}/pinned{number}.jpg", old) for number in range(4)]
+    fresh = _file(f"{media_store.MEDIA_DIR}/fresh.jpg", timedelta(0))
+    abandoned = [_file(f"{media_store.MEDIA_DIR}/abandoned{number}.jpg", old) for number in range(5)]
+    async with async_session() as session:
+        session.add_all(ArchivedMedia(path=path) for path in pinned)
+        await session.commit()
+
+    checked = []
+    archived = media_store._archived
+
+    async def record_archived(conn, paths):
+        checked.extend(paths)
+        return await archived(conn, paths)
+
+    monkeypatch.setattr(media_store, "_archived", record_archived)
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        removed = [await media_store.migrate_legacy(conn, limit=3) for _ in range(4)]
+        cursor = await conn.scalar(select(Setting.value).where(Setting.key == media_store.LEGACY_CURSOR_KEY))
+
+    # Оставшиеся на месте файлы не проверяются повторно, пока обход не дойдёт до конца каталога.
+    assert sorted(checked) == sorted([*pinned, fresh, *abandoned])
+    assert sum(removed) == len(abandoned)
+    assert cursor == ""
+    assert all(os.path.exists(path) for path in [*pinned, fresh])
+    assert not any(os.path.exists(path) for path in abandoned)
@@ -0,0 +1,13 @@
+from prometheus_client import CollectorRegistry
+
+from metrics import SendQueueCollector
+
+
+def test_send_queue_depth_is_exported_per_queue():
+    pending = [1, 2, 3]
+    registry = CollectorRegistry()
+    registry.register(SendQueueCollector({"notifications": lambda: len(pending), "channel_edits": lambda: 0}))
+    assert registry.get_sample_value("bot_send_queue_depth", {"queue": "notifications"}) == 3
+    pending.clear()
+    assert registry.get_sample_value("bot_send_queue_depth", {"queue": "notifications"}) == 0
+    assert registry.get_sample_value("bot_send_queue_depth", {"queue": "channel_edits"}) == 0
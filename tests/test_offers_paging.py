@@ -0,0 +1,45 @@
+from decimal import Decimal
+
+from sqlalchemy import insert, update
+
+from conftest import requires_postgres
+from db import async_session
+from db_models import User, Order, Offer
+
+
+@requires_postgres
+async def test_offer_pages_cover_every_offer_once_with_null_ratings(bot_module):
+    main = bot_module
+    ratings = [Decimal("4.90"), None, Decimal("4.50"), None, Decimal("4.50"), Decimal("3.00"), None,
+               Decimal("5.00"), None, Decimal("4.90"), None, Decimal("2.10")]
+    async with async_session() as session:
+        await session.execute(insert(User).values(telegram_id=1, username="customer"))
+        await session.execute(insert(User), [
+            {"telegram_id": 100 + number, "username": f"executor{number}", "rating": rating}
+            for number, rating in enumerate(ratings)
+        ])
+        # Значение по умолчанию в модели подставляется и вместо явного None, поэтому NULL ставится отдельно.
+        await session.execute(update(User).where(User.telegram_id.in_(
+            [100 + number for number, rating in enumerate(ratings) if rating is None]
+        )).values(rating=None))
+        order = Order(title="Логотип", description="Описание", price=1_000_000, customer_id=1)
+        session.add(order)
+        await session.flush()
+        await session.execute(insert(Offer), [
+            {"order_id": order.id, "executor_id": 100 + number, "message": "Готов"} for number in range(len(ratings))
+        ])
+        await session.commit()
+
+    seen, cursor = [], main.OffersPage(order_id=order.id)
+    for _ in range(len(ratings)):
+        text, keyboard = await main.render_offers_page(order, cursor)
+        buttons = [button for row in keyboard.inline_keyboard for button in row]
+        seen += [main.OfferCallback.unpack(button.callback_data).offer_id
+                 for button in buttons if button.callback_data.startswith("offer:")]
+        following = [button for button in buttons if button.text == "Далее ▶️"]
+        if not following:
+            break
+        cursor = main.OffersPage.unpack(following[0].callback_data)
+
+    assert sorted(seen) == sorted(set(seen))
+    assert len(seen) == len(ratings)
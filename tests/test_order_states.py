@@ -0,0 +1,164 @@
+import asyncio
+from datetime import datetime, timedelta, UTC
+from decimal import Decimal
+
+import pytest
+from aiogram.types import CallbackQuery
+from sqlalchemy import insert, select, func
+
+import order_states
+import vip  # noqa: F401 — регистрирует хуки освобождения квот
+from conftest import requires_postgres
+from db import async_session
+from db_models import User, Order, FinancialTransaction, Setting
+from money import Money
+from order_states import (
+    transition, expire_stale_open_orders, auto_accept_pending_orders,
+    OPEN, IN_PROGRESS, PENDING_APPROVAL, COMPLETED, EXPIRED,
+)
+
+CUSTOMER, EXECUTOR = 1, 2
+
+
+async def _create_orders(count: int, status: str, price: Money, age: timedelta, **values) -> list[int]:
+    moment = datetime.now(UTC) - age
+    async with async_session() as session:
+        ids = list(await session.scalars(insert(Order).returning(Order.id), [{
+            "title": f"Заказ {number}", "description": "Описание", "price": price, "status": status,
+            "customer_id": CUSTOMER, "creation_date": moment, "status_changed_at": moment, **values,
+        } for number in range(count)]))
+        await session.commit()
+    return ids
+
+
+async def _create_users(active_orders: int = 0):
+    async with async_session() as session:
+        await session.execute(insert(User), [
+            {"telegram_id": CUSTOMER, "balance": Money(0), "active_orders_count": active_orders},
+            {"telegram_id": EXECUTOR, "balance": Money(0)},
+        ])
+        await session.commit()
+
+
+async def _balance(user_id: int) -> Money:
+    async with async_session() as session:
+        return await session.scalar(select(User.balance).where(User.telegram_id == user_id))
+
+
+@requires_postgres
+async def test_transition_follows_state_machine(database):
+    await _create_users()
+    [order_id] = await _create_orders(1, OPEN, Money.parse("5"), timedelta(0))
+    async with async_session() as session:
+        assert await transition(session, order_id, PENDING_APPROVAL) is None
+        assert await transition(session, order_id, COMPLETED) is None
+        order = await transition(session, order_id, IN_PROGRESS, executor_id=EXECUTOR)
+        assert (order.status, order.executor_id) == (IN_PROGRESS, EXECUTOR)
+        assert await transition(session, order_id, IN_PROGRESS) is None
+        assert await transition(session, order_id, PENDING_APPROVAL, from_statuses=[OPEN]) is None
+        assert (await transition(session, order_id, PENDING_APPROVAL)).status == PENDING_APPROVAL
+        await session.commit()
+
+
+@requires_postgres
+async def test_concurrent_transitions_have_one_winner(database):
+    await _create_users()
+    [order_id] = await _create_orders(1, OPEN, Money.parse("5"), timedelta(0))
+
+    async def select_executor():
+        async with async_session() as session:
+            order = await transition(session, order_id, IN_PROGRESS, executor_id=EXECUTOR)
+            await session.commit()
+            return order
+
+    winners = [order for order in await asyncio.gather(*(select_executor() for _ in range(10))) if order]
+    assert len(winners) == 1
+
+
+@requires_postgres
+async def test_concurrent_expiry_sweeps_refund_each_order_once(database, monkeypatch):
+    monkeypatch.setattr(order_states, "SWEEP_BATCH_SIZE", 7)
+    await _create_users(active_orders=32)
+    price = Money.parse("1.5")
+    stale = await _create_orders(30, OPEN, price, order_states.OPEN_ORDER_TTL + timedelta(hours=1))
+    fresh = await _create_orders(2, OPEN, price, timedelta(hours=1))
+
+    async def sweep():
+        expired = []
+        while True:
+            async with async_session() as session:
+                batch = await expire_stale_open_orders(session)
+                await session.commit()
+            expired += [row.id for row in batch]
+            if not batch:
+                return expired
+
+    swept = [order_id for batch in await asyncio.gather(*(sweep() for _ in range(3))) for order_id in batch]
+    assert sorted(swept) == stale
+
+    async with async_session() as session:
+        statuses = dict((await session.execute(select(Order.id, Order.status))).all())
+        refunds = await session.scalar(
+            select(func.count()).where(FinancialTransaction.type == "order_refund", FinancialTransaction.user_id == CUSTOMER)
+        )
+        active_orders = await session.scalar(select(User.active_orders_count).where(User.telegram_id == CUSTOMER))
+    assert all(statuses[order_id] == EXPIRED for order_id in stale)
+    assert all(statuses[order_id] == OPEN for order_id in fresh)
+    assert refunds == len(stale)
+    assert await _balance(CUSTOMER) == price * len(stale)
+    assert active_orders == len(fresh)
+
+
+@requires_postgres
+async def test_auto_accept_pays_overdue_work(database):
+    await _create_users()
+    price = Money.parse("12")
+    overdue = await _create_orders(3, PENDING_APPROVAL, price, order_states.APPROVAL_TIMEOUT + timedelta(hours=1),
+                                   executor_id=EXECUTOR)
+    recent = await _create_orders(1, PENDING_APPROVAL, price, timedelta(hours=1), executor_id=EXECUTOR)
+
+    async with async_session() as session:
+        rows = await auto_accept_pending_orders(session, Decimal("10"))
+        await session.commit()
+
+    assert sorted(row.id for row in rows) == overdue
+    assert all(row.payout == Money.parse("10.8") for row in rows)
+    assert await _balance(EXECUTOR) == Money.parse("10.8") * len(overdue)
+    async with async_session() as session:
+        assert await session.scalar(select(Order.status).where(Order.id == recent[0])) == PENDING_APPROVAL
+
+
+@pytest.mark.parametrize("to_status", [IN_PROGRESS, PENDING_APPROVAL, COMPLETED, EXPIRED])
+def test_every_target_status_is_reachable(to_status):
+    assert order_states.sources_for(to_status)
+
+
+@requires_postgres
+async def test_auto_accept_pays_as_much_as_manual_acceptance(bot_module):
+    main = bot_module
+    commission = "2.5"
+    async with async_session() as session:
+        session.add(Setting(key="commission_percent", value=commission))
+        await session.commit()
+    main.metadata.invalidate()
+    await _create_users()
+    # 12.345679 USDT: 2.5% — 308 641.975 микро-USDT, округляется вверх; целые 2% дали бы другую выплату.
+    price = Money(12_345_679)
+    age = order_states.APPROVAL_TIMEOUT + timedelta(hours=1)
+    manual, swept = await _create_orders(2, PENDING_APPROVAL, price, age, executor_id=EXECUTOR)
+
+    callback = CallbackQuery.model_validate({
+        "id": "1", "from": {"id": CUSTOMER, "is_bot": False, "first_name": "User"}, "chat_instance": "1",
+        "data": f"order:accept_work:{manual}",
+        "message": {"message_id": 1, "date": datetime.now(UTC), "chat": {"id": CUSTOMER, "type": "private"}, "text": "..."},
+    }, context={"bot": main.bot})
+    await main.accept_work(callback, callback_data=main.OrderCallback(action="accept_work", order_id=manual))
+    async with async_session() as session:
+        [row] = await auto_accept_pending_orders(session, Decimal(commission))
+        await session.commit()
+        rewards = dict((await session.execute(
+            select(FinancialTransaction.order_id, FinancialTransaction.amount).where(FinancialTransaction.type == "order_reward")
+        )).all())
+
+    assert row.id == swept
+    assert rewards[manual] == rewards[swept] == row.payout == price - price.percent(Decimal(commission)) == Money(12_037_037)
@@ -0,0 +1,67 @@
+from datetime import date, datetime, UTC
+
+from sqlalchemy import insert, select, text, func
+
+import partitions
+from conftest import requires_postgres
+from db import engine, async_session
+from db_models import User, Order, ChatMessage
+from partitions import maintain_partitions, partition_name, add_months
+
+
+async def _regclass_exists(name: str) -> bool:
+    async with engine.connect() as conn:
+        return await conn.scalar(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name})
+
+
+@requires_postgres
+async def test_missed_month_is_moved_out_of_default_partition(database):
+    today = datetime.now(UTC).date()
+    # Обслуживание не запускалось: секции через PARTITIONS_AHEAD + 1 месяцев ещё нет.
+    month = add_months(today.replace(day=1), partitions.PARTITIONS_AHEAD + 1)
+    name = partition_name("chat_messages", month)
+    async with engine.begin() as conn:
+        await conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+    async with async_session() as session:
+        await session.execute(insert(User).values(telegram_id=1))
+        order = Order(title="Логотип", description="Описание", price=1_000_000, customer_id=1)
+        session.add(order)
+        await session.flush()
+        moment = datetime(month.year, month.month, 15, tzinfo=UTC)
+        await session.execute(insert(ChatMessage), [
+            {"order_id": order.id, "sender_id": 1, "timestamp": moment, "content_type": "text", "text_content": str(number)}
+            for number in range(5)
+        ])
+        await session.commit()
+
+    await maintain_partitions(engine, today=add_months(today.replace(day=1), 1))
+
+    async with engine.connect() as conn:
+        assert await conn.scalar(text(f"SELECT count(*) FROM {name}")) == 5
+        assert await conn.scalar(text("SELECT count(*) FROM chat_messages_default")) == 0
+    async with async_session() as session:
+        assert await session.scalar(select(func.count(ChatMessage.id)).where(ChatMessage.order_id == order.id)) == 5
+
+
+@requires_postgres
+async def test_failure_in_one_table_does_not_block_others(database, monkeypatch):
+    month = add_months(datetime.now(UTC).date().replace(day=1), partitions.PARTITIONS_AHEAD + 1)
+    async with engine.begin() as conn:
+        for table in partitions.RETENTION_MONTHS:
+            await conn.execute(text(f"DROP TABLE IF EXISTS {partition_name(table, month)}"))
+    create_partition = partitions.create_partition
+
+    async def failing_create_partition(engine, table, name, month):
+        if table == "chat_messages":
+            raise RuntimeError("нет места")
+        await create_partition(engine, table, name, month)
+
+    monkeypatch.setattr(partitions, "create_partition", failing_create_partition)
+    await maintain_partitions(engine, today=add_months(month, -partitions.PARTITIONS_AHEAD))
+
+    assert not await _regclass_exists(partition_name("chat_messages", month))
+    assert await _regclass_exists(partition_name("financial_transactions", month))
+
+    monkeypatch.setattr(partitions, "create_partition", create_partition)
+    await maintain_partitions(engine, today=add_months(month, -partitions.PARTITIONS_AHEAD))
+    assert await _regclass_exists(partition_name("chat_messages", month))
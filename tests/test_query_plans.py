@@ -0,0 +1,111 @@
+"""
+Регрессия планов: горячие запросы обработчиков должны идти по индексам из миграций.
+Данные засеваются в объёме, при котором полный просмотр заметно дороже индекса, затем ANALYZE.
+"""
+import json
+
+import pytest
+from sqlalchemy import text
+
+from conftest import requires_postgres, run
+from db import engine
+
+SEED = [
+    """INSERT INTO users (telegram_id, username, balance, rating, reviews_count, registration_date,
+                          vip_expires_at, is_blocked, active_orders_count, active_offers_count, is_active)
+       SELECT 100000 + n, 'user' || n, 0, 4.5, 0, now(),
+              CASE WHEN n % 50 = 0 THEN now() + (n % 30) * interval '1 day' END, false, 0, 0, true
+       FROM generate_series(1, 5000) AS n""",
+    """INSERT INTO orders (title, description, price, status, customer_id, executor_id, creation_date, status_changed_at)
+       SELECT 'Заказ ' || n, 'Описание', 1000000,
+              (ARRAY['open', 'in_progress', 'pending_approval', 'completed', 'expired'])[1 + n % 5],
+              100000 + 1 + n % 5000, 100000 + 1 + (n * 7) % 5000,
+              now() - (n % 1000) * interval '1 hour', now() - (n % 1000) * interval '1 hour'
+       FROM generate_series(1, 50000) AS n""",
+    """INSERT INTO offers (order_id, executor_id, message)
+       SELECT 1 + n % 50000, 100000 + 1 + n % 5000, 'Отклик' FROM generate_series(1, 100000) AS n""",
+    """INSERT INTO chat_messages (order_id, sender_id, timestamp, content_type, text_content)
+       SELECT 1 + n % 50000, 100000 + 1 + n % 5000, now() - (n % 1000) * interval '1 hour', 'text', 'Сообщение'
+       FROM generate_series(1, 100000) AS n""",
+    """INSERT INTO financial_transactions (user_id, type, amount, timestamp)
+       SELECT 100000 + 1 + n % 5000, 'deposit', 1000000, now() - (n % 1000) * interval '1 hour'
+       FROM generate_series(1, 100000) AS n""",
+    """INSERT INTO reviews (order_id, reviewer_id, reviewee_id, rating, text)
+       SELECT 1 + n, 100000 + 1 + n % 5000, 100000 + 1 + (n * 3) % 5000, 5, 'Отзыв'
+       FROM generate_series(1, 20000) AS n""",
+    "ANALYZE",
+]
+
+# (обработчик, запрос, индекс, который должен оказаться в плане)
+HOT_QUERIES = [
+    ("handle_order_feed",
+     "SELECT * FROM orders WHERE status = 'open' AND customer_id <> :user_id ORDER BY creation_date DESC LIMIT 10",
+     "ix_orders_status_creation_date"),
+    ("fetch_history_rows (заказчик)",
+     "SELECT * FROM orders WHERE customer_id = :user_id AND id < 40000 ORDER BY id DESC LIMIT 11",
+     "ix_orders_customer_id_id"),
+    ("fetch_history_rows (исполнитель)",
+     "SELECT * FROM orders WHERE executor_id = :user_id AND id < 40000 ORDER BY id DESC LIMIT 11",
+     "ix_orders_executor_id_id"),
+    ("sweep_orders",
+     "SELECT id FROM orders WHERE status = 'open' AND status_changed_at < now() - interval '40 days' LIMIT 500",
+     "ix_orders_status_status_changed_at"),
+    ("handle_offer_message",
+     "SELECT id FROM offers WHERE order_id = :order_id AND executor_id = :user_id",
+     "ix_offers_order_id_executor_id"),
+    ("send_chat_log",
+     "SELECT * FROM chat_messages WHERE order_id = :order_id ORDER BY timestamp",
+     "ix_chat_messages_order_id_timestamp"),
+    ("fetch_history_rows (финансы)",
+     "SELECT * FROM financial_transactions WHERE user_id = :user_id ORDER BY timestamp DESC, id DESC LIMIT 11",
+     "ix_financial_transactions_user_id_timestamp"),
+    ("get_public_profile (отзывы)",
+     "SELECT count(*) FROM reviews WHERE reviewee_id = :user_id",
+     "ix_reviews_reviewee_id"),
+    ("get_public_profile",
+     "SELECT * FROM users WHERE username = 'user42'",
+     "ix_users_username"),
+    ("claim_expiry_reminders",
+     "SELECT telegram_id FROM users WHERE vip_expires_at > now() AND vip_expires_at < now() + interval '1 day'",
+     "ix_users_vip_expires_at"),
+]
+PARAMS = {"user_id": 100042, "order_id": 4242}
+
+
+def _index_names(plan: dict):
+    if "Index Name" in plan:
+        yield plan["Index Name"]
+    for child in plan.get("Plans", []):
+        yield from _index_names(child)
+
+
+async def _seed():
+    async with engine.begin() as conn:
+        for statement in SEED:
+            await conn.execute(text(statement))
+
+
+async def _plan_indexes(query: str) -> set[str]:
+    async with engine.connect() as conn:
+        plan = await conn.scalar(text(f"EXPLAIN (FORMAT JSON) {query}"), PARAMS)
+        plan = json.loads(plan) if isinstance(plan, str) else plan
+        names = set()
+        # Индексы секций приводятся к индексу секционированной таблицы.
+        for name in _index_names(plan[0]["Plan"]):
+            names.add(await conn.scalar(text(
+                "SELECT coalesce(pg_partition_root(CAST(:name AS regclass)), CAST(:name AS regclass))::text"
+            ), {"name": name}))
+        return names
+
+
+@pytest.fixture(scope="module")
+def seeded(migrated):
+    from conftest import _truncate
+    run(_truncate())
+    run(_seed())
+
+
+@requires_postgres
+@pytest.mark.parametrize("handler, query, index", HOT_QUERIES, ids=[item[0] for item in HOT_QUERIES])
+async def test_hot_query_uses_index(seeded, handler, query, index):
+    assert index in await _plan_indexes(query), f"{handler}: план не использует {index}"
@@ -0,0 +1,75 @@
+from datetime import datetime, UTC
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import CallbackQuery, Message
+from sqlalchemy import insert, select, func
+
+from benchmarks.fake_bot import FakeSession
+from conftest import requires_postgres
+from db import async_session
+from db_models import User, Category, CategorySubscription
+from money import Money
+
+USER_ID = 5
+
+
+class RecordingSession(FakeSession):
+    def __init__(self):
+        super().__init__()
+        self.methods = []
+
+    async def make_request(self, bot, method, timeout=None):
+        self.methods.append(method)
+        return await super().make_request(bot, method, timeout)
+
+
+def _event(main, bot_session):
+    main.bot.session = bot_session
+    user = {"id": USER_ID, "is_bot": False, "first_name": "User"}
+    message = {"message_id": 10, "date": datetime.now(UTC), "chat": {"id": USER_ID, "type": "private"}, "from": user}
+    callback = CallbackQuery.model_validate({
+        "id": "1", "from": user, "chat_instance": "5", "data": "sub:category:404", "message": {**message, "text": "..."},
+    }, context={"bot": main.bot})
+    return callback, Message.model_validate({**message, "text": "10-100"}, context={"bot": main.bot})
+
+
+@requires_postgres
+async def test_deleted_category_is_reported_not_raised(bot_module):
+    main = bot_module
+    async with async_session() as session:
+        await session.execute(insert(User).values(telegram_id=USER_ID))
+        await session.commit()
+    bot_session = RecordingSession()
+    callback, message = _event(main, bot_session)
+    state = FSMContext(storage=MemoryStorage(), key=StorageKey(main.bot.id, USER_ID, USER_ID))
+
+    await main.add_subscription_category(callback, callback_data=main.SubscriptionCallback(action="category", category_id=404), state=state)
+    assert bot_session.methods[-1].show_alert
+    assert await state.get_state() is None
+
+    # Категорию удалили, пока пользователь вводил диапазон цен.
+    await state.update_data(category_id=404)
+    await state.set_state(main.SubscriptionSetup.enter_price_range)
+    await main.add_subscription_price_range(message, state=state)
+    assert "удалили" in bot_session.methods[-1].text
+    assert await state.get_state() is None
+    async with async_session() as session:
+        assert await session.scalar(select(func.count(CategorySubscription.id))) == 0
+
+
+@requires_postgres
+async def test_standby_reloads_subscriptions_before_polling(bot_module):
+    main = bot_module
+    await main.load_local_state()
+    # Пока процесс ждал в резерве, ведущий принял новую подписку.
+    async with async_session() as session:
+        await session.execute(insert(User).values(telegram_id=USER_ID))
+        category_id = await session.scalar(insert(Category).values(name="Дизайн").returning(Category.id))
+        await session.execute(insert(CategorySubscription).values(user_id=USER_ID, category_id=category_id))
+        await session.commit()
+    assert main.subscription_index.match(category_id, Money.parse("10")) == []
+
+    await main.load_local_state()
+    assert main.subscription_index.match(category_id, Money.parse("10")) == [USER_ID]
@@ -0,0 +1,89 @@
+import asyncio
+from datetime import datetime, timedelta, UTC
+
+from sqlalchemy import insert
+
+from conftest import requires_postgres
+from db import async_session
+from db_models import User, SupportMessage
+from support import SupportDesk
+
+AGENTS = [101, 102, 103]
+
+
+async def _open_tickets(desk: SupportDesk, user_ids: list[int]) -> list:
+    tickets = []
+    for user_id in user_ids:
+        async with async_session() as session:
+            await session.execute(insert(User).values(telegram_id=user_id))
+            ticket, _ = await desk.open_ticket(session, user_id)
+            await session.commit()
+        tickets.append(ticket)
+    return tickets
+
+
+@requires_postgres
+async def test_processes_share_agent_load_and_status(database):
+    # Два процесса бота: каждый видит тикеты и статусы, заведённые другим.
+    first, second = SupportDesk(AGENTS), SupportDesk(AGENTS)
+    async with async_session() as session:
+        await first.set_online(session, 103, False)
+        await session.commit()
+
+    tickets = await _open_tickets(first, [1, 2]) + await _open_tickets(second, [3, 4])
+    assert sorted(ticket.agent_id for ticket in tickets) == [101, 101, 102, 102]
+
+    async with async_session() as session:
+        assert not await second.is_online(session, 103)
+        assert await second.is_online(session, 101)
+        await second.close_ticket(session, tickets[0].id)
+        await session.commit()
+        assert await first.load(session) == {101: 1, 102: 2, 103: 0}
+
+
+@requires_postgres
+async def test_digest_skips_fresh_messages_of_online_agents(database):
+    desk = SupportDesk(AGENTS[:2])
+    online_ticket, offline_ticket = await _open_tickets(desk, [1, 2])
+    assert (online_ticket.agent_id, offline_ticket.agent_id) == (101, 102)
+    async with async_session() as session:
+        await desk.set_online(session, 102, False)
+        stale = datetime.now(UTC) - timedelta(hours=1)
+        await session.execute(insert(SupportMessage), [
+            {"ticket_id": online_ticket.id, "sender_id": 1, "text": "свежее", "created_at": datetime.now(UTC)},
+            {"ticket_id": online_ticket.id, "sender_id": 1, "text": "зависшее", "created_at": stale},
+            {"ticket_id": offline_ticket.id, "sender_id": 2, "text": "агент не в сети", "created_at": datetime.now(UTC)},
+        ])
+        await session.commit()
+        digests = await desk.claim_digests(session)
+        await session.commit()
+    assert [(ticket.id, [message.text for message in messages]) for ticket, messages in digests] == [
+        (online_ticket.id, ["зависшее"]), (offline_ticket.id, ["агент не в сети"]),
+    ]
+
+
+@requires_postgres
+async def test_concurrent_digests_claim_each_message_once(database):
+    desks = [SupportDesk(AGENTS) for _ in range(4)]
+    tickets = await _open_tickets(desks[0], [1, 2, 3])
+    async with async_session() as session:
+        stale = datetime.now(UTC) - timedelta(hours=1)
+        await session.execute(insert(SupportMessage), [
+            {"ticket_id": ticket.id, "sender_id": ticket.user_id, "text": str(number), "created_at": stale}
+            for ticket in tickets for number in range(5)
+        ])
+        await session.commit()
+
+    async def claim(desk):
+        async with async_session() as session:
+            digests = await desk.claim_digests(session)
+            await session.commit()
+        return [message.id for _, messages in digests for message in messages]
+
+    claimed = [message_id for batch in await asyncio.gather(*(claim(desk) for desk in desks)) for message_id in batch]
+    assert len(claimed) == len(set(claimed)) == 15
+
+    async with async_session() as session:
+        await desks[0].release_messages(session, claimed[:2])
+        await session.commit()
+        assert sorted(m.id for _, messages in await desks[1].claim_digests(session) for m in messages) == sorted(claimed[:2])
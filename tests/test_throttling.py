@@ -0,0 +1,52 @@
+from datetime import datetime, UTC
+
+from aiogram import Bot
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.types import Message
+
+from benchmarks.fake_bot import FakeSession
+from benchmarks.harness import BENCH_ENV
+from throttling import MemoryTokenBuckets, ThrottlingMiddleware, _parse_costs
+
+
+def _message(bot, user_id: int, text: str) -> Message:
+    return Message.model_validate({
+        "message_id": 1, "date": datetime.now(UTC), "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "User"}, "text": text,
+    }, context={"bot": bot})
+
+
+def _data(message: Message, callback, flags: dict | None = None) -> dict:
+    return {"event_from_user": message.from_user, "handler": HandlerObject(callback=callback, flags=flags or {})}
+
+
+async def test_rejected_message_gets_one_notice_per_wait_window():
+    session = FakeSession()
+    bot = Bot(BENCH_ENV["BOT_TOKEN"], session=session)
+    middleware = ThrottlingMiddleware(MemoryTokenBuckets(rate=0.5, burst=2))
+    handled = []
+
+    async def handle_chat_messages(event, data):
+        handled.append(event.text)
+
+    for number in range(5):
+        message = _message(bot, 7, f"сообщение {number}")
+        await middleware(handle_chat_messages, message, _data(message, handle_chat_messages))
+
+    assert handled == ["сообщение 0", "сообщение 1"]
+    assert session.calls["SendMessage"] == 1
+
+
+async def test_cost_above_burst_is_clamped():
+    assert _parse_costs("handle_order_feed=50, handle_profile=1", burst=8) == {"handle_order_feed": 8, "handle_profile": 1}
+
+    bot = Bot(BENCH_ENV["BOT_TOKEN"], session=FakeSession())
+    middleware = ThrottlingMiddleware(MemoryTokenBuckets(rate=2, burst=8))
+    handled = []
+
+    async def handle_order_feed(event, data):
+        handled.append(event.text)
+
+    message = _message(bot, 8, "🔥 Лента заказов")
+    await middleware(handle_order_feed, message, _data(message, handle_order_feed, {"throttle_cost": 20}))
+    assert handled == ["🔥 Лента заказов"]
@@ -0,0 +1,161 @@
+import os
+import math
+import time
+import asyncio
+import logging
+import itertools
+
+from aiogram import BaseMiddleware, types
+from aiogram.dispatcher.flags import get_flag
+
+THROTTLE_RATE = float(os.getenv("THROTTLE_RATE", "2"))
+THROTTLE_BURST = float(os.getenv("THROTTLE_BURST", "8"))
+THROTTLE_REDIS_URL = os.getenv("THROTTLE_REDIS_URL")
+
+
+def _parse_costs(value: str, burst: float) -> dict[str, float]:
+    """Стоимость больше ёмкости ведра никогда не наберётся, и обработчик стал бы недоступен."""
+    costs = {}
+    for name, cost in (item.split("=") for item in value.split(",") if "=" in item):
+        name, cost = name.strip(), float(cost)
+        if cost > burst:
+            logging.warning(f"THROTTLE_COSTS: стоимость {name}={cost} больше THROTTLE_BURST={burst}, снижена до {burst}")
+            cost = burst
+        costs[name] = cost
+    return costs
+
+
+# Переопределение стоимости по имени обработчика: "handle_order_feed=3,handle_chat_messages=1".
+THROTTLE_COSTS = _parse_costs(os.getenv("THROTTLE_COSTS", ""), THROTTLE_BURST)
+# Дольше этого запрос из серии не ждёт освобождения токенов, а просто отбрасывается.
+MAX_COALESCE_WAIT = 3.0
+
+
+class MemoryTokenBuckets:
+    """Ведро токенов на пользователя: в словаре хранится только пара (токены, время обновления)."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._buckets: dict[int, tuple[float, float]] = {}
+        self._idle_after = burst / rate
+        self._next_cleanup = time.monotonic() + self._idle_after
+
+    async def consume(self, key: int, cost: float) -> float:
+        """Списывает cost токенов. Возвращает 0, если хватило, иначе сколько секунд ждать."""
+        now = time.monotonic()
+        if now >= self._next_cleanup:
+            self._cleanup(now)
+        tokens, updated_at = self._buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+        if tokens >= cost:
+            self._buckets[key] = (tokens - cost, now)
+            return 0.0
+        self._buckets[key] = (tokens, now)
+        return (cost - tokens) / self.rate
+
+    def _cleanup(self, now: float):
+        # Ведро, не трогавшееся дольше времени полного восстановления, ничем не отличается от нового.
+        self._buckets = {
+            key: value for key, value in self._buckets.items() if now - value[1] < self._idle_after
+        }
+        self._next_cleanup = now + self._idle_after
+
+
+class RedisTokenBuckets:
+    """Общие для нескольких воркеров вёдра в Redis; списание атомарно за счёт Lua-скрипта."""
+
+    SCRIPT = """
+    local rate, burst, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local now = redis.call('TIME')
+    now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + (now - ts) * rate)
+    local wait = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+    else
+        wait = (cost - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return tostring(wait)
+    """
+
+    def __init__(self, url: str, rate: float, burst: float):
+        from redis.asyncio import Redis
+        self.rate = rate
+        self.burst = burst
+        self._redis = Redis.from_url(url)
+        self._script = self._redis.register_script(self.SCRIPT)
+
+    async def consume(self, key: int, cost: float) -> float:
+        return float(await self._script(keys=[f"throttle:{key}"], args=[self.rate, self.burst, cost]))
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Внутренний middleware: стоимость берётся из флага обработчика throttle_cost
+    (или THROTTLE_COSTS). Обработчики с флагом throttle_coalesce при нехватке токенов
+    не отбрасываются сразу, а ждут; если за это время пришёл более новый запрос того же
+    пользователя к тому же обработчику, выполняется только последний.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self._sequence = itertools.count()
+        self._latest: dict[tuple[int, str], int] = {}
+        # До какого момента пользователь уже предупреждён, что его сообщения не обрабатываются.
+        self._notified_until: dict[int, float] = {}
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        handler_object = data.get("handler")
+        if user is None or handler_object is None:
+            return await handler(event, data)
+
+        name = handler_object.callback.__name__
+        cost = min(THROTTLE_COSTS.get(name, get_flag(data, "throttle_cost", default=1)), self.buckets.burst)
+        wait = await self.buckets.consume(user.id, cost)
+        if not wait:
+            return await handler(event, data)
+
+        if get_flag(data, "throttle_coalesce") and wait <= MAX_COALESCE_WAIT:
+            key = (user.id, name)
+            sequence = next(self._sequence)
+            self._latest[key] = sequence
+            await asyncio.sleep(wait)
+            if self._latest.get(key) != sequence:
+                return await self._reject(event, silent=True)
+            del self._latest[key]
+            if not await self.buckets.consume(user.id, cost):
+                return await handler(event, data)
+        return await self._reject(event, wait=wait)
+
+    async def _reject(self, event, silent: bool = False, wait: float = 0.0):
+        if isinstance(event, types.CallbackQuery):
+            await event.answer(None if silent else "⏳ Слишком много запросов. Подождите немного.")
+        elif isinstance(event, types.Message) and not silent:
+            # Текст сообщения (например, в чате сделки) не сохраняется, поэтому пользователь должен знать,
+            # что его нужно отправить заново. Одно предупреждение на всё время ожидания, а не на каждое сообщение.
+            now = time.monotonic()
+            if self._notified_until.get(event.from_user.id, 0.0) > now:
+                return
+            self._notified_until = {key: until for key, until in self._notified_until.items() if until > now}
+            self._notified_until[event.from_user.id] = now + wait
+            await event.answer(f"⏳ Слишком много сообщений: последнее не обработано. "
+                               f"Отправьте его снова через {math.ceil(wait)} с.")
+
+
+def create_buckets():
+    if THROTTLE_REDIS_URL:
+        return RedisTokenBuckets(THROTTLE_REDIS_URL, THROTTLE_RATE, THROTTLE_BURST)
+    return MemoryTokenBuckets(THROTTLE_RATE, THROTTLE_BURST)
+
+
+def setup_throttling(dp):
+    middleware = ThrottlingMiddleware(create_buckets())
+    dp.message.middleware(middleware)
+    dp.callback_query.middleware(middleware)
@@ -0,0 +1,126 @@
+import os
+from contextlib import contextmanager
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from opentelemetry import trace
+from opentelemetry.trace import Status, StatusCode
+from sqlalchemy import event
+
+# none — трассировка выключена; otlp — экспорт в локальный коллектор; json — NDJSON-файл.
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none").lower()
+TRACING_SAMPLE_RATIO = float(os.getenv("TRACING_SAMPLE_RATIO", "0.01"))
+TRACING_JSON_PATH = os.getenv("TRACING_JSON_PATH", "traces.ndjson")
+MAX_STATEMENT_LENGTH = 1000
+
+# До вызова setup_tracing это прокси на no-op трассировщик, поэтому спаны почти ничего не стоят.
+tracer = trace.get_tracer("p2p_bot")
+
+
+def setup_tracing(service_name: str) -> bool:
+    if TRACING_EXPORTER == "none":
+        return False
+
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+    if TRACING_EXPORTER == "otlp":
+        # Адрес коллектора берётся из стандартной переменной OTEL_EXPORTER_OTLP_ENDPOINT.
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        exporter = OTLPSpanExporter()
+    elif TRACING_EXPORTER == "json":
+        exporter = ConsoleSpanExporter(
+            out=open(TRACING_JSON_PATH, "a", encoding="utf-8"),
+            formatter=lambda span: span.to_json(indent=None) + "\n"
+        )
+    else:
+        raise ValueError(f"Неизвестный TRACING_EXPORTER: {TRACING_EXPORTER}")
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": service_name}),
+        sampler=ParentBased(TraceIdRatioBased(TRACING_SAMPLE_RATIO))
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    return True
+
+
+def _parent_is_recording() -> bool:
+    # Дочерние спаны создаются только внутри сэмплированного запроса.
+    return trace.get_current_span().is_recording()
+
+
+@contextmanager
+def child_span(name: str, **attributes):
+    if not _parent_is_recording():
+        yield None
+        return
+    with tracer.start_as_current_span(name, attributes=attributes) as span:
+        yield span
+
+
+def instrument_engine(engine):
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not _parent_is_recording():
+            return
+        operation = statement.lstrip().split(" ", 1)[0].upper()
+        context._trace_span = tracer.start_span(f"db {operation}", attributes={
+            "db.system": "postgresql",
+            "db.operation": operation,
+            "db.statement": statement[:MAX_STATEMENT_LENGTH],
+        })
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        span = getattr(context, "_trace_span", None)
+        if span is not None:
+            span.set_attribute("db.rowcount", cursor.rowcount)
+            span.end()
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _handle_error(exception_context):
+        span = getattr(exception_context.execution_context, "_trace_span", None)
+        if span is not None:
+            span.record_exception(exception_context.original_exception)
+            span.set_status(Status(StatusCode.ERROR))
+            span.end()
+
+
+class UpdateTracingMiddleware(BaseMiddleware):
+    """Корневой спан на каждое обновление Telegram."""
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        attributes = {"telegram.update_id": event.update_id, "telegram.event_type": event.event_type}
+        if user:
+            attributes["telegram.user_id"] = user.id
+        with tracer.start_as_current_span(f"update {event.event_type}", attributes=attributes):
+            return await handler(event, data)
+
+
+class HandlerTracingMiddleware(BaseMiddleware):
+    async def __call__(self, handler, event, data):
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object else "unknown"
+        with child_span(f"handler {name}", **{"aiogram.handler": name}):
+            return await handler(event, data)
+
+
+class BotApiTracingMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot, method):
+        method_name = type(method).__name__
+        with child_span(f"telegram {method_name}", **{"telegram.method": method_name}):
+            return await make_request(bot, method)
+
+
+def setup_bot_tracing(dp, bot, engine):
+    instrument_engine(engine)
+    dp.update.outer_middleware(UpdateTracingMiddleware())
+    dp.message.middleware(HandlerTracingMiddleware())
+    dp.callback_query.middleware(HandlerTracingMiddleware())
+    bot.session.middleware(BotApiTracingMiddleware())
@@ -0,0 +1,132 @@
+import os
+from datetime import datetime, timedelta, UTC
+
+from sqlalchemy import select, update, func, or_
+
+from db_models import User, Order, Offer
+from idempotency import ExpiringMap
+from order_states import on_enter, IN_PROGRESS, COMPLETED, EXPIRED
+
+# Лимиты без VIP считаются по активным заказам и откликам, а не по всей истории.
+FREE_ORDERS_LIMIT = 10
+FREE_OFFERS_LIMIT = 3
+
+ENTITLEMENT_TTL = float(os.getenv("VIP_ENTITLEMENT_TTL", "300"))
+REMINDER_BEFORE = timedelta(days=int(os.getenv("VIP_REMINDER_DAYS", "3")))
+REMINDER_BATCH_SIZE = int(os.getenv("VIP_REMINDER_BATCH_SIZE", "500"))
+
+
+class EntitlementCache:
+    """
+    Дата окончания VIP по пользователю. Бот обновляет запись сам при покупке и выдаче,
+    поэтому TTL нужен только чтобы подхватывать изменения из других процессов.
+    """
+
+    def __init__(self, ttl: float = ENTITLEMENT_TTL):
+        self._expires_at = ExpiringMap(ttl)
+
+    async def is_active(self, session, user_id: int) -> bool:
+        entry = self._expires_at.get(user_id)
+        if entry is None:
+            expires_at = await session.scalar(select(User.vip_expires_at).where(User.telegram_id == user_id))
+            entry = (expires_at,)
+            self._expires_at.set(user_id, entry)
+        return entry[0] is not None and entry[0] > datetime.now(UTC)
+
+    def update(self, user_id: int, expires_at: datetime | None):
+        self._expires_at.set(user_id, (expires_at,))
+
+
+entitlements = EntitlementCache()
+
+
+async def _reserve(session, user_id: int, counter, limit: int, is_vip: bool) -> bool:
+    stmt = update(User).where(User.telegram_id == user_id).values({counter: counter + 1})
+    if not is_vip:
+        stmt = stmt.where(counter < limit)
+    return await session.scalar(stmt.returning(User.id)) is not None
+
+
+async def has_order_slot(session, user_id: int) -> bool:
+    if await entitlements.is_active(session, user_id):
+        return True
+    count = await session.scalar(select(User.active_orders_count).where(User.telegram_id == user_id))
+    return (count or 0) < FREE_ORDERS_LIMIT
+
+
+async def has_offer_slot(session, user_id: int) -> bool:
+    if await entitlements.is_active(session, user_id):
+        return True
+    count = await session.scalar(select(User.active_offers_count).where(User.telegram_id == user_id))
+    return (count or 0) < FREE_OFFERS_LIMIT
+
+
+async def reserve_order_slot(session, user_id: int) -> bool:
+    """Атомарно увеличивает счётчик активных заказов, если лимит ещё не исчерпан."""
+    is_vip = await entitlements.is_active(session, user_id)
+    return await _reserve(session, user_id, User.active_orders_count, FREE_ORDERS_LIMIT, is_vip)
+
+
+async def reserve_offer_slot(session, user_id: int) -> bool:
+    is_vip = await entitlements.is_active(session, user_id)
+    return await _reserve(session, user_id, User.active_offers_count, FREE_OFFERS_LIMIT, is_vip)
+
+
+@on_enter(COMPLETED)
+@on_enter(EXPIRED)
+async def _release_order_slots(session, order_ids: list[int]):
+    released = (
+        select(Order.customer_id, func.count().label("amount"))
+        .where(Order.id.in_(order_ids))
+        .group_by(Order.customer_id)
+        .subquery()
+    )
+    await session.execute(
+        update(User)
+        .where(User.telegram_id == released.c.customer_id)
+        .values(active_orders_count=func.greatest(User.active_orders_count - released.c.amount, 0))
+    )
+
+
+@on_enter(IN_PROGRESS)
+@on_enter(EXPIRED)
+async def _release_offer_slots(session, order_ids: list[int]):
+    # Отклики активны, пока заказ открыт: выбор исполнителя или истечение срока освобождает их все.
+    released = (
+        select(Offer.executor_id, func.count().label("amount"))
+        .where(Offer.order_id.in_(order_ids))
+        .group_by(Offer.executor_id)
+        .subquery()
+    )
+    await session.execute(
+        update(User)
+        .where(User.telegram_id == released.c.executor_id)
+        .values(active_offers_count=func.greatest(User.active_offers_count - released.c.amount, 0))
+    )
+
+
+async def claim_expiry_reminders(session, now: datetime | None = None):
+    """
+    Отмечает пачку пользователей, чей VIP скоро истекает, и возвращает их.
+    vip_reminded_for запоминает дату, о которой уже напомнили, так что после продления
+    напоминание придёт снова.
+    """
+    now = now or datetime.now(UTC)
+    due = (
+        select(User.id)
+        .where(
+            User.vip_expires_at > now,
+            User.vip_expires_at <= now + REMINDER_BEFORE,
+            or_(User.vip_reminded_for.is_(None), User.vip_reminded_for != User.vip_expires_at),
+        )
+        .order_by(User.id)
+        .limit(REMINDER_BATCH_SIZE)
+        .with_for_update(skip_locked=True)
+    )
+    result = await session.execute(
+        update(User)
+        .where(User.id.in_(due))
+        .values(vip_reminded_for=User.vip_expires_at)
+        .returning(User.telegram_id, User.vip_expires_at)
+    )
+    return result.all()